@@ -1,18 +1,61 @@
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory
-from app.config import load_google_llm, key_manager
-from app.model.schemas import LLMStructuredOutput
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, message_to_dict, messages_from_dict
+from app.config import load_google_llm, key_manager, settings
+from app.lazy import Lazy
+from app.model.schemas import LLMStructuredOutput, VoiceStructuredOutput
+from app.services.cancellation import checkpoint
+from app.services.metrics import external_call
+from app.services.shared_state import shared_state, state_key
+from app.services.usage_tracker import usage_operation
+from typing import List, Sequence
+import asyncio
+import base64
+import json
+
+
+class SharedChatMessageHistory(BaseChatMessageHistory):
+    """
+    Chat history kept in the shared state, so a follow-up can be answered
+    by any worker. Sessions expire CHAT_HISTORY_TTL seconds after their
+    last message and keep the last CHAT_HISTORY_MAX_MESSAGES messages.
+    """
+
+    def __init__(self, session_id: str):
+        self.key = state_key("chat_history", session_id)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return messages_from_dict([json.loads(item) for item in shared_state.items(self.key)])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        shared_state.append(
+            self.key,
+            [json.dumps(message_to_dict(message)) for message in messages],
+            ttl=settings.chat_history_ttl,
+            max_len=settings.chat_history_max_messages,
+        )
+
+    def clear(self) -> None:
+        shared_state.delete(self.key)
 
-# Global store for chat histories
-store = {}
 
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-    return store[session_id]
+    return SharedChatMessageHistory(session_id)
+
+SYSTEM_PROMPT = """You are Toolify Assistant, a helpful assistant who is an expert on a wide variety of tools.
+Your task is to identify the language of the user's question and respond in that same language.
+You must support the following languages: English (en), French (fr), and Nigerian Pidgin (pdg).
+
+{format_instructions}"""
+
+VOICE_INSTRUCTION = (
+    "The user's question is in the attached audio. First transcribe it exactly as spoken, "
+    "without translating, into the transcript field. Then answer it."
+)
+
 
 class ChatChain:
     """A stateful chain for conversing about tools in multiple languages."""
@@ -20,14 +63,17 @@ class ChatChain:
     def __init__(self):
         self.parser = PydanticOutputParser(pydantic_object=LLMStructuredOutput)
         self.prompt_template = ChatPromptTemplate.from_messages([
-            ("system", """You are Toolify Assistant, a helpful assistant who is an expert on a wide variety of tools.
-Your task is to identify the language of the user's question and respond in that same language.
-You must support the following languages: English (en), French (fr), and Nigerian Pidgin (pdg).
-
-{format_instructions}"""),
+            ("system", SYSTEM_PROMPT),
             MessagesPlaceholder(variable_name="history"),
             ("human", "{question}"),
         ]).partial(format_instructions=self.parser.get_format_instructions())
+
+        # Voice turns send the audio itself and get the transcript back with the answer
+        self.voice_parser = PydanticOutputParser(pydantic_object=VoiceStructuredOutput)
+        self.voice_prompt_template = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
+            MessagesPlaceholder(variable_name="history"),
+        ]).partial(format_instructions=self.voice_parser.get_format_instructions())
         
         self._build_chain()
         
@@ -57,11 +103,13 @@ You must support the following languages: English (en), French (fr), and Nigeria
         max_attempts = len(key_manager.api_keys) * 2
         
         for attempt in range(max_attempts):
+            checkpoint("gemini", "chat")
             try:
-                llm_response = await self.chain.ainvoke(
-                    {"question": message},
-                    config={"configurable": {"session_id": session_id}}
-                )
+                with external_call("gemini", "chat"), usage_operation("chat"):
+                    llm_response = await self.chain.ainvoke(
+                        {"question": message},
+                        config={"configurable": {"session_id": session_id}}
+                    )
                 return llm_response
             
             except Exception as e:
@@ -70,7 +118,8 @@ You must support the following languages: English (en), French (fr), and Nigeria
                 if "429" in error_str or "resource_exhausted" in error_str:
                     print(f"Chat hit 429/Exhausted. Rotating key and retrying... (Attempt {attempt+1}/{max_attempts})")
                     try:
-                        key_manager.rotate_key()
+                        # Publishing the cooldown is a shared state write
+                        await asyncio.to_thread(key_manager.rotate_key)
                         load_google_llm.cache_clear()
                         self._build_chain()
                     except Exception as rotate_error:
@@ -82,4 +131,67 @@ You must support the following languages: English (en), French (fr), and Nigeria
         
         raise RuntimeError("Max retries exceeded for chat rate limits.")
 
-_chat_chain = ChatChain()
+    async def invoke_voice_chat(
+        self,
+        audio_bytes: bytes,
+        mime_type: str,
+        session_id: str,
+        message: str = None
+    ) -> VoiceStructuredOutput:
+        """
+        Answers a voice message in a single model call.
+        The audio is sent together with the session history, and the model
+        returns the transcript alongside the answer. The transcript (not the
+        audio) is what gets stored in the history.
+        """
+        history = get_session_history(session_id)
+        instruction = VOICE_INSTRUCTION
+        if message:
+            instruction += f"\nThe user also typed: '{message}'"
+
+        messages = self.voice_prompt_template.format_messages(history=await history.aget_messages())
+        messages.append(HumanMessage(content=[
+            {"type": "text", "text": instruction},
+            {"type": "media", "mime_type": mime_type, "data": base64.b64encode(audio_bytes).decode("utf-8")},
+        ]))
+
+        max_attempts = len(key_manager.api_keys) * 2
+
+        for attempt in range(max_attempts):
+            checkpoint("gemini", "voice_chat")
+            try:
+                with external_call("gemini", "voice_chat"), usage_operation("voice_chat"):
+                    llm_response = await self.llm.ainvoke(messages)
+                result = self.voice_parser.invoke(llm_response)
+                break
+
+            except Exception as e:
+                error_str = str(e).lower()
+                if "429" in error_str or "resource_exhausted" in error_str:
+                    print(f"Voice chat hit 429/Exhausted. Rotating key and retrying... (Attempt {attempt+1}/{max_attempts})")
+                    try:
+                        # Publishing the cooldown is a shared state write
+                        await asyncio.to_thread(key_manager.rotate_key)
+                        load_google_llm.cache_clear()
+                        self._build_chain()
+                    except Exception as rotate_error:
+                         print(f"Failed to rotate key: {rotate_error}")
+                         raise e
+                    continue
+                else:
+                    raise e
+        else:
+            raise RuntimeError("Max retries exceeded for chat rate limits.")
+
+        # Keep the history in the same shape as text turns
+        question = f"{message}\n[Voice Input]: {result.transcript}" if message else result.transcript
+        await history.aadd_messages([
+            HumanMessage(content=question),
+            AIMessage(content=LLMStructuredOutput(
+                language=result.language,
+                response=result.response
+            ).model_dump_json()),
+        ])
+        return result
+
+_chat_chain: ChatChain = Lazy("chat_chain", ChatChain)
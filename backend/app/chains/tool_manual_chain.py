@@ -1,6 +1,19 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from app.config import load_google_llm
+from typing import Optional
+from app.config import load_google_llm, settings
+from app.lazy import Lazy
+from app.services.cancellation import checkpoint
+from app.services.deadline import Deadline
+from app.services.metrics import external_call
+from app.services.usage_tracker import usage_operation
+
+FULL_LENGTH = "Be thorough but concise. Aim for a manual that is both informative and easy to follow."
+# Used when the request's deadline leaves too little time for a full manual
+SHORT_LENGTH = (
+    "Time is short: keep it brief. Give each section two or three bullet points, "
+    "but never leave out the safety precautions."
+)
 
 
 class ToolManualChain:
@@ -9,13 +22,23 @@ class ToolManualChain:
     def __init__(self):
         self.llm = load_google_llm()
         self.output_parser = StrOutputParser()
+
+    def _llm_within(self, deadline: Optional[Deadline], **options):
+        """The LLM, with its call limited to what is left of deadline."""
+        if deadline is None and not options:
+            return self.llm
+        if deadline is not None:
+            # A retry after a timeout would overrun the deadline
+            options.update(timeout=deadline.timeout(), max_retries=0)
+        return self.llm.bind(**options)
     
     def generate_manual(
         self,
         tool_name: str,
         research_context: str,
         tool_description: str = None,
-        language: str = "en"
+        language: str = "en",
+        deadline: Optional[Deadline] = None
     ) -> str:
         """
         Generate a comprehensive tool manual from research data
@@ -25,9 +48,11 @@ class ToolManualChain:
             research_context: Research data from Tavily
             tool_description: Optional description from Google Vision
             language: Output language
+            deadline: When the manual has to be ready by; a shorter manual is
+                written when there isn't time for a full one
             
         Returns:
-            Comprehensive tool manual as string
+            Comprehensive tool manual as string ("" if the deadline passed)
         """
         
         prompt_template = ChatPromptTemplate.from_messages([
@@ -89,7 +114,7 @@ Please create a detailed, well-structured manual that includes:
 
 Format the manual with clear headings, bullet points, and numbered lists where appropriate.
 Write in {language} language.
-Be thorough but concise. Aim for a manual that is both informative and easy to follow.""")
+{length_instruction}""")
         ])
         
         # Build tool description section if available
@@ -97,16 +122,32 @@ Be thorough but concise. Aim for a manual that is both informative and easy to f
         if tool_description:
             tool_description_section = f"Tool Description (from image recognition):\n{tool_description}\n"
         
+        length_instruction = FULL_LENGTH
+        options = {}
+        if deadline and not deadline.allows(settings.deadline_manual_seconds):
+            deadline.degrade("manual_shortened")
+            length_instruction = SHORT_LENGTH
+            options["max_output_tokens"] = settings.short_manual_tokens
+
         # Create the chain
-        chain = prompt_template | self.llm | self.output_parser
+        chain = prompt_template | self._llm_within(deadline, **options) | self.output_parser
         
         # Generate the manual
-        manual = chain.invoke({
-            "tool_name": tool_name,
-            "tool_description_section": tool_description_section,
-            "research_context": research_context,
-            "language": language
-        })
+        checkpoint("gemini", "manual")
+        try:
+            with external_call("gemini", "manual"), usage_operation("manual"):
+                manual = chain.invoke({
+                    "tool_name": tool_name,
+                    "tool_description_section": tool_description_section,
+                    "research_context": research_context,
+                    "language": language,
+                    "length_instruction": length_instruction
+                })
+        except Exception:
+            if deadline is None or not deadline.expired:
+                raise
+            deadline.degrade("manual")
+            return ""
         
         return manual
     
@@ -114,7 +155,8 @@ Be thorough but concise. Aim for a manual that is both informative and easy to f
         self,
         tool_name: str,
         research_context: str,
-        language: str = "en"
+        language: str = "en",
+        deadline: Optional[Deadline] = None
     ) -> str:
         """
         Generate a quick summary of the tool (2-3 sentences)
@@ -123,10 +165,15 @@ Be thorough but concise. Aim for a manual that is both informative and easy to f
             tool_name: Name of the tool
             research_context: Research data from Tavily
             language: Output language
+            deadline: When the summary has to be ready by; it is skipped
+                when there isn't time for it
             
         Returns:
-            Brief summary as string
+            Brief summary as string ("" if skipped for the deadline)
         """
+        if deadline and not deadline.allows(settings.deadline_summary_seconds):
+            deadline.degrade("summary")
+            return ""
         
         prompt_template = ChatPromptTemplate.from_messages([
             ("system", "You are a technical expert providing concise tool descriptions."),
@@ -141,16 +188,24 @@ Provide a brief 2-3 sentence summary that explains:
 Write in {language} language. Be concise and informative.""")
         ])
         
-        chain = prompt_template | self.llm | self.output_parser
+        chain = prompt_template | self._llm_within(deadline) | self.output_parser
         
-        summary = chain.invoke({
-            "tool_name": tool_name,
-            "research_context": research_context,
-            "language": language
-        })
+        checkpoint("gemini", "summary")
+        try:
+            with external_call("gemini", "summary"), usage_operation("summary"):
+                summary = chain.invoke({
+                    "tool_name": tool_name,
+                    "research_context": research_context,
+                    "language": language
+                })
+        except Exception:
+            if deadline is None or not deadline.expired:
+                raise
+            deadline.degrade("summary")
+            return ""
         
         return summary
 
 
-# Create singleton instance
-tool_manual_chain = ToolManualChain()
\ No newline at end of file
+# Singleton instance, created on first use
+tool_manual_chain: ToolManualChain = Lazy("tool_manual_chain", ToolManualChain)
\ No newline at end of file
@@ -3,18 +3,24 @@ Configuration management for Toolify
 Loads environment variables and LangChain models.
 Implements Gemini API key rotation logic.
 
+The SDK clients are built on first use (see app.lazy), so importing this
+module loads neither google-genai nor LangChain and doesn't need the
+Supabase credentials.
 """
 
+import hashlib
 import os
 from functools import lru_cache
 from dotenv import load_dotenv
 import time
 import logging
-from typing import List, Optional
-from google import genai
-from google.genai import types
-from langchain_google_genai import ChatGoogleGenerativeAI
-from supabase import create_client, Client
+from typing import TYPE_CHECKING, List, Optional
+import httpx
+from app.lazy import Lazy
+
+if TYPE_CHECKING:
+    from google.genai import types
+    from supabase import Client
 
 # Load variables from .env file into environment
 load_dotenv()
@@ -33,6 +39,10 @@ class Settings:
     supabase_anon_key: str = os.environ.get("SUPABASE_ANON_KEY")
     yarngpt_api_key: str = os.getenv("YARNGPT_API_KEY")
 
+    # Upstream endpoints, overridable to point at local stand-ins (see benchmarks/standins.py).
+    # Gemini calls honour the SDK's own GOOGLE_GEMINI_BASE_URL.
+    tavily_api_url: Optional[str] = os.getenv("TAVILY_API_URL")
+    yarngpt_api_url: str = os.getenv("YARNGPT_API_URL", "https://yarngpt.ai/api/v1/tts")
 
     # Server settings
     host: str = os.getenv("HOST", "0.0.0.0")
@@ -44,9 +54,97 @@ class Settings:
     temperature: float = float(os.getenv("TEMPERATURE", 0.7))
     max_tokens: int = int(os.getenv("MAX_TOKENS", 2048))
 
+    # Gemini usage accounting (USD per million tokens) and per-user daily budgets
+    gemini_input_cost_per_mtok: float = float(os.getenv("GEMINI_INPUT_COST_PER_MTOK", 0.30))
+    gemini_output_cost_per_mtok: float = float(os.getenv("GEMINI_OUTPUT_COST_PER_MTOK", 2.50))
+    user_daily_token_budget: int = int(os.getenv("USER_DAILY_TOKEN_BUDGET", 0))  # 0 disables budgets
+    user_token_budgets: Optional[str] = os.getenv("USER_TOKEN_BUDGETS")  # Overrides, e.g. "user_a:500000,user_b:0"
+
+    # Clerk authentication settings
+    clerk_jwks_url: str = os.getenv("CLERK_JWKS_URL", "https://warm-man-46.clerk.accounts.dev/.well-known/jwks.json")
+    jwks_cache_ttl: float = float(os.getenv("JWKS_CACHE_TTL", 3600))
+    jwks_min_refresh_interval: float = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", 30))
+    auth_claims_cache_enabled: bool = os.getenv("AUTH_CLAIMS_CACHE_ENABLED", "true").lower() == "true"
+    auth_claims_cache_size: int = int(os.getenv("AUTH_CLAIMS_CACHE_SIZE", 4096))
+    auth_claims_cache_margin: float = float(os.getenv("AUTH_CLAIMS_CACHE_MARGIN", 5))
+
+    # Supabase client settings
+    supabase_http_timeout: float = float(os.getenv("SUPABASE_HTTP_TIMEOUT", 30))
+    supabase_http_max_connections: int = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", 50))
+    user_client_cache_size: int = int(os.getenv("USER_CLIENT_CACHE_SIZE", 1024))
+
+    # Write-behind persistence settings
+    persistence_flush_interval: float = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", 0.25))
+    persistence_batch_size: int = int(os.getenv("PERSISTENCE_BATCH_SIZE", 100))
+    persistence_max_retries: int = int(os.getenv("PERSISTENCE_MAX_RETRIES", 3))
+    persistence_spool_path: str = os.getenv("PERSISTENCE_SPOOL_PATH", "spool/persistence.jsonl")
+    persistence_spool_retry_interval: float = float(os.getenv("PERSISTENCE_SPOOL_RETRY_INTERVAL", 5))
+
+    # Scan image upload settings
+    storage_upload_workers: int = int(os.getenv("STORAGE_UPLOAD_WORKERS", 4))
+    storage_upload_retries: int = int(os.getenv("STORAGE_UPLOAD_RETRIES", 3))
+
+    # Monitoring settings
+    loop_monitor_enabled: bool = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+    loop_monitor_interval: float = float(os.getenv("LOOP_MONITOR_INTERVAL", 0.1))
+    loop_block_threshold: float = float(os.getenv("LOOP_BLOCK_THRESHOLD", 0.1))
+    monitoring_token: Optional[str] = os.getenv("MONITORING_TOKEN")  # Required by monitoring endpoints
+    monitoring_public: bool = os.getenv("MONITORING_PUBLIC", "false").lower() == "true"  # Open them without a token (local use)
+    metrics_enabled: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+    # State shared by worker processes: memory (single worker), sqlite (one host) or redis
+    shared_state_backend: str = os.getenv("SHARED_STATE_BACKEND", "memory").lower()
+    shared_state_path: str = os.getenv("SHARED_STATE_PATH", "state/shared.sqlite3")
+    shared_state_url: str = os.getenv("SHARED_STATE_URL", "redis://localhost:6379/0")
+    chat_history_ttl: float = float(os.getenv("CHAT_HISTORY_TTL", 86400))
+    chat_history_max_messages: int = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", 200))
+
+    # Production server (python -m app.server)
+    server_workers: int = int(os.getenv("WEB_CONCURRENCY", 0))  # 0 derives it from CPUs, memory and workload
+    server_workload: str = os.getenv("SERVER_WORKLOAD", "mixed").lower()  # io, mixed or cpu
+    server_worker_memory_mb: int = int(os.getenv("SERVER_WORKER_MEMORY_MB", 300))
+    server_preload: bool = os.getenv("SERVER_PRELOAD", "true").lower() == "true"
+    server_keepalive: int = int(os.getenv("SERVER_KEEPALIVE", 75))
+    server_backlog: int = int(os.getenv("SERVER_BACKLOG", 2048))
+    server_drain_timeout: float = float(os.getenv("SERVER_DRAIN_TIMEOUT", 25))
+    server_limit_concurrency: int = int(os.getenv("SERVER_LIMIT_CONCURRENCY", 0))  # 0 is unlimited
+    server_access_log: bool = os.getenv("SERVER_ACCESS_LOG", "true").lower() == "true"
+    sync_threadpool_size: int = int(os.getenv("SYNC_THREADPOOL_SIZE", 32))
+
+    # Startup settings: build clients and open connections in the background once serving
+    warmup_on_start: bool = os.getenv("WARMUP_ON_START", "true").lower() == "true"
+    warmup_timeout: float = float(os.getenv("WARMUP_TIMEOUT", 20))
+
+    # Manual generation deadline (under the proxy's timeout). Stages that are short of time
+    # degrade: YouTube lookups are skipped below DEADLINE_LOOKUP_SECONDS, the manual is
+    # shortened below DEADLINE_MANUAL_SECONDS, summary and audio are dropped below theirs.
+    manual_deadline: float = float(os.getenv("MANUAL_DEADLINE_SECONDS", 25))
+    deadline_lookup_seconds: float = float(os.getenv("DEADLINE_LOOKUP_SECONDS", 2))
+    deadline_manual_seconds: float = float(os.getenv("DEADLINE_MANUAL_SECONDS", 12))
+    deadline_summary_seconds: float = float(os.getenv("DEADLINE_SUMMARY_SECONDS", 4))
+    deadline_tts_seconds: float = float(os.getenv("DEADLINE_TTS_SECONDS", 6))
+    short_manual_tokens: int = int(os.getenv("SHORT_MANUAL_TOKENS", 1024))
+
     # File upload settings
     max_file_size: int = int(os.getenv("MAX_FILE_SIZE", 10 * 1024 * 1024))  # 10MB
 
+    # TTS settings
+    yarngpt_voice: str = os.getenv("YARNGPT_VOICE", "Idera")
+    tts_cache_enabled: bool = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+    tts_cache_max_entries: int = int(os.getenv("TTS_CACHE_MAX_ENTRIES", 2048))
+    tts_chunk_chars: int = int(os.getenv("TTS_CHUNK_CHARS", 400))
+    tts_max_concurrency: int = int(os.getenv("TTS_MAX_CONCURRENCY", 4))
+    tts_connect_timeout: float = float(os.getenv("TTS_CONNECT_TIMEOUT", 10))
+    tts_read_timeout: float = float(os.getenv("TTS_READ_TIMEOUT", 60))  # Longest wait for the next bytes
+
+    # Transcription settings
+    audio_normalization_enabled: bool = os.getenv("AUDIO_NORMALIZATION_ENABLED", "true").lower() == "true"
+    audio_worker_threads: int = int(os.getenv("AUDIO_WORKER_THREADS", 2))
+    ffmpeg_path: Optional[str] = os.getenv("FFMPEG_PATH")
+    transcription_cache_max_entries: int = int(os.getenv("TRANSCRIPTION_CACHE_MAX_ENTRIES", 512))
+    transcription_cache_ttl: int = int(os.getenv("TRANSCRIPTION_CACHE_TTL", 3600))
+    voice_native_chat: bool = os.getenv("VOICE_NATIVE_CHAT", "true").lower() == "true"
+
     @property
     def cors_origins_list(self):
         """Convert comma-separated CORS origins to list"""
@@ -69,7 +167,11 @@ settings = Settings()
 logger = logging.getLogger("gemini-rotator")
 
 class GeminiKeyManager:
-    """Singleton to manage Gemini API keys and rotation."""
+    """
+    Singleton to manage Gemini API keys and rotation.
+    Cooldowns are also published to the shared state, so a key that hit a
+    rate limit in one worker is skipped by the others too.
+    """
     _instance = None
 
     def __new__(cls, api_keys: List[str]):
@@ -79,6 +181,9 @@ class GeminiKeyManager:
             cls._instance.current_index = 0
             cls._instance.disabled_until = {} # index -> timestamp
             cls._instance.cooldown_seconds = 60
+            # Seconds the shared cooldown of a key is trusted before it's looked up again
+            cls._instance.cooldown_check_seconds = 2
+            cls._instance.cooldown_checked = {} # index -> timestamp
         return cls._instance
 
     @classmethod
@@ -108,22 +213,47 @@ class GeminiKeyManager:
         return self.api_keys[self.current_index]
 
     def _is_key_disabled(self, index: int) -> bool:
+        now = time.time()
         if index in self.disabled_until:
-             if time.time() > self.disabled_until[index]:
-                 del self.disabled_until[index]
-                 return False
+             if now <= self.disabled_until[index]:
+                 return True
+             del self.disabled_until[index]
+
+        # Another worker may have seen this key rate-limited. This runs on
+        # the event loop for every model built, so the shared state is only
+        # asked again once the last answer is cooldown_check_seconds old.
+        if now < self.cooldown_checked.get(index, 0) + self.cooldown_check_seconds:
+             return False
+        self.cooldown_checked[index] = now
+
+        from app.services.shared_state import shared_state
+
+        until = shared_state.get(_cooldown_key(self.api_keys[index]))
+        if until is not None and float(until) > time.time():
+             self.disabled_until[index] = float(until)
              return True
         return False
 
     def rotate_key(self):
         """Marks current key as disabled and rotates to next."""
+        from app.services.shared_state import shared_state
+
         logger.warning(f"Rate limit hit on key index {self.current_index}. Rotating...")
-        self.disabled_until[self.current_index] = time.time() + self.cooldown_seconds
+        until = time.time() + self.cooldown_seconds
+        self.disabled_until[self.current_index] = until
+        shared_state.set(_cooldown_key(self.api_keys[self.current_index]), repr(until), ttl=self.cooldown_seconds)
         
         # Advance index
         self.current_index = (self.current_index + 1) % len(self.api_keys)
 
-key_manager = GeminiKeyManager(settings.api_keys_list)
+def _cooldown_key(api_key: str) -> str:
+    """Shared-state key of an API key's cooldown; workers may list their keys in any order."""
+    from app.services.shared_state import state_key
+
+    return state_key("gemini", "cooldown", hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16])
+
+
+key_manager: GeminiKeyManager = Lazy("key_manager", GeminiKeyManager.get_instance)
 
 
 class RotatableClient:
@@ -136,6 +266,8 @@ class RotatableClient:
         # or we can. For SDK usage, instantiating Client is cheap.
     
     def _get_client(self):
+        from google import genai
+
         api_key = self.manager.get_current_key()
         return genai.Client(api_key=api_key)
 
@@ -154,17 +286,26 @@ class _RotatableModels:
     def __init__(self, parent: RotatableClient):
         self.parent = parent
         
-    def generate_content(self, model: str, contents, config: Optional[types.GenerateContentConfig] = None):
+    def generate_content(self, model: str, contents, config: Optional["types.GenerateContentConfig"] = None):
+        from app.services.cancellation import checkpoint
+        from app.services.metrics import external_call
+        from app.services.usage_tracker import current_operation, key_label, usage_tracker
+
         max_attempts = len(self.parent.manager.api_keys) * 2
         
         for _ in range(max_attempts):
+            checkpoint("gemini", current_operation())
             client = self.parent._get_client()
+            key = key_label(self.parent.manager.current_index)
             try:
-                return client.models.generate_content(
-                    model=model,
-                    contents=contents,
-                    config=config
-                )
+                with external_call("gemini", current_operation()):
+                    response = client.models.generate_content(
+                        model=model,
+                        contents=contents,
+                        config=config
+                    )
+                usage_tracker.record_genai_response(response, key)
+                return response
             except Exception as e:
                 error_str = str(e).lower()
                 if "429" in error_str or "resource_exhausted" in error_str:
@@ -174,8 +315,8 @@ class _RotatableModels:
                 raise e
         raise RuntimeError("Max retries exceeded for rate limits.")
 
-# Initialize global rotatable client
-gemini_client = RotatableClient()
+# Global rotatable client, created on first use
+gemini_client: RotatableClient = Lazy("gemini_client", RotatableClient)
 
 
 @lru_cache()
@@ -184,11 +325,17 @@ def load_google_llm():
     Load Google Gemini LLM with LangChain
     Cached to avoid recreating on every request
     """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from app.services.usage_callback import UsageCallback
+    from app.services.usage_tracker import key_label, usage_tracker
+
+    api_key = key_manager.get_current_key()
     return ChatGoogleGenerativeAI(
         model=settings.gemini_model,
-        google_api_key=key_manager.get_current_key(),
+        google_api_key=api_key,
         temperature=settings.temperature,
         max_output_tokens=settings.max_tokens,
+        callbacks=[UsageCallback(usage_tracker, key_label(key_manager.current_index))],
     )
 
 
@@ -198,14 +345,49 @@ def load_google_vision_llm():
     """
     Load Google Gemini with vision capabilities
     """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from app.services.usage_callback import UsageCallback
+    from app.services.usage_tracker import key_label, usage_tracker
+
+    api_key = key_manager.get_current_key()
     return ChatGoogleGenerativeAI(
         model=settings.gemini_model,
-        google_api_key=key_manager.get_current_key(),
+        google_api_key=api_key,
         temperature=0.5,
         max_output_tokens=settings.max_tokens,
+        callbacks=[UsageCallback(usage_tracker, key_label(key_manager.current_index))],
+    )
+
+
+@lru_cache()
+def get_supabase_http_client() -> httpx.Client:
+    """
+    Pooled HTTP transport shared by every Supabase client (admin and
+    user-scoped), so requests reuse keep-alive connections instead of
+    paying for a new TLS handshake per client.
+    Supabase sub-clients pass their own headers on every request.
+    """
+    return httpx.Client(
+        http2=False,
+        follow_redirects=True,
+        timeout=httpx.Timeout(settings.supabase_http_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.supabase_http_max_connections,
+            max_keepalive_connections=settings.supabase_http_max_connections,
+        ),
+    )
+
+
+def create_supabase_admin_client() -> "Client":
+    """Supabase Admin Client (Bypasses RLS)"""
+    from supabase import ClientOptions, create_client
+
+    return create_client(
+        settings.supabase_url,
+        settings.supabase_service_key,
+        options=ClientOptions(httpx_client=get_supabase_http_client())
     )
 
 
-# Supabase Client Initialization
-# Supabase Admin Client (Bypasses RLS)
-supabase: Client = create_client(settings.supabase_url, settings.supabase_service_key)
\ No newline at end of file
+# Created on first use, so a missing SUPABASE_URL fails that request, not the import
+supabase: "Client" = Lazy("supabase", create_supabase_admin_client)
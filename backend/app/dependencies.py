@@ -1,12 +1,16 @@
-from fastapi import HTTPException, UploadFile, File, Depends, status
+from fastapi import HTTPException, UploadFile, File, Depends, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional
-from app.config import supabase
-from supabase import Client
+from app.config import supabase, settings, get_supabase_http_client
+from app.services.cache import TTLCache
+from app.services.jwks_manager import jwks_manager
+from app.services.usage_tracker import seconds_until_reset, usage_tracker
+from supabase import Client, ClientOptions, create_client
+import hashlib
+import hmac
+import time
 import jwt
-from jwt.algorithms import RSAAlgorithm
-import json
-import urllib.request
 
 def image_file_validator(file: UploadFile = File(...)):
     """
@@ -29,66 +33,74 @@ def optional_image_file_validator(file: Optional[UploadFile] = File(None)):
 # CRITICAL: HTTPBearer is used to extract the Bearer token from the Authorization header
 security = HTTPBearer()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# User-scoped Supabase clients keyed by token digest; each expires with its token
+_user_clients = TTLCache(max_entries=settings.user_client_cache_size)
+
+# Verified claims keyed by token digest: (claims, kid), expiring with the token
+_verified_claims = TTLCache(max_entries=settings.auth_claims_cache_size)
+
+class User:
+    """Authenticated user, mimicking the shape of Supabase's user object."""
+    def __init__(self, id, email):
+        self.id = id
+        self.email = email
+
+
+async def verify_token(token: str) -> User:
+    """
+    Verifies a Clerk session token and returns the user it belongs to.
+    Raises on invalid tokens; routes should use get_current_user instead.
+
+    Clients send the same token on every request until it expires, so
+    verified claims are cached by token digest until exp. A cached entry
+    is only trusted while its signing key is still in the JWKS, so a key
+    rotated out by Clerk forces full verification again.
+    """
+    cache_key = None
+    if settings.auth_claims_cache_enabled:
+        cache_key = hashlib.sha256(token.encode("utf-8")).digest()
+        cached = _verified_claims.get(cache_key)
+        if cached is not None:
+            claims, cached_kid = cached
+            if jwks_manager.has_key(cached_kid):
+                return User(id=claims.get("sub"), email=claims.get("email", "unknown"))
+            _verified_claims.pop(cache_key)
+
+    # 1. Decode header to get Key ID (kid)
+    unverified_header = jwt.get_unverified_header(token)
+    kid = unverified_header.get('kid')
+
+    # 2-3. Find the matching parsed key (fetched and refreshed asynchronously)
+    public_key = await jwks_manager.get_key(kid)
+
+    # 4. Verify the token
+    payload = jwt.decode(
+        token,
+        public_key,
+        algorithms=["RS256"],
+        options={"verify_aud": False}, # Clerk tokens might not have audience set for backend
+        leeway=60 # Add 60 seconds leeway for clock skew
+    )
+
+    if cache_key is not None and payload.get("exp"):
+        # Never trust a cached entry past the token's own expiry
+        ttl = payload["exp"] - time.time() - settings.auth_claims_cache_margin
+        if ttl > 0:
+            _verified_claims.set(cache_key, (payload, kid), ttl=ttl)
+    
+    # 5. Construct a user object that mimics Supabase's response
+    # Clerk "sub" is the user ID
+    user_id = payload.get("sub")
+    email = payload.get("email", "unknown")
+
+    # Clerk doesn't always put email in the JWT unless configured, but we need an ID
+    return User(id=user_id, email=email)
+
+
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
     try:
-        # 1. Decode header to get Key ID (kid)
-        unverified_header = jwt.get_unverified_header(token)
-        kid = unverified_header.get('kid')
-        
-        # 2. Fetch Clerk's JWKS (Simple in-memory caching)
-        # TODO: Move this URL to config
-        jwks_url = "https://warm-man-46.clerk.accounts.dev/.well-known/jwks.json"
-        
-        # Simple global cache for JWKS to avoid fetching on every request
-        if not hasattr(get_current_user, "jwks_cache"):
-            with urllib.request.urlopen(jwks_url) as response:
-                get_current_user.jwks_cache = json.loads(response.read())
-        
-        jwks = get_current_user.jwks_cache
-            
-        # 3. Find the matching key
-        public_key = None
-        for key in jwks['keys']:
-            if key['kid'] == kid:
-                public_key = RSAAlgorithm.from_jwk(json.dumps(key))
-                break
-        
-        if not public_key:
-             # If key not found, maybe cache is stale? Refresh once.
-             with urllib.request.urlopen(jwks_url) as response:
-                get_current_user.jwks_cache = json.loads(response.read())
-                jwks = get_current_user.jwks_cache
-                for key in jwks['keys']:
-                    if key['kid'] == kid:
-                        public_key = RSAAlgorithm.from_jwk(json.dumps(key))
-                        break
-             
-             if not public_key:
-                raise Exception("Public key not found in JWKS")
-
-        # 4. Verify the token
-        payload = jwt.decode(
-            token,
-            public_key,
-            algorithms=["RS256"],
-            options={"verify_aud": False}, # Clerk tokens might not have audience set for backend
-            leeway=60 # Add 60 seconds leeway for clock skew
-        )
-        
-        # 5. Construct a user object that mimics Supabase's response
-        class User:
-            def __init__(self, id, email):
-                self.id = id
-                self.email = email
-        
-        # Clerk "sub" is the user ID
-        user_id = payload.get("sub")
-        email = payload.get("email", "unknown")
-
-        # Clerk doesn't always put email in the JWT unless configured, but we need an ID
-        return User(id=user_id, email=email)
-
+        user = await verify_token(token)
     except Exception as e:
         print(f"DEBUG: Manual Auth exception: {str(e)}")
         raise HTTPException(
@@ -96,33 +108,98 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail=f"Could not validate credentials: {str(e)}",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    # Gemini usage from here on is accounted to this user and route
+    usage_tracker.bind(user.id, _route_path(request.scope))
+    return user
+
+
+def check_token_budget(user_id: str):
+    """Raises 429 once user_id has spent today's Gemini token budget."""
+    if usage_tracker.over_budget(user_id):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Daily AI usage limit reached. Try again tomorrow.",
+            headers={"Retry-After": str(seconds_until_reset())},
+        )
+
+
+async def require_token_budget(user: User = Depends(get_current_user)) -> User:
+    """
+    get_current_user for routes that call Gemini: also rejects users who
+    have used up their daily token budget (USER_DAILY_TOKEN_BUDGET).
+    """
+    # The daily count lives in the shared state (SQLite or Redis)
+    await run_in_threadpool(check_token_budget, user.id)
+    return user
+
+
+def _route_path(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("path", "unknown")
+
+def require_monitoring_access(request: Request):
+    """
+    Guards operational endpoints, which expose stacks, file paths and
+    per-user usage. MONITORING_TOKEN must be sent as a Bearer token (or
+    ``?token=`` for scrapers that can't set headers). Without a token
+    configured they answer 404, unless MONITORING_PUBLIC opens them.
+    """
+    if not settings.monitoring_token:
+        if settings.monitoring_public:
+            return
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    supplied = request.query_params.get("token")
+    auth_header = request.headers.get("authorization", "")
+    if auth_header.lower().startswith("bearer "):
+        supplied = auth_header[7:]
+    if not supplied or not hmac.compare_digest(supplied, settings.monitoring_token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Monitoring token required")
 
 async def get_user_supabase_client(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Client:
     """
-    Creates a Supabase client authenticated with the user's token.
+    Returns a Supabase client authenticated with the user's token.
     This ensures RLS policies are respected.
+
+    Clients are cached per token until the token's expiry, and all of them
+    share one pooled HTTP transport, so repeat requests cost a dictionary
+    lookup instead of client construction and a TLS handshake.
     """
     token = credentials.credentials
+    cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    client = _user_clients.get(cache_key)
+    if client is not None:
+        return client
+
     try:
-        # Create a new client with the user's token
         # We use the ANON key + the user's Bearer token
-        from app.config import settings
-        from supabase import create_client, ClientOptions
-        
-        print(f"DEBUG: Creating Supabase client for user with token (first 10 chars): {token[:10]}...")
         client = create_client(
             settings.supabase_url, 
             settings.supabase_anon_key,
             options=ClientOptions(
                 headers={
                     "Authorization": f"Bearer {token}"
-                }
+                },
+                httpx_client=get_supabase_http_client(),
+                auto_refresh_token=False,
+                persist_session=False
             )
         )
-        print("DEBUG: Supabase client created successfully")
-        return client
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Could not create authenticated client: {str(e)}",
         )
+
+    ttl = _token_ttl(token)
+    if ttl and ttl > 0:
+        _user_clients.set(cache_key, client, ttl=ttl)
+    return client
+
+
+def _token_ttl(token: str) -> Optional[float]:
+    """Seconds until the token's exp claim. The signature is checked by get_current_user."""
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except Exception:
+        return None
+    return exp - time.time() if exp else None
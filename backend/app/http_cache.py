@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+import json
+from typing import Any, Dict, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+# Per-user data: browsers may store it but must revalidate every time
+PRIVATE_REVALIDATE = "private, no-cache"
+# Per-user data that never changes once written
+PRIVATE_IMMUTABLE = "private, max-age=31536000, immutable"
+
+# Bodies smaller than this aren't worth compressing
+GZIP_MIN_SIZE = 1024
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag over the exact response bytes."""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+
+def accepts_gzip(request: Request) -> bool:
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+
+def encode_json(content: Any) -> bytes:
+    return json.dumps(jsonable_encoder(content), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def conditional_json(
+    request: Request,
+    content: Any,
+    cache_control: str = PRIVATE_REVALIDATE,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Serializes content once and answers with 304 Not Modified when the
+    client already holds the same representation. Larger bodies are
+    gzip-compressed when the client accepts it.
+    """
+    return conditional_body(request, encode_json(content), cache_control=cache_control, headers=headers)
+
+
+def conditional_body(
+    request: Request,
+    body: bytes,
+    cache_control: str = PRIVATE_REVALIDATE,
+    headers: Optional[Dict[str, str]] = None,
+    etag: Optional[str] = None,
+    compressed: Optional[bytes] = None
+) -> Response:
+    """
+    Like conditional_json for an already serialized JSON body. Callers
+    that cache a representation can pass its ETag and gzip bytes so
+    neither is recomputed.
+    """
+    etag = etag or make_etag(body)
+    # A strong ETag names one exact byte sequence, so the gzip
+    # representation gets its own tag
+    gzip_etag = etag[:-1] + '-gzip"'
+    use_gzip = len(body) >= GZIP_MIN_SIZE and accepts_gzip(request)
+    response_headers = {
+        "ETag": gzip_etag if use_gzip else etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+        **(headers or {})
+    }
+    if etag_matches(request, etag) or etag_matches(request, gzip_etag):
+        return Response(status_code=304, headers=response_headers)
+    if use_gzip:
+        response_headers["Content-Encoding"] = "gzip"
+        body = compressed or gzip.compress(body, compresslevel=6)
+    return Response(content=body, media_type="application/json", headers=response_headers)
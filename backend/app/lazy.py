@@ -0,0 +1,88 @@
+"""
+Module-level singletons that are built on first use.
+
+``supabase = Lazy("supabase", create_admin_client)`` can be imported and
+used like the object itself (``supabase.table(...)``), but the factory only
+runs, once, the first time an attribute is read or set. Importing the app
+therefore doesn't load the SDKs behind these objects or need their
+credentials; the readiness warm-up (app.services.warmup) builds them in the
+background instead, so the first request doesn't pay for it either.
+"""
+
+import asyncio
+import importlib
+import logging
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Every lazy singleton by name, for warm-up and /ready
+_registry: Dict[str, "Lazy"] = {}
+
+
+class Lazy:
+    """Proxy that builds its target with ``factory()`` on first attribute access."""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        # Set through __dict__, since __setattr__ is forwarded to the target
+        self.__dict__.update(
+            _lazy_name=name,
+            _lazy_factory=factory,
+            _lazy_instance=None,
+            _lazy_lock=threading.Lock(),
+            _lazy_build_ms=None,
+        )
+        _registry[name] = self
+
+    def __getattr__(self, attr: str):
+        return getattr(resolve(self), attr)
+
+    def __setattr__(self, attr: str, value):
+        setattr(resolve(self), attr, value)
+
+    def __repr__(self):
+        state = "built" if self._lazy_instance is not None else "not built"
+        return f"<Lazy {self._lazy_name} ({state})>"
+
+
+def resolve(obj):
+    """The object behind a Lazy proxy, building it if needed; other objects are returned as is."""
+    if not isinstance(obj, Lazy):
+        return obj
+    instance = obj._lazy_instance
+    if instance is None:
+        # Concurrent first uses (a request and the warm-up) build it once
+        with obj._lazy_lock:
+            instance = obj._lazy_instance
+            if instance is None:
+                started = time.perf_counter()
+                instance = obj._lazy_factory()
+                obj.__dict__["_lazy_build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                obj.__dict__["_lazy_instance"] = instance
+                logger.info(f"[Lazy] Built {obj._lazy_name} in {obj._lazy_build_ms} ms")
+    return instance
+
+
+async def load(module: str, name: str):
+    """
+    Returns ``module.name``, built, from async code. Until the module is
+    imported and the object built, that work runs in a worker thread, so
+    it neither blocks the event loop nor makes the loop wait for the
+    warm-up thread that may be importing the same module.
+    """
+    loaded = sys.modules.get(module)
+    # A module another thread is still importing is already in sys.modules
+    if loaded is None or getattr(getattr(loaded, "__spec__", None), "_initializing", False):
+        loaded = await asyncio.to_thread(importlib.import_module, module)
+    obj = getattr(loaded, name)
+    if isinstance(obj, Lazy) and obj._lazy_instance is None:
+        return await asyncio.to_thread(resolve, obj)
+    return resolve(obj)
+
+
+def lazy_status() -> Dict[str, Optional[float]]:
+    """Build time in ms of every registered singleton, or None if it hasn't been built."""
+    return {name: proxy._lazy_build_ms for name, proxy in _registry.items()}
@@ -1,18 +1,59 @@
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import anyio.to_thread
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 
 # Disable HTTP/2 to prevent StreamReset errors with httpx/Supabase
 os.environ["HTTPX_NO_HTTP2"] = "1"
 
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
-from app.routes import manual, chat, auth, audio
+from app.routes import manual, chat, auth, audio, voice, monitoring
+from app.services.persistence_service import persistence
+from app.services.storage_service import image_uploader
+from app.services.loop_monitor import loop_monitor
+from app.services.metrics import TimingMiddleware
+from app.services.warmup import warmup
+
+
+def bound_threadpools(size: int):
+    """
+    Caps the threads running the remaining sync calls (Supabase, Tavily,
+    Gemini SDK): asyncio.to_thread uses the loop's default executor, sync
+    endpoints and dependencies use anyio's limiter.
+    """
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=size, thread_name_prefix="sync"))
+    anyio.to_thread.current_default_thread_limiter().total_tokens = size
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.sync_threadpool_size:
+        bound_threadpools(settings.sync_threadpool_size)
+    # Replay spooled writes on start, flush queued writes on graceful shutdown
+    await persistence.start()
+    if settings.loop_monitor_enabled:
+        loop_monitor.start()
+    # Serve right away; clients and connections are built in the background
+    if settings.warmup_on_start:
+        warmup.start()
+    yield
+    await warmup.stop()
+    await loop_monitor.stop()
+    # Pending uploads may queue reconciliation writes, so drain them first
+    await asyncio.to_thread(image_uploader.drain)
+    await persistence.stop()
+
 
 # Create FastAPI app
 app = FastAPI(
     title="Toolify API",
     description="Tool identification and manual generation API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -22,12 +63,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing"],
 )
 
+# Server-Timing headers and latency histograms for /metrics
+if settings.metrics_enabled:
+    app.add_middleware(TimingMiddleware)
+
 # Register routers
 app.include_router(manual.router)
 app.include_router(chat.router)
 app.include_router(audio.router)
+app.include_router(voice.router)
+app.include_router(monitoring.router)
+app.include_router(monitoring.metrics_router)
 # CRITICAL: Registers the authentication router
 app.include_router(auth.router)
 
@@ -39,7 +88,9 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "generate_manual": "/api/generate-manual",
-            "chat": "/api/chat"
+            "manuals": "/api/manuals",
+            "chat": "/api/chat",
+            "voice": "/api/voice/ws"
         }
     }
 
@@ -47,6 +98,15 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness: 503 while the background warm-up is still running, 200 once
+    it has finished (or when WARMUP_ON_START is off), with per-step timings.
+    """
+    report = warmup.status()
+    return JSONResponse(report, status_code=503 if report["status"] == "warming" else 200)
+
 
 # Run with: uvicorn app.main:app --reload
 if __name__ == "__main__":
@@ -46,6 +46,15 @@ class ManualGenerationResponse(BaseModel):
     # pdf_url removed - PDF generation moved to frontend
     timestamp: datetime
     session_id: Optional[str] = None
+    manual_id: Optional[str] = None  # Fetch again via GET /api/manuals/{manual_id}
+    degraded: List[str] = Field(
+        default_factory=list,
+        description=(
+            "Parts skipped or shortened to answer within the deadline: research (no web results), "
+            "youtube (no video search), youtube_transcripts (search snippets instead of some transcripts), "
+            "manual_shortened, manual (not generated, so not stored), summary, audio"
+        )
+    )
 
 
 class ChatResponse(BaseModel):
@@ -63,6 +72,13 @@ class LLMStructuredOutput(BaseModel):
     response: str = Field(description="The content of the response in the identified language.")
 
 
+class VoiceStructuredOutput(BaseModel):
+    """Structured output from LLM for voice messages: transcript plus answer"""
+    transcript: str = Field(description="The user's spoken message transcribed exactly as spoken, without translation.")
+    language: str = Field(description="The language of the response, chosen from en, fr, or pdg.")
+    response: str = Field(description="The content of the response in the identified language.")
+
+
 # Auth Models
 class TokenResponse(BaseModel):
     """Response model for authentication tokens"""
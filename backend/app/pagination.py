@@ -0,0 +1,57 @@
+import base64
+import json
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(row: dict) -> str:
+    """Opaque cursor pointing just past row on the (created_at, id) key."""
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(created_at), str(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(cursor: str, descending: bool) -> str:
+    """
+    PostgREST ``or`` filter selecting rows after cursor in
+    (created_at, id) order. Values are quoted because timestamps contain
+    reserved characters.
+    """
+    created_at, row_id = decode_cursor(cursor)
+    op = "lt" if descending else "gt"
+    return f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",id.{op}."{row_id}")'
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def page_size(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """
+    Rows per page, or None for the whole list: clients that predate
+    pagination send neither ``limit`` nor ``cursor`` and expect everything.
+    """
+    if limit is None and cursor is None:
+        return None
+    return clamp_limit(limit)
+
+
+def split_page(rows: List[dict], limit: Optional[int]) -> Tuple[List[dict], Optional[str]]:
+    """Rows are fetched with limit + 1; the extra row only signals another page."""
+    if limit is not None and len(rows) > limit:
+        page = rows[:limit]
+        return page, encode_cursor(page[-1])
+    return rows, None
@@ -1,40 +1,130 @@
 from typing import Optional
 from fastapi import APIRouter, HTTPException, Depends, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from app.config import settings
 from app.services.audio_service import audio_service
-from app.dependencies import get_current_user, get_user_supabase_client
+from app.services.cancellation import CancelScope, cancel_on_disconnect
+from app.services.metrics import stage
+from app.services.tts_cache import tts_cache
+from app.services.transcription_cache import transcription_cache
+from app.dependencies import get_current_user, get_user_supabase_client, require_monitoring_access
 from supabase import Client
 
 router = APIRouter(prefix="/api", tags=["Audio"])
 
+
+def _save_audio_url(supabase_client: Client, message_id: Optional[str], audio_url: str):
+    """Attach a generated audio URL to a message, logging instead of failing."""
+    if not message_id:
+        return
+    try:
+        supabase_client.table("messages").update({
+            "audio_url": audio_url
+        }).eq("id", message_id).execute()
+    except Exception as db_error:
+        print(f"Failed to update message with audio URL: {db_error}")
+
 @router.post("/generate-tts")
 async def generate_tts(
     text: str = Form(...),
     language: str = Form("en"),
     message_id: Optional[str] = Form(None),
+    chunked: Optional[bool] = Form(None),
     user: dict = Depends(get_current_user),
-    supabase_client: Client = Depends(get_user_supabase_client)
+    supabase_client: Client = Depends(get_user_supabase_client),
+    cancel_scope: CancelScope = Depends(cancel_on_disconnect)
 ):
     """Generate text-to-speech audio for a message"""
+    cancel_scope.expect("tts")
     try:
         # Generate audio using YarnGPT via audio_service
-        audio_url = audio_service.generate_audio(
-            text=text,
-            tool_name="chat_message",
-            user_id=str(user.id)
-        )
+        with stage("tts"):
+            audio_url = await run_in_threadpool(
+                audio_service.generate_audio,
+                text=text,
+                tool_name="chat_message",
+                user_id=str(user.id),
+                language=language,
+                chunked=chunked
+            )
         
         # If message_id is provided, save the audio URL to the message history
-        if message_id:
-            try:
-                supabase_client.table("messages").update({
-                    "audio_url": audio_url
-                }).eq("id", message_id).execute()
-            except Exception as db_error:
-                print(f"Failed to update message with audio URL: {db_error}")
-                # Don't fail the request, just log the error
+        await run_in_threadpool(_save_audio_url, supabase_client, message_id, audio_url)
         
         return {"url": audio_url}
         
     except Exception as e:
         print(f"TTS Error: {e}")
         raise HTTPException(status_code=500, detail=f"TTS generation error: {str(e)}")
+
+
+@router.post("/generate-tts/stream")
+async def stream_tts(
+    text: str = Form(...),
+    language: str = Form("en"),
+    message_id: Optional[str] = Form(None),
+    user: dict = Depends(get_current_user),
+    supabase_client: Client = Depends(get_user_supabase_client)
+):
+    """
+    Stream text-to-speech audio for a message as it is synthesized.
+
+    YarnGPT bytes are forwarded to the client as they arrive while a copy is
+    kept in memory; once the stream completes the clip is uploaded to
+    storage in the background and, if message_id is provided, saved to the
+    message history. Cached clips are answered with a redirect to their
+    public URL.
+    """
+    clean_text = audio_service.clean_text_for_tts(text)
+    voice = settings.yarngpt_voice
+
+    cache_key = None
+    if settings.tts_cache_enabled:
+        cache_key = tts_cache.make_key(clean_text, voice, language)
+        cached_url = await run_in_threadpool(tts_cache.lookup, cache_key)
+        if cached_url:
+            await run_in_threadpool(_save_audio_url, supabase_client, message_id, cached_url)
+            return RedirectResponse(cached_url, status_code=303)
+
+    try:
+        # Opening the stream waits only for the upstream's first byte
+        audio_stream = await run_in_threadpool(audio_service.open_audio_stream, clean_text, voice)
+    except Exception as e:
+        print(f"TTS Stream Error: {e}")
+        raise HTTPException(status_code=502, detail=f"TTS generation error: {str(e)}")
+
+    chunks = []
+    completed = []
+
+    def tee():
+        for chunk in audio_stream:
+            chunks.append(chunk)
+            yield chunk
+        completed.append(True)
+
+    def persist():
+        # A client that disconnected mid-stream leaves a partial clip; don't store it
+        if not completed:
+            return
+        try:
+            audio_url = audio_service.store_audio(b"".join(chunks), "chat_message", str(user.id), cache_key)
+        except Exception as e:
+            print(f"Failed to persist streamed audio: {e}")
+            return
+        _save_audio_url(supabase_client, message_id, audio_url)
+
+    return StreamingResponse(tee(), media_type="audio/mpeg", background=BackgroundTask(persist))
+
+
+@router.get("/tts-cache/stats", dependencies=[Depends(require_monitoring_access)])
+async def tts_cache_stats():
+    """Return hit rate and storage savings of the TTS cache (monitoring token required)"""
+    return tts_cache.stats()
+
+
+@router.get("/transcription-cache/stats", dependencies=[Depends(require_monitoring_access)])
+async def transcription_cache_stats():
+    """Return hit rate of the transcription cache (monitoring token required)"""
+    return transcription_cache.stats()
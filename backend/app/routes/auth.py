@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from app.config import supabase
 from app.dependencies import get_current_user
+from app.services.usage_tracker import usage_tracker
 
 router = APIRouter(prefix="/api", tags=["Auth"])
 
@@ -16,3 +17,12 @@ async def get_me(user: dict = Depends(get_current_user)):
         "email": user.email,
         "message": "Backend authentication successful"
     }
+
+
+@router.get("/me/usage")
+async def get_my_usage(user: dict = Depends(get_current_user)):
+    """
+    The user's Gemini token usage and estimated cost, plus today's total
+    against their daily budget (null when budgets are off).
+    """
+    return usage_tracker.user_summary(user.id)
@@ -1,15 +1,26 @@
 import uuid
 import json
-from fastapi import APIRouter, HTTPException, Form, UploadFile, Depends, File
+import asyncio
+from fastapi import APIRouter, HTTPException, Form, UploadFile, Depends, File, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime
 from typing import Optional, List
 from app.model.schemas import ChatResponse
-from app.chains.chat_chain import _chat_chain
 from app.services.vision_service import describe_image, recognize_tools_in_image
 from app.services.tavily_service import perform_tool_research
 from app.services.audio_service import audio_service
-from app.dependencies import optional_image_file_validator, get_current_user, get_user_supabase_client
-from app.config import supabase
+from app.services.cancellation import CancelScope, cancel_on_disconnect
+from app.services.metrics import stage
+from app.dependencies import optional_image_file_validator, get_current_user, get_user_supabase_client, require_token_budget
+from app.services.audio_normalizer import normalize_audio_async
+from app.services.transcription_cache import transcription_cache
+from app.services.persistence_service import persistence, ensure_chat_owner, remember_chat_owner
+from app.services.storage_service import image_uploader
+from app.services.research_store import research_store
+from app.config import supabase, settings
+from app.http_cache import conditional_json
+from app.lazy import load
+from app.pagination import MAX_PAGE_SIZE, keyset_filter, page_size, split_page
 from supabase import Client
 
 try:
@@ -22,14 +33,19 @@ except ImportError:
 
 router = APIRouter(prefix="/api", tags=["Chat"])
 
+# Columns returned by the history endpoints (list views skip bulky fields)
+CHAT_LIST_COLUMNS = "id,title,created_at,scan_id"
+MESSAGE_COLUMNS = "id,chat_id,role,content,image_url,audio_url,created_at"
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     message: Optional[str] = Form(None),
     session_id: Optional[str] = Form(None),
     file: Optional[UploadFile] = Depends(optional_image_file_validator),
     voice: Optional[UploadFile] = File(None),
-    user: dict = Depends(get_current_user),
-    supabase_client: Client = Depends(get_user_supabase_client)
+    user: dict = Depends(require_token_budget),
+    supabase_client: Client = Depends(get_user_supabase_client),
+    cancel_scope: CancelScope = Depends(cancel_on_disconnect)
 ):
     """
     A multi-turn chat endpoint to converse with the Gemini AI assistant.
@@ -38,6 +54,10 @@ async def chat(
     If an image is provided, it attempts to recognize a tool and perform research.
     If session_id is not provided, a new one is generated and returned.
     """
+    # Loaded on first use: the chain module imports LangChain
+    _chat_chain = await load("app.chains.chat_chain", "_chat_chain")
+    cancel_scope.expect(*(["recognition"] if file else []), "chat")
+
     try:
         # Validate and set chat_id
         chat_id = None
@@ -50,19 +70,62 @@ async def chat(
                 # Invalid session_id, will create a new chat
                 chat_id = None
         
+        # Rows are written by the service role, so an existing session has
+        # to be checked explicitly; the lookup overlaps with voice handling.
+        owner_check = asyncio.create_task(ensure_chat_owner(supabase_client, chat_id, str(user.id))) if chat_id else None
+
         scan_id = None
         original_user_message = None  # Track the original transcribed message for voice
+        structured_response = None
+        new_chat_id = str(uuid7())
         
         # Handle voice input
         if voice:
             try:
                 voice_bytes = await voice.read()
+                voice_mime_type = voice.content_type or "audio/mp3"
+
+                # Voice-only turns go to the chat model in one call that returns
+                # both the transcript and the answer. Image turns need the
+                # transcript first to build the research context, and retried
+                # uploads already have a cached transcript.
+                voice_cache_key = transcription_cache.make_key(voice_bytes, voice_mime_type)
+                if (
+                    voice_bytes and not file and settings.voice_native_chat
+                    and transcription_cache.get(voice_cache_key, record_miss=False) is None
+                ):
+                    # Outside the fallback below: a failed ownership check fails the request
+                    chat_id = await _resolve_chat_id(chat_id, owner_check)
+                    owner_check = None
+                    try:
+                        audio_bytes, audio_mime_type = await normalize_audio_async(voice_bytes, voice_mime_type)
+                        with stage("voice_chat"):
+                            structured_response = await _chat_chain.invoke_voice_chat(
+                                audio_bytes,
+                                audio_mime_type,
+                                chat_id or new_chat_id,
+                                message=message
+                            )
+                        transcribed_text = structured_response.transcript
+                        transcription_cache.set(voice_cache_key, transcribed_text)
+                        if message:
+                            message += f"\n[Voice Input]: {transcribed_text}"
+                        else:
+                            message = transcribed_text
+                        original_user_message = transcribed_text
+                        voice_bytes = None
+                    except Exception as voice_chat_error:
+                        # Fall back to transcribe-then-chat
+                        print(f"Voice chat failed, falling back to transcription: {voice_chat_error}")
+                        structured_response = None
+
                 if voice_bytes:
                     try:
-                        transcribed_text = audio_service.transcribe_audio(
-                            voice_bytes, 
-                            mime_type=voice.content_type or "audio/mp3"
-                        )
+                        with stage("transcription"):
+                            transcribed_text = await audio_service.transcribe_audio_async(
+                                voice_bytes, 
+                                mime_type=voice_mime_type
+                            )
                         
                         if transcribed_text:
                             if message:
@@ -80,6 +143,8 @@ async def chat(
                             message = f"[Audio transcription error: {str(transcription_error)}]"
                             original_user_message = message
                 
+            except HTTPException:
+                raise
             except Exception as voice_read_error:
                 # Log error but don't crash the whole request if possible
                 print(f"Error reading voice file: {voice_read_error}")
@@ -88,43 +153,36 @@ async def chat(
             raise HTTPException(status_code=400, detail="Message or voice input is required")
 
         full_message = message
+        chat_id = await _resolve_chat_id(chat_id, owner_check)
         
         # Handle Image Upload & Recognition
         if file:
             image_bytes = await file.read()
             if image_bytes:
-                # Upload image to Supabase
-                file_ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-                file_path = f"{user.id}/{uuid.uuid4()}.{file_ext}"
-                try:
-                    supabase.storage.from_("tool-images").upload(
-                        file=image_bytes,
-                        path=file_path,
-                        file_options={"content-type": file.content_type}
-                    )
-                except Exception as e:
-                    print(f"Failed to upload image: {e}")
-                    # Proceed without saving scan if upload fails? 
-                    # We'll just log it for now.
+                # Upload image to Supabase in the background; the path is
+                # known up front so the scan row can reference it right away
+                file_path = image_uploader.make_path(str(user.id), file.filename)
+                upload = image_uploader.schedule(file_path, image_bytes, file.content_type)
 
                 # First try to recognize a tool
-                tool_name = recognize_tools_in_image(image_bytes)
+                with stage("recognition"):
+                    tool_name = await run_in_threadpool(recognize_tools_in_image, image_bytes)
                 
                 if tool_name:
                     # If tool found, research it
-                    research_response = perform_tool_research(tool_name)
+                    with stage("research"):
+                        research_response = await run_in_threadpool(perform_tool_research, tool_name)
                     
                     # Save Scan
                     scan_data = {
                         "user_id": str(user.id),
-                        "image_path": file_path,
+                        "image_path": image_uploader.path_if_uploaded(upload, file_path),
                         "tool_name": tool_name,
-                        "analysis_result": research_response.model_dump(mode='json'),
+                        "research_hash": research_store.put(research_response.model_dump(mode='json')),
                     }
                     
-                    scan_res = supabase_client.table("scans").insert(scan_data).execute()
-                    if scan_res.data:
-                        scan_id = scan_res.data[0]['id']
+                    scan_id = persistence.insert("scans", scan_data)["id"]
+                    image_uploader.clear_if_failed(upload, file_path)
 
                     # Format research for the LLM
                     research_text = f"Tool Identified: {tool_name}\n\nResearch Results:\n"
@@ -138,7 +196,8 @@ async def chat(
                     )
                 else:
                     # Fallback to general description if no tool recognized
-                    image_description = describe_image(image_bytes)
+                    with stage("describe_image"):
+                        image_description = await run_in_threadpool(describe_image, image_bytes)
                     if image_description:
                         full_message = (
                             f"The user has uploaded an image with the following description: '{image_description}'.\n"
@@ -147,36 +206,35 @@ async def chat(
 
         # Create Chat Session if needed
         if not chat_id:
-            # Generate UUID v7 for new chat sessions (LangSmith compatible)
-            new_chat_id = str(uuid7())
-            
+            # New chat sessions use the UUID v7 generated above (LangSmith compatible)
             chat_data = {
                 "id": new_chat_id,  # Explicitly set the ID
                 "user_id": str(user.id),
                 "title": message[:50] + "..." if message else "New Chat",
                 "scan_id": str(scan_id) if scan_id else None
             }
-            chat_res = supabase_client.table("chats").insert(chat_data).execute()
-            if chat_res.data:
-                chat_id = chat_res.data[0]['id']
+            chat_id = persistence.insert("chats", chat_data)["id"]
+            remember_chat_owner(str(user.id), chat_id)
         
-        # Save User Message
-        supabase_client.table("messages").insert({
-            "chat_id": str(chat_id) if chat_id else None,
+        # Save User Message (written behind, off the response path)
+        persistence.insert("messages", {
+            "chat_id": str(chat_id),
             "role": "user",
             "content": message # Save original message, not full_message with context
-        }).execute()
+        })
 
-        # Invoke LLM
+        # Invoke LLM (voice-only turns were already answered above)
         # invoke_chat now returns a Pydantic object (LLMStructuredOutput)
-        structured_response = await _chat_chain.invoke_chat(full_message, chat_id) # Pass chat_id as session_id
+        if structured_response is None:
+            with stage("chat"):
+                structured_response = await _chat_chain.invoke_chat(full_message, chat_id) # Pass chat_id as session_id
 
         # Save Assistant Message
-        supabase_client.table("messages").insert({
-            "chat_id": str(chat_id) if chat_id else None,
+        persistence.insert("messages", {
+            "chat_id": str(chat_id),
             "role": "assistant",
             "content": structured_response.response
-        }).execute()
+        })
 
         return ChatResponse(
             content=structured_response.response,
@@ -186,22 +244,58 @@ async def chat(
             user_message=original_user_message  # Return transcribed text for voice
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Chat Error: {e}")
         raise HTTPException(status_code=500, detail=f"Chat Error: {str(e)}")
 
+async def _resolve_chat_id(chat_id: Optional[str], owner_check: Optional[asyncio.Task]) -> Optional[str]:
+    """Drops a session ID the user doesn't own so a new chat is started instead."""
+    if owner_check is None:
+        return chat_id
+    if not await owner_check:
+        print(f"Session {chat_id} not found for user, will create a new chat")
+        return None
+    return chat_id
+
 @router.get("/chats")
 async def get_chats(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
     user: dict = Depends(get_current_user),
     supabase_client: Client = Depends(get_user_supabase_client)
 ):
-    """Fetch all chats for the current user."""
+    """
+    Fetch the current user's chats, newest first.
+
+    Pages are keyset-paginated: pass ``limit`` (default 50 once paging),
+    then the ``X-Next-Cursor`` response header back as ``cursor`` to get
+    the next page. Without ``limit`` or ``cursor`` all chats are returned.
+    ``since`` returns only chats created after that time (delta sync).
+    Responses carry an ETag and honour ``If-None-Match``.
+    """
     try:
-        # Check if user.id is available, might be a string or property depending on Depends(get_current_user)
-        # Based on dependencies.py, it returns response.user which has .id
-        user_id = user.id
-        res = supabase_client.table("chats").select("*").eq("user_id", str(user_id)).order("created_at", desc=True).execute()
-        return res.data
+        query = (
+            supabase_client.table("chats")
+            .select(CHAT_LIST_COLUMNS)
+            .eq("user_id", str(user.id))
+        )
+        if since:
+            query = query.gt("created_at", since.isoformat())
+        if cursor:
+            query = query.or_(keyset_filter(cursor, descending=True))
+        query = query.order("created_at", desc=True).order("id", desc=True)
+        page_limit = page_size(limit, cursor)
+        if page_limit:
+            query = query.limit(page_limit + 1)
+        res = await run_in_threadpool(query.execute)
+        page, next_cursor = split_page(res.data, page_limit)
+        return conditional_json(request, page, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching chats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -209,30 +303,44 @@ async def get_chats(
 
 @router.get("/chats/{chat_id}/messages")
 async def get_chat_messages(
-    chat_id: str, 
+    chat_id: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
     user: dict = Depends(get_current_user),
     supabase_client: Client = Depends(get_user_supabase_client)
 ):
-    """Fetch messages for a specific chat."""
+    """
+    Fetch messages for a specific chat, oldest first.
+
+    Messages are embedded in a single query on the chat row filtered by
+    owner, so ownership is checked in the same round trip. Pagination,
+    ``since`` and ETags work as for ``GET /chats``.
+    """
     try:
-        user_id = user.id
-        
-        # Verify ownership
-        # Note: .single() raises error if no row found, handle that
-        try:
-            chat_check = supabase_client.table("chats").select("user_id").eq("id", chat_id).single().execute()
-        except:
-             raise HTTPException(status_code=404, detail="Chat not found")
-             
-        if not chat_check.data or chat_check.data["user_id"] != str(user_id):
-            raise HTTPException(status_code=403, detail="Not authorized to view this chat")
-        
-        res = supabase_client.table("messages").select("*").eq("chat_id", chat_id).order("created_at", desc=False).execute()
-        return res.data
+        query = (
+            supabase_client.table("chats")
+            .select(f"id,messages({MESSAGE_COLUMNS})")
+            .eq("id", chat_id)
+            .eq("user_id", str(user.id))
+        )
+        if since:
+            query = query.gt("messages.created_at", since.isoformat())
+        if cursor:
+            query = query.or_(keyset_filter(cursor, descending=False), reference_table="messages")
+        query = query.order("created_at", foreign_table="messages").order("id", foreign_table="messages")
+        page_limit = page_size(limit, cursor)
+        if page_limit:
+            query = query.limit(page_limit + 1, foreign_table="messages")
+        res = await run_in_threadpool(query.execute)
+        if not res.data:
+            raise HTTPException(status_code=404, detail="Chat not found")
+
+        page, next_cursor = split_page(res.data[0]["messages"], page_limit)
+        return conditional_json(request, page, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
     except HTTPException:
         raise
     except Exception as e:
         print(f"Error fetching messages: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-
-
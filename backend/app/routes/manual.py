@@ -1,16 +1,27 @@
 import uuid
-import json
+import gzip
+import asyncio
 from typing import Optional
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 from app.model.schemas import ManualGenerationResponse
-from app.chains.tool_manual_chain import tool_manual_chain
 from app.services.audio_service import audio_service
+from app.services.cancellation import CancelScope, cancel_on_disconnect
+from app.services.deadline import Deadline
+from app.services.metrics import stage
 from app.services.tavily_service import perform_tool_research
 from app.services.vision_service import recognize_tools_in_image
 # PDF generation moved to frontend
-from app.dependencies import get_current_user, get_user_supabase_client, image_file_validator
-from app.config import supabase
+from app.dependencies import get_current_user, get_user_supabase_client, image_file_validator, require_token_budget
+from app.config import settings, supabase
+from app.services.persistence_service import persistence, ensure_chat_owner, remember_chat_owner
+from app.services.storage_service import image_uploader
+from app.services.research_store import research_store
+from app.services.cache import TTLCache
+from app.lazy import load
+from app.http_cache import PRIVATE_IMMUTABLE, conditional_body, conditional_json, encode_json, make_etag
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_filter, split_page
 from supabase import Client
 from datetime import datetime
 import os
@@ -29,6 +40,13 @@ except ImportError:
 
 router = APIRouter(prefix="/api", tags=["Manual Generation"])
 
+MANUAL_LIST_COLUMNS = "id,tool_name,scan_id,created_at"
+MANUAL_COLUMNS = "id,tool_name,scan_id,manual_content,summary_content,audio_files,created_at"
+
+# Stored manuals never change, so their serialized (and gzipped) bodies
+# are kept per (user_id, manual_id) and served without a database query
+_manual_bodies = TTLCache(max_entries=256)
+
 
 @router.post("/generate-manual", response_model=ManualGenerationResponse)
 async def generate_tool_manual(
@@ -36,15 +54,28 @@ async def generate_tool_manual(
     tool_name: Optional[str] = Form(None),
     language: str = Form("en"),
     generate_audio: bool = Form(False),
+    narrate_manual: bool = Form(False),
     session_id: Optional[str] = Form(None),
-    user: dict = Depends(get_current_user),
-    supabase_client: Client = Depends(get_user_supabase_client)
+    user: dict = Depends(require_token_budget),
+    supabase_client: Client = Depends(get_user_supabase_client),
+    cancel_scope: CancelScope = Depends(cancel_on_disconnect)
 ):
     """
     Generate a comprehensive tool manual.
     Can accept an image file for tool recognition OR direct tool name.
+    If the client disconnects, the remaining stages are skipped and no
+    manual is stored. The whole request has MANUAL_DEADLINE_SECONDS; stages
+    short of time degrade, and what they skipped is listed in ``degraded``.
     """
+    deadline = Deadline(settings.manual_deadline)
+
+    # Loaded on first use: the chain module imports LangChain
+    tool_manual_chain = await load("app.chains.tool_manual_chain", "tool_manual_chain")
+
     logger.info(f"Manual generation request received. Tool: {tool_name}, Language: {language}, Audio: {generate_audio}")
+    cancel_scope.expect(
+        *(["recognition"] if file else []), "research", "manual", "summary", *(["tts"] if generate_audio else [])
+    )
 
     try:
         scan_id = None
@@ -61,42 +92,42 @@ async def generate_tool_manual(
             else:
                 chat_id = None
 
+        # Rows are written by the service role, so an existing session has
+        # to be checked explicitly; the lookup overlaps with recognition.
+        owner_check = asyncio.create_task(ensure_chat_owner(supabase_client, chat_id, str(user.id))) if chat_id else None
+
         # 1. Handle File Upload & Recognition
         if file:
             # Validate image file
             image_file_validator(file)
             
             image_bytes = await file.read()
-            recognized_name = recognize_tools_in_image(image_bytes)
+
+            # Upload image to Supabase Storage in the background, concurrently
+            # with recognition and research; the path is computed up front
+            file_path = image_uploader.make_path(str(user.id), file.filename)
+            upload = image_uploader.schedule(file_path, image_bytes, file.content_type)
+
+            with stage("recognition"):
+                recognized_name = await run_in_threadpool(recognize_tools_in_image, image_bytes)
             logger.info(f"Image recognition result: {recognized_name}")
 
             if not recognized_name:
                 logger.warning("No tool recognized in the uploaded image")
+                upload.cancel()
                 raise HTTPException(status_code=404, detail="No tool found in the image.")
             
             final_tool_name = recognized_name
             tool_description = f"Recognized from image: {recognized_name}"
 
-            # Upload image to Supabase Storage
-            file_ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-            file_path = f"{user.id}/{uuid.uuid4()}.{file_ext}"
-            
-            try:
-                # Use admin client for storage to avoid RLS issues with fresh tokens if any
-                supabase.storage.from_("tool-images").upload(
-                    file=image_bytes,
-                    path=file_path,
-                    file_options={"content-type": file.content_type}
-                )
-                logger.info(f"Image uploaded to Supabase: {file_path}")
-            except Exception as e:
-                logger.error(f"Failed to upload image to Supabase: {e}")
-                # Continue without failing the whole request, but log it
-
         # 2. Validate Inputs if no file provided
         if not final_tool_name:
              raise HTTPException(status_code=400, detail="Either an image file or a tool name is required.")
 
+        if owner_check and not await owner_check:
+            logger.warning(f"Session {chat_id} not found for user, creating a new chat")
+            chat_id = None
+
         # Create Chat Session if needed (and persist user message)
         if not chat_id:
             new_chat_id = str(uuid7())
@@ -108,39 +139,38 @@ async def generate_tool_manual(
                 "title": chat_title,
                 "scan_id": None # We'll update this later if we have a scan_id
             }
-            chat_res = supabase_client.table("chats").insert(chat_data).execute()
-            if chat_res.data:
-                chat_id = chat_res.data[0]['id']
-                logger.info(f"New chat session created: {chat_id}")
-            else:
-                logger.error("Failed to create new chat session")
+            chat_id = persistence.insert("chats", chat_data)["id"]
+            remember_chat_owner(str(user.id), chat_id)
+            logger.info(f"New chat session queued: {chat_id}")
 
         # Save User Message
         user_content = f"Generate manual for {final_tool_name}"
         if file:
             user_content = "Generate manual for this tool (image uploaded)"
         
-        # Get public URL for image if it exists
+        # Get public URL for image if it exists (and its upload hasn't already failed)
         image_url = None
-        if file_path:
-             image_url = supabase.storage.from_("tool-images").get_public_url(file_path)
+        if file_path and image_uploader.path_if_uploaded(upload, file_path):
+             image_url = image_uploader.public_url(file_path)
 
-        try:
-            supabase_client.table("messages").insert({
-                "chat_id": str(chat_id) if chat_id else None,
-                "role": "user",
-                "content": user_content,
-                "image_url": image_url # Assuming schema supports this, otherwise append to content
-            }).execute()
-            logger.info(f"User message saved to chat: {chat_id}")
-        except Exception as e:
-            logger.error(f"Failed to save user message: {e}")
+        persistence.insert("messages", {
+            "chat_id": str(chat_id),
+            "role": "user",
+            "content": user_content,
+            "image_url": image_url # Assuming schema supports this, otherwise append to content
+        })
+        logger.info(f"User message queued for chat: {chat_id}")
 
 
         # 3. Perform Research (ALWAYS)
         logger.info(f"Performing research for tool: {final_tool_name}")
-        research_results = perform_tool_research(tool_name=final_tool_name)
-        final_research_context = json.dumps(research_results.model_dump(mode='json'), indent=2)
+        with stage("research"):
+            research_results = await run_in_threadpool(
+                perform_tool_research, tool_name=final_tool_name, deadline=deadline.until(settings.deadline_manual_seconds)
+            )
+        research_payload = research_results.model_dump(mode='json')
+        # pydantic's serializer: the JSON of json.dumps(research_payload, indent=2, ensure_ascii=False), faster
+        final_research_context = research_results.model_dump_json(indent=2)
         logger.info("Research completed successfully")
 
         # 4. Save Scan Data (Research Result)
@@ -148,65 +178,88 @@ async def generate_tool_manual(
         scan_data = {
             "user_id": str(user.id),
             "tool_name": final_tool_name,
-            "analysis_result": research_results.model_dump(mode='json'),
-            "image_path": file_path if file else None
+            "research_hash": research_store.put(research_payload),
+            "image_path": image_uploader.path_if_uploaded(upload, file_path) if file else None
         }
         
-        try:
-            scan_response = supabase.table("scans").insert(scan_data).execute()
-            if scan_response.data:
-                scan_id = scan_response.data[0]['id']
-                logger.info(f"Scan data saved: {scan_id}")
-                # Update chat with scan_id
-                if chat_id:
-                     supabase_client.table("chats").update({"scan_id": scan_id}).eq("id", chat_id).execute()
-                     logger.info(f"Chat {chat_id} updated with scan_id {scan_id}")
-        except Exception as e:
-            logger.error(f"Failed to save scan data: {e}")
+        scan_id = persistence.insert("scans", scan_data)["id"]
+        if image_url:
+            # The rows referencing the image are queued, so a later upload failure can clear them
+            image_uploader.clear_if_failed(upload, file_path)
+        # Updates are applied after the queued inserts, so the scan exists by then
+        persistence.update("chats", {"scan_id": scan_id}, {"id": chat_id})
+        logger.info(f"Scan {scan_id} queued for chat {chat_id}")
 
-        # 5. Generate Manual
-        logger.info("Generating manual content...")
-        manual = tool_manual_chain.generate_manual(
-            tool_name=final_tool_name,
-            research_context=final_research_context,
-            tool_description=tool_description,
-            language=language
-        )
-        logger.info("Manual content generated")
-        
-        # 6. Generate Summary
-        logger.info("Generating summary...")
-        summary = tool_manual_chain.generate_quick_summary(
-            tool_name=final_tool_name,
-            research_context=final_research_context,
-            language=language
-        )
-        logger.info("Summary generated")
+        # 5-6. Generate Manual and Summary; both only need the research, so they run concurrently
+        logger.info("Generating manual and summary...")
+        # Time is kept back for audio only if the manual can still be written in full;
+        # otherwise the manual gets it and audio is skipped
+        tts_reserve = settings.deadline_tts_seconds if generate_audio else 0
+        if not deadline.allows(settings.deadline_manual_seconds + tts_reserve):
+            tts_reserve = 0
+        generation_deadline = deadline.until(tts_reserve)
+
+        async def _generate_manual():
+            with stage("manual"):
+                return await run_in_threadpool(
+                    tool_manual_chain.generate_manual,
+                    tool_name=final_tool_name,
+                    research_context=final_research_context,
+                    tool_description=tool_description,
+                    language=language,
+                    deadline=generation_deadline
+                )
+
+        async def _generate_summary():
+            with stage("summary"):
+                return await run_in_threadpool(
+                    tool_manual_chain.generate_quick_summary,
+                    tool_name=final_tool_name,
+                    research_context=final_research_context,
+                    language=language,
+                    deadline=generation_deadline
+                )
+
+        manual, summary = await asyncio.gather(_generate_manual(), _generate_summary())
+        logger.info("Manual and summary generated")
+
+        # Placeholders below are shown to the user, but never stored as the manual:
+        # stored manuals are served as immutable
+        manual_generated = bool(manual and len(manual.strip()) >= 5)
+        summary_generated = bool(summary and len(summary.strip()) >= 5)
 
         # Ensure summary and manual are never just empty or None
-        if not summary or len(summary.strip()) < 5:
+        if not summary_generated:
             summary = f"A summary for {final_tool_name} could not be generated at this time, but you can find details in the manual below."
         
-        if not manual or len(manual.strip()) < 5:
+        if not manual_generated:
             manual = f"Detailed manual generation for {final_tool_name} failed. Please try again or provide more details."
 
         
         # 7. Generate Audio (Optional)
         audio_files_data = None
         if generate_audio:
-            logger.info("Generating audio for summary...")
+            # Long texts such as full manuals are synthesized in parallel chunks
+            narration_text = manual if narrate_manual else summary
+            logger.info(f"Generating audio for {'manual' if narrate_manual else 'summary'}...")
             try:
-                audio_url = audio_service.generate_audio(
-                    text=summary,
-                    tool_name=final_tool_name,
-                    user_id=str(user.id)
-                )
+                with stage("tts"):
+                    audio_url = await run_in_threadpool(
+                        audio_service.generate_audio,
+                        text=narration_text,
+                        tool_name=final_tool_name,
+                        user_id=str(user.id),
+                        language=language,
+                        deadline=deadline
+                    )
                 
-                audio_files_data = {
-                    "url": audio_url,
-                    "generated_at": datetime.now().isoformat()
-                }
-                logger.info(f"Audio generated: {audio_url}")
+                # None when there was no time left to synthesize it
+                if audio_url:
+                    audio_files_data = {
+                        "url": audio_url,
+                        "generated_at": datetime.now().isoformat()
+                    }
+                    logger.info(f"Audio generated: {audio_url}")
             except Exception as e:
                 logger.error(f"Audio generation failed: {e}")
                 # Don't fail the request if audio fails
@@ -214,23 +267,27 @@ async def generate_tool_manual(
 
         # PDF generation has been moved to frontend
 
-        # 8. Save Manual to Database
-        manual_data = {
-            "user_id": str(user.id),
-            "scan_id": scan_id,
-            "tool_name": final_tool_name,
-            "manual_content": manual,
-            "summary_content": summary,
-            "audio_files": audio_files_data
-        }
-        
-        try:
-            supabase.table("manuals").insert(manual_data).execute()
-            logger.info("Manual saved to database")
-        except Exception as e:
-            logger.error(f"Database insertion failed for manual: {e}")
-            # Don't fail the whole request just because history saving failed
-            pass
+        # 8. Save Manual to Database (only a generated one; a failed or
+        # timed-out manual is not kept, so the user can simply try again)
+        manual_id = None
+        if manual_generated:
+            manual_data = {
+                "user_id": str(user.id),
+                "scan_id": scan_id,
+                "tool_name": final_tool_name,
+                "manual_content": manual,
+                "summary_content": summary if summary_generated else None,
+                "audio_files": audio_files_data
+            }
+
+            # The response hands out manual_id, and clients fetch it right away
+            # (possibly from another worker), so this row is written before
+            # returning; if it can't be, it's queued and no ID is handed out.
+            # Its scan was queued long before and has normally been flushed.
+            written = await persistence.write_now("manuals", manual_data)
+            manual_id = written["id"] if written else None
+        else:
+            logger.warning(f"Manual for {final_tool_name} was not generated; not storing it")
 
         # Save Assistant Message (Summary + Manual Metadata)
         # We'll save the summary as the content. The frontend can render the manual button/PDF based on context or we can append a link.
@@ -242,17 +299,13 @@ async def generate_tool_manual(
         # So we just store the summary.
         
         assistant_msg_data = {
-            "chat_id": str(chat_id) if chat_id else None,
+            "chat_id": str(chat_id),
             "role": "assistant",
             "content": summary,
             "audio_url": audio_files_data['url'] if audio_files_data else None
         }
         
-        try:
-            supabase_client.table("messages").insert(assistant_msg_data).execute()
-            logger.info("Assistant message saved to chat")
-        except Exception as e:
-            logger.error(f"Failed to save assistant message: {e}")
+        persistence.insert("messages", assistant_msg_data)
 
         return ManualGenerationResponse(
             tool_name=final_tool_name,
@@ -260,7 +313,9 @@ async def generate_tool_manual(
             summary=summary,
             audio_files=audio_files_data,
             timestamp=datetime.now(),
-            session_id=chat_id # Return the session ID
+            session_id=chat_id, # Return the session ID
+            manual_id=manual_id,
+            degraded=deadline.degraded
         )
         
     except HTTPException as e:
@@ -269,3 +324,81 @@ async def generate_tool_manual(
     except Exception as e:
         logger.error(f"Unexpected error in manual generation: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Manual generation error: {str(e)}")
+
+
+@router.get("/manuals")
+async def list_manuals(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    user: dict = Depends(get_current_user),
+    supabase_client: Client = Depends(get_user_supabase_client)
+):
+    """
+    List the current user's stored manuals, newest first (without content).
+    Paginate by passing the ``X-Next-Cursor`` response header back as ``cursor``.
+    """
+    try:
+        query = (
+            supabase_client.table("manuals")
+            .select(MANUAL_LIST_COLUMNS)
+            .eq("user_id", str(user.id))
+        )
+        if since:
+            query = query.gt("created_at", since.isoformat())
+        if cursor:
+            query = query.or_(keyset_filter(cursor, descending=True))
+        res = await run_in_threadpool(
+            query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute
+        )
+        page, next_cursor = split_page(res.data, limit)
+        return conditional_json(request, page, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching manuals: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/manuals/{manual_id}")
+async def get_manual(
+    manual_id: str,
+    request: Request,
+    user: dict = Depends(get_current_user),
+    supabase_client: Client = Depends(get_user_supabase_client)
+):
+    """
+    Fetch a stored manual. Manuals are immutable, so responses are
+    cacheable for a year and revalidated with a strong ETag.
+    """
+    try:
+        uuid.UUID(manual_id)
+    except ValueError:
+        # PostgREST would reject it as an invalid uuid
+        raise HTTPException(status_code=404, detail="Manual not found")
+
+    cache_key = (str(user.id), manual_id)
+    cached = _manual_bodies.get(cache_key)
+    if cached is None:
+        try:
+            res = await run_in_threadpool(
+                supabase_client.table("manuals")
+                .select(MANUAL_COLUMNS)
+                .eq("id", manual_id)
+                .eq("user_id", str(user.id))
+                .limit(1)
+                .execute
+            )
+        except Exception as e:
+            logger.error(f"Error fetching manual {manual_id}: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        if not res.data:
+            raise HTTPException(status_code=404, detail="Manual not found")
+
+        body = encode_json(res.data[0])
+        cached = (body, make_etag(body), gzip.compress(body, compresslevel=6))
+        _manual_bodies.set(cache_key, cached)
+
+    body, etag, compressed = cached
+    return conditional_body(request, body, cache_control=PRIVATE_IMMUTABLE, etag=etag, compressed=compressed)
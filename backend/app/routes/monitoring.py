@@ -0,0 +1,64 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.dependencies import require_monitoring_access
+from app.services.loop_monitor import loop_monitor
+from app.services.metrics import render_metrics
+from app.services.transcription_cache import transcription_cache
+from app.services.tts_cache import tts_cache
+from app.services.usage_tracker import GROUPS, usage_tracker
+
+router = APIRouter(prefix="/api/monitoring", tags=["Monitoring"], dependencies=[Depends(require_monitoring_access)])
+
+# Prometheus scrapes /metrics at the root by convention
+metrics_router = APIRouter(tags=["Monitoring"], dependencies=[Depends(require_monitoring_access)])
+
+
+@router.get("/event-loop")
+async def event_loop_stats(samples: int = 10):
+    """
+    Event-loop lag percentiles, and every stall longer than the blocking
+    threshold grouped by route and by the application line that blocked,
+    with the most recent stack samples.
+    """
+    return loop_monitor.stats(samples=samples)
+
+
+@router.get("/usage")
+async def usage_summary(group_by: str = "user", limit: int = 20, recent: int = 10):
+    """
+    Gemini tokens and estimated cost, in total and grouped by user, route,
+    API key or operation (most expensive first), with prompt-size
+    percentiles per operation and the most recent requests that used Gemini.
+    """
+    if group_by not in GROUPS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(GROUPS)}")
+    return usage_tracker.summary(group_by=group_by, limit=limit, recent=recent)
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus metrics for this worker process: request and per-stage
+    latency histograms, external call counts by outcome, event-loop lag
+    and cache hit counts.
+    """
+    loop = loop_monitor.stats(samples=0)
+    tts = tts_cache.stats()
+    transcription = transcription_cache.stats()
+    extra = [
+        "# HELP toolify_event_loop_lag_seconds Event loop lag over the recent window",
+        "# TYPE toolify_event_loop_lag_seconds gauge",
+        f'toolify_event_loop_lag_seconds{{quantile="0.5"}} {loop["lag_ms"]["p50"] / 1000:g}',
+        f'toolify_event_loop_lag_seconds{{quantile="0.99"}} {loop["lag_ms"]["p99"] / 1000:g}',
+        f'toolify_event_loop_lag_seconds{{quantile="1"}} {loop["lag_ms"]["max"] / 1000:g}',
+        "# HELP toolify_event_loop_stalls_total Times the event loop was blocked past the threshold",
+        "# TYPE toolify_event_loop_stalls_total counter",
+        f"toolify_event_loop_stalls_total {loop['stalls']}",
+        "# HELP toolify_cache_lookups_total Cache lookups by cache and result",
+        "# TYPE toolify_cache_lookups_total counter",
+        f'toolify_cache_lookups_total{{cache="tts",result="hit"}} {tts["hits"]}',
+        f'toolify_cache_lookups_total{{cache="tts",result="miss"}} {tts["misses"]}',
+        f'toolify_cache_lookups_total{{cache="transcription",result="hit"}} {transcription["hits"]}',
+        f'toolify_cache_lookups_total{{cache="transcription",result="miss"}} {transcription["misses"]}',
+    ]
+    return PlainTextResponse(render_metrics(extra), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from app.services.audio_service import audio_service
+from app.services.voice_activity import VoiceActivityDetector
+from app.dependencies import verify_token
+from app.services.persistence_service import persistence, ensure_chat_owner, remember_chat_owner
+from app.services.usage_tracker import usage_tracker
+from app.config import supabase
+from app.lazy import load
+
+try:
+    from langsmith import uuid7
+except ImportError:
+    # Fallback if langsmith not installed
+    import uuid as uuid_module
+    def uuid7():
+        return str(uuid_module.uuid4())
+
+router = APIRouter(prefix="/api", tags=["Voice"])
+
+# Utterances shorter than this are treated as noise
+MIN_UTTERANCE_MS = 250
+
+
+class VoiceSession:
+    """Per-connection conversation state."""
+    def __init__(self, user, chat_id: Optional[str]):
+        self.user = user
+        self.is_new_chat = chat_id is None
+        self.chat_id = chat_id or str(uuid7())
+
+
+@router.websocket("/voice/ws")
+async def voice_conversation(
+    websocket: WebSocket,
+    token: Optional[str] = None,
+    session_id: Optional[str] = None,
+    sample_rate: int = Query(16000, ge=8000, le=48000)
+):
+    """
+    Full-duplex, hands-free voice conversation.
+
+    Browsers cannot set headers on WebSockets, so the Clerk token is passed
+    as the ``token`` query parameter. The client streams 16-bit mono PCM at
+    ``sample_rate`` as binary frames; end of speech is detected on the
+    server (or forced with a ``{"type": "end"}`` text frame). Each utterance
+    is answered in one chat model call, and the reply is sent back as MP3
+    segments while later ones are still being synthesized.
+
+    Server events (text frames): ready, speech_start, transcript, response,
+    audio_end, interrupted, error. Audio segments are sent as binary frames.
+    Speaking while a reply is playing interrupts it.
+    """
+    try:
+        user = await verify_token(token or "")
+    except Exception:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # Replies run in tasks created from here, so they inherit the binding
+    usage_tracker.bind(user.id, websocket.scope["route"].path)
+    if await asyncio.to_thread(usage_tracker.over_budget, user.id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Daily AI usage limit reached")
+        return
+
+    await websocket.accept()
+
+    chat_id = session_id if session_id and len(session_id.replace('-', '')) == 32 else None
+    try:
+        if chat_id and not await ensure_chat_owner(supabase, chat_id, str(user.id)):
+            chat_id = None
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=e.detail)
+        return
+    session = VoiceSession(user, chat_id)
+    vad = VoiceActivityDetector(sample_rate=sample_rate)
+    min_utterance_bytes = int(sample_rate * MIN_UTTERANCE_MS / 1000) * 2
+    reply_task: Optional[asyncio.Task] = None
+
+    await websocket.send_json({"type": "ready", "session_id": session.chat_id})
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            events = []
+            utterance = None
+            if message.get("bytes"):
+                events = vad.feed(message["bytes"])
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    control = None
+                if not isinstance(control, dict):
+                    await websocket.send_json({"type": "error", "detail": "Invalid control message"})
+                    continue
+                if control.get("type") == "end":
+                    utterance = vad.end_utterance()
+
+            for event in events:
+                if event == "speech_start":
+                    # Barge-in: the user talking over a reply cancels it
+                    if reply_task and not reply_task.done():
+                        reply_task.cancel()
+                        await websocket.send_json({"type": "interrupted"})
+                    await websocket.send_json({"type": "speech_start"})
+                elif event == "speech_end":
+                    utterance = vad.take_utterance()
+
+            if utterance is not None and len(utterance) >= min_utterance_bytes:
+                if reply_task and not reply_task.done():
+                    reply_task.cancel()
+                reply_task = asyncio.create_task(_reply(websocket, session, vad.to_wav(utterance)))
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if reply_task and not reply_task.done():
+            reply_task.cancel()
+
+
+async def _reply(websocket: WebSocket, session: VoiceSession, wav_bytes: bytes):
+    """Runs transcription + answer, then streams the synthesized reply."""
+    _chat_chain = await load("app.chains.chat_chain", "_chat_chain")
+
+    started = time.perf_counter()
+    if await asyncio.to_thread(usage_tracker.over_budget, str(session.user.id)):
+        await websocket.send_json({"type": "error", "detail": "Daily AI usage limit reached"})
+        return
+    try:
+        result = await _chat_chain.invoke_voice_chat(wav_bytes, "audio/wav", session.chat_id)
+        await websocket.send_json({"type": "transcript", "text": result.transcript})
+        await websocket.send_json({"type": "response", "text": result.response, "language": result.language})
+
+        first_audio_ms = None
+        # Barge-in cancels this task while a worker thread may be inside the
+        # generator; the event stops it and its pending synthesis from there
+        stop = threading.Event()
+        segments = audio_service.iter_audio_segments(audio_service.clean_text_for_tts(result.response), cancel=stop)
+        try:
+            while True:
+                segment = await asyncio.to_thread(next, segments, None)
+                if segment is None:
+                    break
+                if first_audio_ms is None:
+                    first_audio_ms = round((time.perf_counter() - started) * 1000)
+                await websocket.send_bytes(segment)
+        finally:
+            stop.set()
+            asyncio.get_running_loop().run_in_executor(None, _close_quietly, segments)
+
+        await websocket.send_json({"type": "audio_end", "first_audio_ms": first_audio_ms})
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Voice reply error: {e}")
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+        except Exception:
+            pass
+        return
+
+    # History is saved after the reply so it stays off the latency path
+    _persist_turn(session, result.transcript, result.response)
+
+
+def _close_quietly(generator):
+    try:
+        generator.close()
+    except Exception:
+        # Still running in another thread; it stops on its own once cancelled
+        pass
+
+
+def _persist_turn(session: VoiceSession, transcript: str, response: str):
+    if session.is_new_chat:
+        persistence.insert("chats", {
+            "id": session.chat_id,
+            "user_id": str(session.user.id),
+            "title": transcript[:50] + "...",
+            "scan_id": None
+        })
+        remember_chat_owner(str(session.user.id), session.chat_id)
+        session.is_new_chat = False
+
+    persistence.insert("messages", {"chat_id": session.chat_id, "role": "user", "content": transcript})
+    persistence.insert("messages", {"chat_id": session.chat_id, "role": "assistant", "content": response})
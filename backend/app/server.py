@@ -0,0 +1,228 @@
+"""
+Production entry point: ``python -m app.server`` (from the backend directory).
+
+The parent process imports the app, and with SERVER_PRELOAD the SDKs it
+builds on first use, binds the listening socket and forks the workers, so
+they share those pages copy-on-write and start serving without re-importing
+anything. Each worker runs uvicorn on the shared socket with uvloop and
+httptools when they are installed (``uvicorn[standard]``).
+
+The worker count is WEB_CONCURRENCY when set. Otherwise it is derived from
+the CPUs and memory this container may use and from SERVER_WORKLOAD: "io"
+(mostly waiting on Gemini, Supabase and Tavily) runs two workers per CPU,
+"mixed" one per CPU plus one, "cpu" one per CPU. Workers are capped so that
+SERVER_WORKER_MEMORY_MB each fits in the memory limit. With more than one
+worker and no SHARED_STATE_BACKEND set, the sqlite backend is used so
+workers share key cooldowns, budgets and chat histories (see
+app.services.shared_state).
+
+On SIGTERM or SIGINT the signal is forwarded to every worker. uvicorn
+stops accepting connections, lets in-flight requests finish for up to
+SERVER_DRAIN_TIMEOUT seconds and runs the app's shutdown (flushing queued
+writes). Workers still running after that are killed. A worker that exits
+on its own is replaced.
+"""
+
+import importlib
+import logging
+import math
+import os
+import signal
+import sys
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+from app.config import settings
+
+logger = logging.getLogger("toolify.server")
+
+WORKERS_PER_CPU = {"io": 2.0, "mixed": 1.0, "cpu": 1.0}
+EXTRA_WORKERS = {"io": 0, "mixed": 1, "cpu": 0}
+
+# Deferred by the app (see app.lazy); imported once in the parent instead
+PRELOAD_MODULES = (
+    "app.chains.chat_chain",
+    "app.chains.tool_manual_chain",
+    "langchain_google_genai",
+    "google.genai",
+    "tavily",
+)
+
+
+def cpu_limit() -> int:
+    """CPUs this process may use: the cgroup quota if there is one, else the CPU affinity."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def memory_limit_mb() -> Optional[int]:
+    """Memory this process may use: the cgroup limit if there is one, else physical memory."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            # cgroup v1 reports "no limit" as a huge number
+            if value != "max" and int(value) < 1 << 60:
+                return int(value) // (1024 * 1024)
+        except (OSError, ValueError):
+            pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def worker_count() -> int:
+    if settings.server_workers:
+        return settings.server_workers
+    workload = settings.server_workload if settings.server_workload in WORKERS_PER_CPU else "mixed"
+    workers = int(cpu_limit() * WORKERS_PER_CPU[workload]) + EXTRA_WORKERS[workload]
+    memory = memory_limit_mb()
+    if memory is not None:
+        workers = min(workers, memory // settings.server_worker_memory_mb)
+    return max(1, workers)
+
+
+def make_config(app) -> uvicorn.Config:
+    return uvicorn.Config(
+        app,
+        host=settings.host,
+        port=settings.port,
+        # uvloop and httptools when installed, asyncio and h11 otherwise
+        loop="auto",
+        http="auto",
+        backlog=settings.server_backlog,
+        # Longer than the load balancer's idle timeout, so it never reuses a connection we just closed
+        timeout_keep_alive=settings.server_keepalive,
+        timeout_graceful_shutdown=settings.server_drain_timeout,
+        limit_concurrency=settings.server_limit_concurrency or None,
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        access_log=settings.server_access_log,
+    )
+
+
+class Supervisor:
+    """Forks the workers, replaces those that die and drains them on shutdown."""
+
+    def __init__(self, config: uvicorn.Config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.socket = config.bind_socket()
+        self.children: Dict[int, float] = {}  # pid -> started at
+        self.stopping = False
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGALRM, self._on_deadline)
+        for _ in range(self.workers):
+            self._spawn()
+        logger.info(f"[Server] {self.workers} worker(s) on {settings.host}:{settings.port}")
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            logger.warning(f"[Server] Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; replacing it")
+            # Don't spin if workers die on startup
+            if time.monotonic() - started < 1:
+                time.sleep(1)
+            self._spawn()
+        self.socket.close()
+        return 0
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            # Worker: uvicorn installs its own handlers for a graceful shutdown
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGALRM):
+                signal.signal(sig, signal.SIG_DFL)
+            code = 0
+            try:
+                uvicorn.Server(self.config).run(sockets=[self.socket])
+            except BaseException:
+                logger.exception("[Server] Worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+
+    def _on_stop(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info(f"[Server] Draining {len(self.children)} worker(s) for up to {settings.server_drain_timeout:g}s")
+        for pid in list(self.children):
+            self._signal(pid, signal.SIGTERM)
+        # The app's shutdown gets a few seconds after the drain
+        signal.alarm(int(settings.server_drain_timeout) + 10)
+
+    def _on_deadline(self, signum, frame):
+        for pid in list(self.children):
+            logger.warning(f"[Server] Worker {pid} did not stop in time; killing it")
+            self._signal(pid, signal.SIGKILL)
+
+    @staticmethod
+    def _signal(pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def preload():
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.warning(f"[Server] Could not preload {module}: {e}")
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:     %(message)s")
+    workers = worker_count()
+    if workers > 1 and not os.getenv("SHARED_STATE_BACKEND"):
+        logger.info("[Server] Several workers: sharing state through SQLite (set SHARED_STATE_BACKEND to override)")
+        settings.shared_state_backend = "sqlite"
+
+    started = time.perf_counter()
+    from app.main import app
+    if settings.server_preload:
+        preload()
+    logger.info(f"[Server] App imported in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    config = make_config(app)
+    if workers == 1 or not hasattr(os, "fork"):
+        # Nothing to share, so serve from this process
+        uvicorn.Server(config).run()
+        return 0
+    return Supervisor(config, workers).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
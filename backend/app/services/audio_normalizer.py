@@ -0,0 +1,156 @@
+import asyncio
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import wave
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Speech needs little bandwidth: 16 kHz mono Opus at 24 kbps is well within
+# what Gemini needs for transcription.
+TARGET_SAMPLE_RATE = 16000
+OPUS_BITRATE = "24k"
+SILENCE_THRESHOLD_DB = -45
+SILENCE_FILTER = (
+    f"silenceremove=start_periods=1:start_threshold={SILENCE_THRESHOLD_DB}dB:start_silence=0.1"
+)
+
+# Normalization runs ffmpeg (or CPU-bound WAV processing) off the event loop
+_executor = ThreadPoolExecutor(max_workers=settings.audio_worker_threads, thread_name_prefix="audio-norm")
+
+
+@lru_cache()
+def get_ffmpeg_path() -> Optional[str]:
+    """
+    Locates an ffmpeg binary: FFMPEG_PATH, then PATH, then the binary bundled
+    with the optional imageio-ffmpeg package.
+    """
+    if settings.ffmpeg_path:
+        return settings.ffmpeg_path
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        logger.warning("[NORMALIZE] ffmpeg not found; only WAV uploads will be normalized")
+        return None
+
+
+def normalize_audio(audio_bytes: bytes, mime_type: str) -> Tuple[bytes, str]:
+    """
+    Converts an upload to mono, low sample rate audio with leading and
+    trailing silence trimmed, so its size scales with speech length rather
+    than with the recording's format.
+
+    Returns the normalized bytes and their MIME type, or the original input
+    when normalization is unavailable, fails or would not make it smaller.
+    """
+    base_mime_type = mime_type.split(';')[0].strip()
+    if not audio_bytes or not settings.audio_normalization_enabled:
+        return audio_bytes, base_mime_type
+
+    try:
+        ffmpeg = get_ffmpeg_path()
+        if ffmpeg:
+            normalized, normalized_mime = _normalize_with_ffmpeg(ffmpeg, audio_bytes), "audio/ogg"
+        elif "wav" in base_mime_type:
+            normalized, normalized_mime = _normalize_wav(audio_bytes), "audio/wav"
+        else:
+            return audio_bytes, base_mime_type
+    except Exception as e:
+        logger.warning(f"[NORMALIZE] Falling back to original audio: {str(e)}")
+        return audio_bytes, base_mime_type
+
+    if not normalized or len(normalized) >= len(audio_bytes):
+        return audio_bytes, base_mime_type
+    return normalized, normalized_mime
+
+
+async def normalize_audio_async(audio_bytes: bytes, mime_type: str) -> Tuple[bytes, str]:
+    """Runs normalize_audio in the normalization worker pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, normalize_audio, audio_bytes, mime_type)
+
+
+def _normalize_with_ffmpeg(ffmpeg: str, audio_bytes: bytes) -> bytes:
+    # Containers like m4a keep their index at the end of the file, so read
+    # from a seekable temp file instead of a pipe.
+    with tempfile.NamedTemporaryFile(delete=False) as temp_audio:
+        temp_audio.write(audio_bytes)
+        temp_audio_path = temp_audio.name
+
+    try:
+        result = subprocess.run(
+            [
+                ffmpeg, "-hide_banner", "-loglevel", "error", "-nostdin",
+                "-i", temp_audio_path,
+                "-vn", "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE),
+                # Trim leading silence, reverse, trim again, reverse back
+                "-af", f"{SILENCE_FILTER},areverse,{SILENCE_FILTER},areverse",
+                "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-application", "voip",
+                "-f", "ogg", "pipe:1",
+            ],
+            capture_output=True,
+            timeout=60,
+        )
+    finally:
+        os.unlink(temp_audio_path)
+
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode(errors="ignore").strip() or "ffmpeg failed")
+    return result.stdout
+
+
+def _normalize_wav(audio_bytes: bytes) -> bytes:
+    """Pure-Python fallback for 16-bit PCM WAV when ffmpeg is unavailable."""
+    with wave.open(io.BytesIO(audio_bytes)) as source:
+        channels = source.getnchannels()
+        sample_rate = source.getframerate()
+        if source.getsampwidth() != 2:
+            raise ValueError("Only 16-bit PCM WAV can be normalized without ffmpeg")
+        samples = array("h", source.readframes(source.getnframes()))
+
+    # Downmix to mono
+    if channels > 1:
+        samples = array("h", (
+            sum(samples[i:i + channels]) // channels
+            for i in range(0, len(samples) - channels + 1, channels)
+        ))
+
+    # Resample by averaging the source samples behind each output sample.
+    # The average is a low-pass filter: picking single samples would fold
+    # everything above 8 kHz of a 44.1/48 kHz recording back into speech.
+    if sample_rate > TARGET_SAMPLE_RATE:
+        step = sample_rate / TARGET_SAMPLE_RATE
+        bounds = [int(i * step) for i in range(int(len(samples) / step) + 1)]
+        samples = array("h", (
+            sum(samples[start:end]) // (end - start)
+            for start, end in zip(bounds, bounds[1:])
+        ))
+        sample_rate = TARGET_SAMPLE_RATE
+
+    # Trim leading and trailing samples below the silence threshold
+    threshold = int(32768 * 10 ** (SILENCE_THRESHOLD_DB / 20))
+    start, end = 0, len(samples)
+    while start < end and abs(samples[start]) < threshold:
+        start += 1
+    while end > start and abs(samples[end - 1]) < threshold:
+        end -= 1
+
+    output = io.BytesIO()
+    with wave.open(output, "wb") as target:
+        target.setnchannels(1)
+        target.setsampwidth(2)
+        target.setframerate(sample_rate)
+        target.writeframes(samples[start:end].tobytes())
+    return output.getvalue()
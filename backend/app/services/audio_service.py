@@ -1,17 +1,64 @@
+import io
+import itertools
 import os
+import re
 import tempfile
+import time
+import asyncio
+import contextvars
+import logging
 import requests
-from google import genai
-from datetime import datetime
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
+from typing import Iterator, List, Optional
 from app.config import settings, gemini_client
+from app.services.tts_cache import tts_cache
+from app.services.audio_normalizer import normalize_audio_async
+from app.services.transcription_cache import transcription_cache
+from app.services.cancellation import checkpoint
+from app.services.deadline import Deadline
+from app.services.metrics import external_call
+from app.services.usage_tracker import usage_operation
 
 # Initialize Gemini Client
 client = gemini_client
 
+logger = logging.getLogger(__name__)
+
+TRANSCRIPTION_PROMPT = "Transcribe the following audio exactly as spoken. Do not translate. Return only the transcription."
+INLINE_AUDIO_LIMIT = 15 * 1024 * 1024
+
+# Markdown cleanup for TTS, compiled once (clean_text_for_tts runs for every reply)
+_EMPHASIS_RE = re.compile(r'[\*_]{1,3}')
+_HEADER_RE = re.compile(r'^#+\s*', flags=re.MULTILINE)
+_LINK_RE = re.compile(r'\[([^\]]+)\]\([^\)]+\)')
+_CODE_FENCE_RE = re.compile(r'```[\w]*')
+_BULLET_RE = re.compile(r'^[\*\-]\s+', flags=re.MULTILINE)
+_EXTRA_NEWLINES_RE = re.compile(r'\n{3,}')
+
 
 # YarnGPT API Configuration
-YARNGPT_API_URL = "https://yarngpt.ai/api/v1/tts"
+YARNGPT_API_URL = settings.yarngpt_api_url
+
+# Split after sentence-ending punctuation or at line breaks
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n+')
+
+# How often a cancellable segment stream checks whether it was cancelled
+CANCEL_POLL_SECONDS = 0.05
+
+
+def _strip_id3(segment: bytes) -> bytes:
+    """Removes a leading ID3v2 tag so MP3 segments can be concatenated."""
+    if len(segment) < 10 or segment[:3] != b"ID3":
+        return segment
+    # Tag size is a 28-bit "syncsafe" integer (7 bits per byte)
+    size = 0
+    for byte in segment[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if segment[5] & 0x10 else 0
+    return segment[10 + size + footer:]
+
 
 class AudioService:
     """Service for handling audio operations: TTS and STT"""
@@ -23,94 +70,234 @@ class AudioService:
         """
         Cleans text for TTS generation by removing markdown and normalizing whitespace.
         """
-        import re
-        
         # Remove bold/italic markers (* or _)
-        text = re.sub(r'[\*_]{1,3}', '', text)
+        text = _EMPHASIS_RE.sub('', text)
         
         # Remove headers (### Title -> Title)
-        text = re.sub(r'^#+\s*', '', text, flags=re.MULTILINE)
+        text = _HEADER_RE.sub('', text)
         
         # Remove links ([text](url) -> text)
-        text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
+        text = _LINK_RE.sub(r'\1', text)
         
         # Remove code blocks (```code``` -> code)
-        text = re.sub(r'```[\w]*', '', text)
+        text = _CODE_FENCE_RE.sub('', text)
         
         # Remove inline code (`code` -> code)
-        text = re.sub(r'`', '', text)
+        text = text.replace('`', '')
         
         # Remove list bullets (* Item -> Item, - Item -> Item)
-        text = re.sub(r'^[\*\-]\s+', '', text, flags=re.MULTILINE)
+        text = _BULLET_RE.sub('', text)
         
         # Normalize newlines: replace literal \n with actual newline if needed
         text = text.replace('\\n', '\n')
         
         # Collapse multiple newlines to max 2
-        text = re.sub(r'\n{3,}', '\n\n', text)
+        text = _EXTRA_NEWLINES_RE.sub('\n\n', text)
         
         return text.strip()
 
-    def generate_audio(self, text, tool_name, user_id):
+    def split_text_into_chunks(self, text: str, max_chars: Optional[int] = None) -> List[str]:
+        """
+        Splits cleaned text at sentence boundaries into chunks of at most
+        max_chars characters. Sentences longer than max_chars are split at
+        word boundaries.
+        """
+        max_chars = max_chars or settings.tts_chunk_chars
+        chunks = []
+        current = ""
+
+        for sentence in SENTENCE_BOUNDARY.split(text):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                if cut <= 0:
+                    cut = max_chars
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(sentence[:cut].strip())
+                sentence = sentence[cut:].strip()
+
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _request_speech(self, text: str, voice: Optional[str] = None, timeout: Optional[float] = None) -> requests.Response:
+        """
+        Sends already-cleaned text to YarnGPT and returns the streaming
+        response. Without a timeout (from a deadline), TTS_CONNECT_TIMEOUT
+        and TTS_READ_TIMEOUT apply, so a stalled upstream can't hold a
+        request, or its worker thread, forever.
+        """
+        headers = {
+            "Authorization": f"Bearer {settings.yarngpt_api_key}",
+            "Content-Type": "application/json"
+        }
+
+        # Prepare request to YarnGPT
+        payload = {
+            "text": text,
+            "voice": voice or settings.yarngpt_voice,
+        }
+
+        # Timed to the response headers; the body is streamed by the caller
+        checkpoint("yarngpt", "tts")
+        with external_call("yarngpt", "tts"):
+            response = requests.post(
+                YARNGPT_API_URL, json=payload, headers=headers, stream=True,
+                timeout=timeout or (settings.tts_connect_timeout, settings.tts_read_timeout)
+            )
+
+            if response.status_code != 200:
+                raise Exception(f"YarnGPT API failed: {response.text}")
+
+        return response
+
+    def synthesize(self, text: str, voice: Optional[str] = None, timeout: Optional[float] = None) -> bytes:
+        """Synthesizes already-cleaned text with YarnGPT and returns the MP3 bytes."""
+        response = self._request_speech(text, voice, timeout)
+
+        # Stream to memory
+        audio_buffer = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=8192):
+            audio_buffer.write(chunk)
+
+        return audio_buffer.getvalue()
+
+    def open_audio_stream(self, text: str, voice: Optional[str] = None) -> Iterator[bytes]:
+        """
+        Starts synthesizing cleaned text and returns an iterator over the MP3
+        bytes as they arrive. Upstream errors are raised here, before the
+        first byte is handed to the caller. Long texts are streamed segment
+        by segment through chunked synthesis.
+        """
+        if len(text) > settings.tts_chunk_chars:
+            segments = self.iter_audio_segments(text, voice)
+            first = next(segments, b"")
+            return itertools.chain([first], segments)
+
+        response = self._request_speech(text, voice)
+        return response.iter_content(chunk_size=8192)
+
+    def iter_audio_segments(
+        self,
+        text: str,
+        voice: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> Iterator[bytes]:
+        """
+        Synthesizes cleaned text chunk by chunk and yields the MP3 segments in
+        order. Chunks are synthesized concurrently (at most
+        settings.tts_max_concurrency at a time), so the first segment is
+        yielded as soon as it is ready while later ones are still in flight.
+        With a deadline, waiting for a segment past it raises TimeoutError.
+        Setting ``cancel`` ends the stream and drops the chunks not yet
+        started, even while another thread is waiting inside the generator
+        (where ``close()`` can't reach it).
+        """
+        chunks = self.split_text_into_chunks(text)
+        if not chunks:
+            return
+
+        executor = ThreadPoolExecutor(
+            max_workers=min(settings.tts_max_concurrency, len(chunks)),
+            thread_name_prefix="tts"
+        )
+        try:
+            # Each chunk runs in a copy of this context, so it sees the request's cancellation
+            timeout = deadline.timeout() if deadline else None
+            futures = [
+                executor.submit(contextvars.copy_context().run, self.synthesize, chunk, voice, timeout)
+                for chunk in chunks
+            ]
+            for index, future in enumerate(futures):
+                segment = _wait_for_segment(future, deadline, cancel)
+                if segment is None:
+                    return
+                # Only the first segment keeps its ID3 header so the joined
+                # stream plays as a single file.
+                yield segment if index == 0 else _strip_id3(segment)
+        finally:
+            # Stop pending chunks if the consumer goes away early
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def generate_audio(self, text, tool_name, user_id, voice=None, language="en", chunked=None, deadline: Optional[Deadline] = None):
         """
         Generate audio file from text using YarnGPT and upload to Supabase.
+        Clips are content-addressed by cleaned text, voice and language, so
+        repeated requests for the same text reuse the stored file.
+        Long texts (or chunked=True) are synthesized sentence-chunk by
+        sentence-chunk in parallel and joined in order.
+        With a deadline, returns None instead of a URL when synthesis can't
+        finish in time (a cached clip is still returned).
         """
         try:
             # Clean text before processing
             text = self.clean_text_for_tts(text)
-            
-            # Prepare headers
-            if not settings.yarngpt_api_key:
-                pass
-            
-            headers = {
-                "Authorization": f"Bearer {settings.yarngpt_api_key}",
-                "Content-Type": "application/json"
-            }
-
-            # Prepare request to YarnGPT
-            payload = {
-                "text": text,
-                "voice": "Idera", # Default voice
-            }
-            
-            response = requests.post(YARNGPT_API_URL, json=payload, headers=headers, stream=True)
-            
-            if response.status_code != 200:
-                raise Exception(f"YarnGPT API failed: {response.text}")
-            
-            # Create filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            safe_name = "".join(c if c.isalnum() else "_" for c in tool_name)
-            filename = f"{safe_name}_{timestamp}.mp3"
-            
-            # Stream to memory
-            import io
-            audio_buffer = io.BytesIO()
-            for chunk in response.iter_content(chunk_size=8192):
-                audio_buffer.write(chunk)
-            
-            audio_content = audio_buffer.getvalue()
+            voice = voice or settings.yarngpt_voice
 
-            # Upload to Supabase Storage
-            from app.config import supabase
-            storage_path = f"{user_id}/{filename}"
-            bucket_name = "tool-audio"
-            
+            cache_key = None
+            if settings.tts_cache_enabled:
+                cache_key = tts_cache.make_key(text, voice, language)
+                cached_url = tts_cache.lookup(cache_key)
+                if cached_url:
+                    return cached_url
+
+            if deadline and not deadline.allows(settings.deadline_tts_seconds):
+                deadline.degrade("audio")
+                return None
+
+            if chunked is None:
+                chunked = len(text) > settings.tts_chunk_chars
+
+            if chunked:
+                audio_content = b"".join(self.iter_audio_segments(text, voice, deadline))
+            else:
+                audio_content = self.synthesize(text, voice, deadline.timeout() if deadline else None)
+
+            return self.store_audio(audio_content, tool_name, user_id, cache_key)
+
+        except Exception as e:
+            if deadline and deadline.expired:
+                deadline.degrade("audio")
+                return None
+
+            raise Exception(f"Audio generation error: {str(e)}")
+
+    def store_audio(self, audio_content: bytes, tool_name: str, user_id: str, cache_key: Optional[str] = None) -> str:
+        """Uploads a synthesized clip to Supabase Storage and returns its public URL."""
+        if cache_key:
+            return tts_cache.store(cache_key, audio_content)
+
+        # Create filename
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        safe_name = "".join(c if c.isalnum() else "_" for c in tool_name)
+        filename = f"{safe_name}_{timestamp}.mp3"
+
+        # Upload to Supabase Storage
+        from app.config import supabase
+        storage_path = f"{user_id}/{filename}"
+        bucket_name = "tool-audio"
+
+        with external_call("supabase", "storage_upload"):
             supabase.storage.from_(bucket_name).upload(
                 file=audio_content,
                 path=storage_path,
                 file_options={"content-type": "audio/mp3"}
             )
-            
-            # Get Public URL
-            public_url = supabase.storage.from_(bucket_name).get_public_url(storage_path)
-            
-            return public_url
-            
-        except Exception as e:
 
-            raise Exception(f"Audio generation error: {str(e)}")
+        # Get Public URL
+        return supabase.storage.from_(bucket_name).get_public_url(storage_path)
 
 
     def transcribe_audio(self, audio_bytes: bytes, mime_type: str = "audio/mp3") -> str:
@@ -118,9 +305,6 @@ class AudioService:
         Transcribes audio using the Gemini API.
         Uses inline data for files < 15MB to bypass file upload/polling issues.
         """
-        import logging
-        logger = logging.getLogger(__name__)
-        
         temp_audio_path = None
         uploaded_file_name = None
         
@@ -132,23 +316,24 @@ class AudioService:
             
             # Clean mime_type
             base_mime_type = mime_type.split(';')[0].strip()
-            prompt = "Transcribe the following audio exactly as spoken. Do not translate. Return only the transcription."
+            prompt = TRANSCRIPTION_PROMPT
             
             # --- OPTION 1: Inline Data (for files < 15MB) ---
-            if audio_size < 15 * 1024 * 1024:
+            if audio_size < INLINE_AUDIO_LIMIT:
                 from google.genai import types
                 
                 max_gen_retries = 3
                 response = None
                 for attempt in range(max_gen_retries):
                     try:
-                        response = client.models.generate_content(
-                            model=settings.gemini_model,
-                            contents=[
-                                prompt,
-                                types.Part.from_bytes(data=audio_bytes, mime_type=base_mime_type)
-                            ]
-                        )
+                        with usage_operation("transcription"):
+                            response = client.models.generate_content(
+                                model=settings.gemini_model,
+                                contents=[
+                                    prompt,
+                                    types.Part.from_bytes(data=audio_bytes, mime_type=base_mime_type)
+                                ]
+                            )
                         break
                     except Exception as api_error:
                         if attempt == max_gen_retries - 1:
@@ -160,14 +345,7 @@ class AudioService:
                     return self._process_transcription_response(response)
 
             # --- OPTION 2: File Upload (Fallback or for files >= 15MB) ---
-            ext = ".mp3"
-            if "wav" in base_mime_type: ext = ".wav"
-            elif "ogg" in base_mime_type: ext = ".ogg"
-            elif "m4a" in base_mime_type or "mp4" in base_mime_type: ext = ".m4a"
-            elif "aac" in base_mime_type: ext = ".aac"
-            elif "webm" in base_mime_type: ext = ".webm"
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as temp_audio:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=_audio_extension(base_mime_type)) as temp_audio:
                 temp_audio.write(audio_bytes)
                 temp_audio_path = temp_audio.name
             
@@ -178,7 +356,6 @@ class AudioService:
                 logger.error(f"[TRANSCRIBE] File upload failed: {str(upload_error)}")
                 raise
             
-            import time
             max_wait = 60
             wait_time = 0
             poll_interval = 1
@@ -203,10 +380,11 @@ class AudioService:
             response = None
             for attempt in range(max_gen_retries):
                 try:
-                    response = client.models.generate_content(
-                        model=settings.gemini_model,
-                        contents=[prompt, uploaded_file]
-                    )
+                    with usage_operation("transcription"):
+                        response = client.models.generate_content(
+                            model=settings.gemini_model,
+                            contents=[prompt, uploaded_file]
+                        )
                     break
                 except Exception as api_error:
                     if attempt == max_gen_retries - 1: raise
@@ -227,6 +405,87 @@ class AudioService:
                 try: os.unlink(temp_audio_path)
                 except: pass
 
+    async def transcribe_audio_async(self, audio_bytes: bytes, mime_type: str = "audio/mp3") -> str:
+        """
+        Non-blocking variant of transcribe_audio for use inside async routes.
+        The upload is first normalized in a worker pool (mono, 16 kHz,
+        silence trimmed), Gemini calls run in threads and retries back off
+        with asyncio.sleep, so the event loop is never held.
+        Re-uploads of the same audio are answered from the transcription cache.
+        """
+        if not audio_bytes:
+            logger.error("[TRANSCRIBE] Audio bytes are empty")
+            return ""
+
+        # Exact retries hit on the raw bytes without normalizing again
+        raw_key = transcription_cache.make_key(audio_bytes, mime_type)
+        cached = transcription_cache.get(raw_key, record_miss=False)
+        if cached is not None:
+            return cached
+
+        audio_bytes, base_mime_type = await normalize_audio_async(audio_bytes, mime_type)
+        with usage_operation("transcription"):
+            transcript = await transcription_cache.get_or_transcribe(
+                transcription_cache.make_key(audio_bytes, base_mime_type),
+                lambda: self._transcribe_normalized(audio_bytes, base_mime_type)
+            )
+        transcription_cache.set(raw_key, transcript)
+        return transcript
+
+    async def _transcribe_normalized(self, audio_bytes: bytes, base_mime_type: str) -> str:
+        uploaded_file_name = None
+        temp_audio_path = None
+
+        try:
+            prompt = TRANSCRIPTION_PROMPT
+
+            # --- OPTION 1: Inline Data (for files < 15MB) ---
+            if len(audio_bytes) < INLINE_AUDIO_LIMIT:
+                from google.genai import types
+
+                contents = [prompt, types.Part.from_bytes(data=audio_bytes, mime_type=base_mime_type)]
+                try:
+                    response = await _retry_async(
+                        lambda: client.models.generate_content(model=settings.gemini_model, contents=contents)
+                    )
+                    return self._process_transcription_response(response)
+                except Exception as api_error:
+                    logger.error(f"[TRANSCRIBE] Inline generation failed: {str(api_error)}")
+
+            # --- OPTION 2: File Upload (Fallback or for files >= 15MB) ---
+            with tempfile.NamedTemporaryFile(delete=False, suffix=_audio_extension(base_mime_type)) as temp_audio:
+                temp_audio.write(audio_bytes)
+                temp_audio_path = temp_audio.name
+
+            uploaded_file = await asyncio.to_thread(client.files.upload, file=temp_audio_path)
+            uploaded_file_name = uploaded_file.name
+
+            max_wait = 60
+            poll_interval = 1
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + max_wait
+            while uploaded_file.state.name != "ACTIVE":
+                if loop.time() >= deadline:
+                    raise Exception(f"File processing timeout after {max_wait}s")
+                await asyncio.sleep(poll_interval)
+                uploaded_file = await _retry_async(lambda: client.files.get(name=uploaded_file_name))
+
+            response = await _retry_async(
+                lambda: client.models.generate_content(model=settings.gemini_model, contents=[prompt, uploaded_file])
+            )
+            return self._process_transcription_response(response)
+
+        except Exception as e:
+            logger.error(f"[TRANSCRIBE] Fatal error: {str(e)}")
+            return ""
+        finally:
+            if uploaded_file_name:
+                try: await asyncio.to_thread(client.files.delete, name=uploaded_file_name)
+                except Exception: pass
+            if temp_audio_path and os.path.exists(temp_audio_path):
+                try: os.unlink(temp_audio_path)
+                except Exception: pass
+
     def _process_transcription_response(self, response) -> str:
         """Helper to extract text from Gemini response."""
         try:
@@ -239,4 +498,39 @@ class AudioService:
             return ""
 
 
+def _wait_for_segment(future: Future, deadline: Optional[Deadline], cancel: Optional[threading.Event]) -> Optional[bytes]:
+    """A chunk's MP3 once synthesized, or None if cancel is set first."""
+    if cancel is None:
+        return future.result(timeout=deadline.remaining() if deadline else None)
+    while not cancel.is_set():
+        timeout = min(CANCEL_POLL_SECONDS, deadline.remaining()) if deadline else CANCEL_POLL_SECONDS
+        done, _ = wait([future], timeout=timeout)
+        if done:
+            return future.result()
+        if deadline and deadline.expired:
+            raise TimeoutError("TTS segment not ready before the deadline")
+    return None
+
+
+def _audio_extension(base_mime_type: str) -> str:
+    """Maps an audio MIME type to a file extension for Gemini file uploads."""
+    if "wav" in base_mime_type: return ".wav"
+    if "ogg" in base_mime_type: return ".ogg"
+    if "m4a" in base_mime_type or "mp4" in base_mime_type: return ".m4a"
+    if "aac" in base_mime_type: return ".aac"
+    if "webm" in base_mime_type: return ".webm"
+    return ".mp3"
+
+
+async def _retry_async(call, attempts: int = 3):
+    """Runs a blocking call in a thread, retrying with non-blocking exponential backoff."""
+    for attempt in range(attempts):
+        try:
+            return await asyncio.to_thread(call)
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            await asyncio.sleep(2 ** attempt)
+
+
 audio_service = AudioService()
@@ -0,0 +1,145 @@
+"""
+Cooperative cancellation of a request's pipeline when its client goes away.
+
+A route opts in with the ``cancel_on_disconnect`` dependency, which binds a
+``CancelScope`` to the request's context and watches the connection. Once
+the client disconnects, the next ``checkpoint()`` raises RequestCancelled
+instead of starting another Gemini, Tavily, YouTube or YarnGPT call. The
+context is copied into ``run_in_threadpool`` workers, so checkpoints in sync
+code see the scope too. A call already in flight finishes, since the sync
+SDKs can't be interrupted, and the pipeline stops at the next checkpoint.
+The route then answers 499 (client closed request) without writing its
+result rows.
+
+RequestCancelled derives from BaseException, like asyncio.CancelledError,
+so the pipeline's broad ``except Exception`` fallbacks don't swallow it.
+
+Work shared with other callers, such as a transcription deduplicated by
+the transcription cache, calls ``detach()`` first. It then completes
+for the callers still waiting on it, and its result is cached.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+from typing import List, Optional
+from fastapi import HTTPException, Request
+from app.services.metrics import REGISTRY, Counter, recorded_stages, stage_duration
+from app.services.usage_tracker import usage_tracker
+
+logger = logging.getLogger(__name__)
+
+# 499 is nginx's "client closed request"; the client never sees it
+CLIENT_CLOSED_REQUEST = 499
+
+cancelled_requests = Counter(
+    "toolify_cancelled_requests_total", "Requests stopped because the client disconnected", ("route",)
+)
+cancelled_calls = Counter(
+    "toolify_cancelled_calls_total", "External calls not made because the client had disconnected", ("service", "operation")
+)
+skipped_stages = Counter(
+    "toolify_cancelled_stages_total", "Pipeline stages skipped because the client disconnected", ("stage",)
+)
+saved_stage_seconds = Counter(
+    "toolify_cancelled_saved_seconds_total", "Estimated time of skipped stages, from their mean latency", ("stage",)
+)
+saved_gemini_tokens = Counter(
+    "toolify_cancelled_saved_gemini_tokens_total", "Estimated Gemini tokens of skipped stages, from their mean usage", ("stage",)
+)
+REGISTRY.extend([cancelled_requests, cancelled_calls, skipped_stages, saved_stage_seconds, saved_gemini_tokens])
+
+_current: contextvars.ContextVar[Optional["CancelScope"]] = contextvars.ContextVar("cancel_scope", default=None)
+
+
+class RequestCancelled(BaseException):
+    """Raised at a checkpoint once the request's client has disconnected."""
+
+
+class CancelScope:
+    """Cancellation state of one request, shared by its task and worker threads."""
+
+    def __init__(self, route: str):
+        self.route = route
+        self.reason: Optional[str] = None
+        self.expected: List[str] = []
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str):
+        if not self.cancelled:
+            self.reason = reason
+            self._event.set()
+
+    def expect(self, *stages: str):
+        """Declares the pipeline stages this request will run, to estimate what a disconnect saves."""
+        self.expected.extend(stages)
+
+    async def watch(self, receive):
+        # The body has been read, so the next message is the disconnect
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                self.cancel("client disconnected")
+                return
+
+    def record(self):
+        """Counts the cancelled request and estimates the stages it didn't run."""
+        cancelled_requests.inc(self.route)
+        started = set(recorded_stages())
+        skipped = [name for name in self.expected if name not in started]
+        seconds = 0.0
+        for name in skipped:
+            skipped_stages.inc(name)
+            mean = stage_duration.mean(name)
+            if mean:
+                saved_stage_seconds.inc(name, amount=mean)
+                seconds += mean
+            # Gemini stages are labelled with the same name as their usage operation
+            tokens = usage_tracker.mean_tokens(name)
+            if tokens:
+                saved_gemini_tokens.inc(name, amount=tokens)
+        logger.info(
+            f"[Cancel] {self.route}: {self.reason}; skipped {', '.join(skipped) or 'no stages'}"
+            f" (~{seconds:.1f}s of upstream work)"
+        )
+
+
+def checkpoint(service: str, operation: str = "call"):
+    """Raises RequestCancelled instead of starting an external call for a client that has gone."""
+    scope = _current.get()
+    if scope is not None and scope.cancelled:
+        cancelled_calls.inc(service, operation)
+        raise RequestCancelled(f"{service} {operation} skipped: {scope.reason}")
+
+
+def detach():
+    """
+    Takes the current context out of its request's cancellation. Work
+    shared with other callers calls this first, since it inherits the
+    context of whichever request started it.
+    """
+    _current.set(None)
+
+
+async def cancel_on_disconnect(request: Request):
+    """
+    Dependency that cancels the request's pipeline when its client
+    disconnects: ``scope: CancelScope = Depends(cancel_on_disconnect)``.
+    """
+    route = getattr(request.scope.get("route"), "path", request.url.path)
+    scope = CancelScope(route)
+    token = _current.set(scope)
+    watcher = asyncio.create_task(scope.watch(request.receive))
+    try:
+        yield scope
+    except RequestCancelled:
+        scope.record()
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    finally:
+        watcher.cancel()
+        _current.reset(token)
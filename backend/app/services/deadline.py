@@ -0,0 +1,68 @@
+"""
+Overall time budget of a manual generation request.
+
+The route starts a ``Deadline`` (MANUAL_DEADLINE_SECONDS, kept under the
+proxy's timeout) and passes it down to perform_tool_research, the manual
+chain and AudioService. Each stage gets ``deadline.until(reserve)``, a
+deadline that ends early enough to leave ``reserve`` seconds for the
+stages after it. A stage that is short of time degrades instead of
+overrunning: YouTube transcripts are skipped, the manual is shortened,
+and the summary or the audio is dropped. Calls are given timeouts from
+the time left, so a slow upstream can't push the request past the
+deadline either. Everything skipped is collected in ``degraded`` and
+returned with the response.
+"""
+
+import copy
+import logging
+import threading
+import time
+from typing import List
+from app.services.metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+degradations = Counter(
+    "toolify_deadline_degradations_total", "Parts of a response skipped or shortened to meet its deadline", ("part",)
+)
+REGISTRY.append(degradations)
+
+
+class Deadline:
+    """A point in time work has to be done by, and what was skipped to get there."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+        self.degraded: List[str] = []
+        self._lock = threading.Lock()
+
+    def until(self, reserve: float) -> "Deadline":
+        """A deadline ``reserve`` seconds earlier, for a stage that other stages follow."""
+        # Shallow copy: what the stage skips is recorded in the same list
+        earlier = copy.copy(self)
+        earlier.expires_at = self.expires_at - reserve
+        return earlier
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def allows(self, seconds: float) -> bool:
+        """Whether a step expected to take ``seconds`` still fits."""
+        return self.remaining() >= seconds
+
+    def timeout(self, floor: float = 1.0) -> float:
+        """Timeout for a call that has to finish within the deadline; at least ``floor``, so it can still try."""
+        return max(floor, self.remaining())
+
+    def degrade(self, part: str):
+        """Records that ``part`` of the response was skipped or shortened."""
+        with self._lock:
+            if part in self.degraded:
+                return
+            self.degraded.append(part)
+        degradations.inc(part)
+        logger.info(f"[Deadline] Degraded {part} with {self.remaining():.1f}s left")
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+import httpx
+from jwt.algorithms import RSAAlgorithm
+from app.config import settings
+from app.services.metrics import external_call
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSManager:
+    """
+    Keeps Clerk's signing keys parsed and ready, keyed by ``kid``.
+
+    Keys are fetched with an async HTTP client and parsed once per refresh,
+    so verifying a token never blocks the event loop or re-parses a JWK.
+    Once the key set is older than ``ttl`` it is still served while a
+    background refresh runs (stale-while-revalidate). An unknown ``kid``,
+    e.g. after Clerk rotates keys, triggers an immediate refresh. Refreshes
+    are single-flight and at most one every ``min_refresh_interval``
+    seconds, so tokens with made-up kids can't hammer the endpoint.
+    """
+
+    def __init__(self, jwks_url: str, ttl: float = 3600, min_refresh_interval: float = 30, timeout: float = 5):
+        self.jwks_url = jwks_url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys: Dict[str, Any] = {}
+        self._fetched_at = 0.0
+        self._last_attempt = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+
+    @property
+    def kids(self):
+        return list(self._keys)
+
+    def has_key(self, kid: Optional[str]) -> bool:
+        """Whether kid is in the current key set (False once a key is rotated out)."""
+        return kid in self._keys
+
+    async def get_key(self, kid: Optional[str]):
+        """Returns the parsed public key for kid, refreshing the set if kid is unknown."""
+        key = self._keys.get(kid)
+        if key is not None:
+            if time.monotonic() - self._fetched_at > self.ttl:
+                self._schedule_refresh()
+            return key
+
+        await self.refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            raise Exception("Public key not found in JWKS")
+        return key
+
+    async def refresh(self):
+        """Refreshes the key set unless rate-limited; concurrent callers share one fetch."""
+        task = self._schedule_refresh()
+        if task is not None:
+            await asyncio.shield(task)
+
+    def _schedule_refresh(self) -> Optional[asyncio.Task]:
+        if self._refresh_task and not self._refresh_task.done():
+            return self._refresh_task
+        # Without any keys nothing can be verified, so don't wait out the interval
+        if self._keys and time.monotonic() - self._last_attempt < self.min_refresh_interval:
+            return None
+        self._last_attempt = time.monotonic()
+        self._refresh_task = asyncio.ensure_future(self._fetch())
+        return self._refresh_task
+
+    async def _fetch(self):
+        try:
+            with external_call("clerk", "jwks"):
+                async with httpx.AsyncClient(timeout=self.timeout) as client:
+                    response = await client.get(self.jwks_url)
+                    response.raise_for_status()
+                    jwks = response.json()
+        except Exception as e:
+            # Keep serving the keys we have
+            logger.warning(f"[JWKS] Refresh failed: {e}")
+            return
+
+        keys = {}
+        for jwk in jwks.get("keys", []):
+            if jwk.get("kty") != "RSA" or "kid" not in jwk:
+                continue
+            try:
+                keys[jwk["kid"]] = RSAAlgorithm.from_jwk(jwk)
+            except Exception as e:
+                logger.warning(f"[JWKS] Skipping key {jwk.get('kid')}: {e}")
+
+        if keys:
+            # Swapped in one assignment; readers never see a partial set
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            self.refreshes += 1
+            logger.info(f"[JWKS] Loaded {len(keys)} key(s): {', '.join(keys)}")
+
+
+jwks_manager = JWKSManager(
+    jwks_url=settings.clerk_jwks_url,
+    ttl=settings.jwks_cache_ttl,
+    min_refresh_interval=settings.jwks_min_refresh_interval
+)
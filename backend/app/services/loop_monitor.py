@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, List, Optional
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Stack frames from these files are plumbing, not the code holding the loop
+_PLUMBING = ("/asyncio/", "/starlette/", "/fastapi/", "/anyio/", "/uvicorn/", "/contextlib.py", "/threading.py")
+
+
+class LoopMonitor:
+    """
+    Measures event-loop lag and catches code that blocks the loop.
+
+    A heartbeat coroutine sleeps ``interval`` seconds and records how late
+    it wakes up; that delay is the time every other coroutine had to wait.
+    A watchdog thread watches the heartbeat. If it stops for longer than
+    ``threshold`` the loop is blocked, and the watchdog snapshots the loop
+    thread's stack with ``sys._current_frames``. The snapshot is attributed
+    to a route through the ASGI ``scope`` found in the stack's locals.
+    Stalls are logged and summarized in ``stats()``.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1, max_samples: int = 50):
+        self.interval = interval
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._lags = deque(maxlen=600)
+        self._samples = deque(maxlen=max_samples)
+        self._routes: Dict[str, dict] = {}
+        self._pending: Optional[dict] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+        self.stalls = 0
+        self.blocked_seconds = 0.0
+        self.max_lag = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Starts monitoring the running event loop."""
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled - self.interval)
+            self._last_beat = time.monotonic()
+            with self._lock:
+                self._lags.append(lag)
+                self.max_lag = max(self.max_lag, lag)
+                pending, self._pending = self._pending, None
+                if pending is not None:
+                    self._finish_stall(pending, lag)
+
+    def _watch(self):
+        poll = max(self.threshold / 4, 0.005)
+        while not self._stop.wait(poll):
+            stalled_for = time.monotonic() - self._last_beat - self.interval
+            if stalled_for < self.threshold or self._pending is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            sample = {
+                "route": _attribute(frame),
+                "started_at": time.time() - stalled_for,
+                "stack": [f"{f.filename}:{f.lineno} in {f.name}" for f in stack[-25:]],
+                "culprit": _culprit(stack),
+            }
+            del frame
+            with self._lock:
+                # Re-check: the heartbeat may have resumed meanwhile
+                if time.monotonic() - self._last_beat - self.interval >= self.threshold:
+                    self._pending = sample
+
+    def _finish_stall(self, sample: dict, lag: float):
+        sample["blocked_ms"] = round(lag * 1000, 1)
+        self.stalls += 1
+        self.blocked_seconds += lag
+        route = self._routes.setdefault(sample["route"], {"stalls": 0, "blocked_ms": 0.0, "max_ms": 0.0, "culprits": {}})
+        route["stalls"] += 1
+        route["blocked_ms"] += sample["blocked_ms"]
+        route["max_ms"] = max(route["max_ms"], sample["blocked_ms"])
+        route["culprits"][sample["culprit"]] = route["culprits"].get(sample["culprit"], 0) + 1
+        self._samples.append(sample)
+        logger.warning(
+            f"[LOOP] Event loop blocked for {sample['blocked_ms']:.0f} ms in {sample['route']} at {sample['culprit']}\n"
+            + "\n".join(f"    {line}" for line in sample["stack"][-10:])
+        )
+
+    def stats(self, samples: int = 10) -> dict:
+        with self._lock:
+            lags = sorted(self._lags)
+            return {
+                "running": self.running,
+                "interval_ms": self.interval * 1000,
+                "threshold_ms": self.threshold * 1000,
+                "lag_ms": {
+                    "current": round(self._lags[-1] * 1000, 2) if self._lags else 0.0,
+                    "p50": _percentile_ms(lags, 0.5),
+                    "p99": _percentile_ms(lags, 0.99),
+                    "max": round(self.max_lag * 1000, 2),
+                },
+                "stalls": self.stalls,
+                "blocked_ms_total": round(self.blocked_seconds * 1000, 1),
+                "routes": {
+                    name: {**route, "blocked_ms": round(route["blocked_ms"], 1)}
+                    for name, route in sorted(self._routes.items(), key=lambda item: -item[1]["blocked_ms"])
+                },
+                "recent": list(self._samples)[-samples:] if samples else [],
+            }
+
+
+def _attribute(frame) -> str:
+    """Finds the route of the request whose code is running, via the ASGI scope in the stack."""
+    outermost = None
+    while frame is not None:
+        scope = frame.f_locals.get("scope")
+        if isinstance(scope, dict) and scope.get("type") in ("http", "websocket"):
+            route = scope.get("route")
+            path = getattr(route, "path", None) or scope.get("path", "?")
+            method = scope.get("method", "WS")
+            return f"{method} {path}"
+        if not any(part in frame.f_code.co_filename for part in _PLUMBING):
+            outermost = getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+        frame = frame.f_back
+    return f"background: {outermost or 'unknown'}"
+
+
+def _culprit(stack: List[traceback.FrameSummary]) -> str:
+    """The innermost frame in application code: where the blocking call was made."""
+    for entry in reversed(stack):
+        if "/app/" in entry.filename and "site-packages" not in entry.filename:
+            return f"{entry.filename.split('/app/', 1)[1]}:{entry.lineno} in {entry.name}"
+    last = stack[-1]
+    return f"{last.filename}:{last.lineno} in {last.name}"
+
+
+def _percentile_ms(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+
+loop_monitor = LoopMonitor(
+    interval=settings.loop_monitor_interval,
+    threshold=settings.loop_block_threshold
+)
@@ -0,0 +1,223 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# (stage, milliseconds) recorded while handling the current request
+_request_stages: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_stages", default=None
+)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (+Inf last), sum]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def mean(self, *label_values) -> Optional[float]:
+        """Mean of the values observed for these labels, or None if there are none."""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                return None
+            count = sum(series[0])
+            return series[1] / count if count else None
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {total:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+http_request_duration = Histogram(
+    "toolify_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+stage_duration = Histogram(
+    "toolify_stage_duration_seconds", "Pipeline stage latency", ("stage",)
+)
+external_call_duration = Histogram(
+    "toolify_external_call_duration_seconds", "Latency of calls to external services", ("service", "operation")
+)
+external_calls = Counter(
+    "toolify_external_calls_total", "Calls to external services by outcome", ("service", "operation", "outcome")
+)
+
+REGISTRY = [http_request_duration, stage_duration, external_call_duration, external_calls]
+
+
+def _observe_stage(name: str, started: float):
+    elapsed = time.perf_counter() - started
+    stage_duration.observe(elapsed, name)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((name, elapsed * 1000))
+
+
+@contextmanager
+def _timed_stage(name: str):
+    started = time.perf_counter()
+    # Failed stages are timed; cancelled ones (BaseException) didn't run to the end and aren't
+    try:
+        yield
+    except Exception:
+        _observe_stage(name, started)
+        raise
+    else:
+        _observe_stage(name, started)
+
+
+def stage(name: str):
+    """
+    Times a pipeline stage: ``with stage("research"): ...``.
+
+    The duration goes into the stage histogram and into the current
+    request's Server-Timing header. When metrics are disabled this returns
+    a shared no-op context manager.
+    """
+    if not settings.metrics_enabled:
+        return _NOOP
+    return _timed_stage(name)
+
+
+@contextmanager
+def _timed_call(service: str, operation: str):
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        external_call_duration.observe(time.perf_counter() - started, service, operation)
+        external_calls.inc(service, operation, outcome)
+
+
+def external_call(service: str, operation: str = "call"):
+    """Counts and times a call to an external service; exceptions count as errors."""
+    if not settings.metrics_enabled:
+        return _NOOP
+    return _timed_call(service, operation)
+
+
+def recorded_stages() -> List[str]:
+    """Names of the stages timed so far while handling the current request."""
+    stages = _request_stages.get()
+    return [name for name, _ in stages] if stages else []
+
+
+def detach_request():
+    """
+    Stops the current context from recording into a request's Server-Timing.
+    Long-lived tasks created while handling a request inherit its context,
+    so they call this first.
+    """
+    _request_stages.set(None)
+
+
+_NOOP = nullcontext()
+
+
+class TimingMiddleware:
+    """
+    Pure ASGI middleware that collects the stages timed while handling a
+    request, adds them as a ``Server-Timing`` header and records the
+    request latency per route. Server-Timing can only cover what ran
+    before the response started; the latency histogram covers the whole
+    response, streamed bodies included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        stages: List[Tuple[str, float]] = []
+        token = _request_stages.set(stages)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                total_ms = (time.perf_counter() - started) * 1000
+                entries = [f"{name};dur={ms:.1f}" for name, ms in stages] + [f"total;dur={total_ms:.1f}"]
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"server-timing", ", ".join(entries).encode("latin-1"))
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stages.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_request_duration.observe(time.perf_counter() - started, scope.get("method", ""), path, status_code)
+
+
+def render_metrics(extra_lines: Optional[List[str]] = None) -> str:
+    """Prometheus text exposition of this process's metrics."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines or [])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,413 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from fastapi import HTTPException
+from app.config import settings
+from app.services.shared_state import SharedCache
+from app.services.metrics import detach_request, external_call, stage
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows, where the app runs as a single process anyway
+    fcntl = None
+
+try:
+    from langsmith import uuid7
+except ImportError:
+    # Fallback if langsmith not installed
+    import uuid as uuid_module
+    def uuid7():
+        return str(uuid_module.uuid4())
+
+logger = logging.getLogger(__name__)
+
+# Parents are written before children so foreign keys resolve within a flush
+TABLE_ORDER = ["research_blobs", "scans", "chats", "messages", "manuals"]
+
+
+def new_id() -> str:
+    """Client-side row ID (UUID v7, time-ordered and LangSmith compatible)."""
+    return str(uuid7())
+
+
+class WriteBehindQueue:
+    """
+    Write-behind persistence for chat, scan and manual rows.
+
+    Routes enqueue rows with client-generated IDs and return immediately;
+    a background task flushes them every ``flush_interval`` seconds as one
+    batched insert per table (in foreign-key order), followed by queued
+    updates. Inserts are idempotent upserts on ``id``, so retries are safe.
+    Writes that still fail after ``max_retries`` are appended to a local
+    spool file. The spool is replayed on start, and retried every
+    ``spool_retry_interval`` seconds (doubling while writes keep failing,
+    up to ``spool_retry_max``) once a flush has gone through again.
+    A batch the database rejects (a constraint, type or schema error) is
+    retried row by row instead: the rows it still rejects are set aside in
+    ``<spool>.rejected``, and the rest of the queue keeps flowing.
+    ``stop`` flushes everything on graceful shutdown.
+
+    Writes use the service-role client; callers are responsible for
+    ownership checks (see ``ensure_chat_owner``).
+    """
+
+    def __init__(
+        self,
+        spool_path: str,
+        flush_interval: float = 0.25,
+        batch_size: int = 100,
+        max_retries: int = 3,
+        spool_retry_interval: float = 5.0,
+        spool_retry_max: float = 300.0
+    ):
+        self.spool_path = spool_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.spool_retry_interval = spool_retry_interval
+        self.spool_retry_max = spool_retry_max
+        self._spool_backoff = 0.0
+        self._spool_retry_at = 0.0
+        self._stale_replay_logged = False
+        self._inserts: Dict[str, List[dict]] = defaultdict(list)
+        self._updates: List[dict] = []
+        self._listeners: Dict[str, List[Callable[[List[dict]], None]]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def insert(self, table: str, row: dict) -> dict:
+        """Queues a row for insertion and returns it with its generated ID."""
+        row = _stamp(row)
+        self._enqueue(table, row)
+        return row
+
+    async def write_now(self, table: str, row: dict) -> Optional[dict]:
+        """
+        Writes one row right away (in a worker thread, once, without
+        flushing the queue) for callers that hand out its ID. Returns the
+        row once written; if the write fails, the row is queued like any
+        other and None is returned.
+        """
+        row = _stamp(row)
+        op = {"op": "insert", "table": table, "rows": [row]}
+        try:
+            await asyncio.to_thread(_execute, op)
+        except Exception as e:
+            logger.warning(f"[PERSIST] Direct insert on {table} failed, queueing it: {e}")
+            self._enqueue(table, row)
+            return None
+        self._written(op)
+        return row
+
+    def _enqueue(self, table: str, row: dict):
+        with self._lock:
+            self._inserts[table].append(row)
+            pending = sum(len(rows) for rows in self._inserts.values())
+        self._ensure_started()
+        if pending >= self.batch_size:
+            self._wake()
+
+    def update(self, table: str, values: dict, match: dict):
+        """Queues an update applied after the pending inserts."""
+        with self._lock:
+            self._updates.append({"table": table, "values": values, "match": match})
+        self._ensure_started()
+
+    def on_written(self, table: str, callback: Callable[[List[dict]], None]):
+        """Calls callback with the rows of every insert into table once they are in the database."""
+        self._listeners[table].append(callback)
+
+    async def start(self):
+        """Replays spooled writes and starts the background flusher."""
+        self._replay_spool()
+        self._ensure_started()
+
+    async def stop(self):
+        """Stops the flusher and writes out everything still queued."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> bool:
+        """Writes all queued operations, spooling whatever keeps failing. Returns False if anything was spooled."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            with self._lock:
+                inserts, self._inserts = self._inserts, defaultdict(list)
+                updates, self._updates = self._updates, []
+
+            ops = []
+            for table in sorted(inserts, key=lambda t: TABLE_ORDER.index(t) if t in TABLE_ORDER else len(TABLE_ORDER)):
+                for rows in _group_by_columns(inserts[table]):
+                    for start in range(0, len(rows), self.batch_size):
+                        ops.append({"op": "insert", "table": table, "rows": rows[start:start + self.batch_size]})
+            ops.extend({"op": "update", **update} for update in updates)
+            if not ops:
+                return True
+
+            with stage("db_flush"):
+                for index, op in enumerate(ops):
+                    error = await self._execute_with_retries(op)
+                    if error is None:
+                        self._written(op)
+                        continue
+                    if not _is_rejected(error):
+                        # Supabase is unavailable: keep this write and everything after it in order
+                        self._spool(ops[index:])
+                        return False
+
+                    # One bad row fails its whole batch; write the others one by one
+                    rejected = []
+                    rows = op["rows"] if op["op"] == "insert" and len(op["rows"]) > 1 else None
+                    for position, row in enumerate(rows or ()):
+                        single = {**op, "rows": [row]}
+                        error = await self._execute_with_retries(single)
+                        if error is None:
+                            self._written(single)
+                        elif _is_rejected(error):
+                            rejected.append(single)
+                        else:
+                            self._reject(rejected)
+                            self._spool([{**op, "rows": rows[position:]}] + ops[index + 1:])
+                            return False
+                    self._reject(rejected if rows else [op])
+            return True
+
+    async def _execute_with_retries(self, op: dict) -> Optional[Exception]:
+        """Runs op, retrying while Supabase is unavailable; returns the last error, or None once written."""
+        for attempt in range(self.max_retries):
+            try:
+                await asyncio.to_thread(_execute, op)
+                return None
+            except Exception as e:
+                logger.warning(f"[PERSIST] {op['op']} on {op['table']} failed (attempt {attempt + 1}/{self.max_retries}): {e}")
+                if _is_rejected(e):
+                    # Retrying won't change the database's answer
+                    return e
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                error = e
+        return error
+
+    def _written(self, op: dict):
+        if op["op"] == "insert":
+            for callback in self._listeners.get(op["table"], ()):
+                callback(op["rows"])
+
+    async def _run(self):
+        # Started from whichever request enqueued first; don't time into it
+        detach_request()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                written = await self.flush()
+            except Exception as e:
+                logger.error(f"[PERSIST] Flush failed: {e}")
+                continue
+            self._retry_spool(written)
+
+    def _retry_spool(self, written: bool):
+        """Puts spooled writes back in the queue once Supabase takes writes again, backing off while it doesn't."""
+        now = time.monotonic()
+        if not written:
+            self._spool_backoff = min(self.spool_retry_max, self._spool_backoff * 2 or self.spool_retry_interval)
+            self._spool_retry_at = now + self._spool_backoff
+            logger.warning(f"[PERSIST] Retrying spooled writes in {self._spool_backoff:g}s")
+        elif not os.path.exists(self.spool_path):
+            self._spool_backoff = 0.0
+        elif now >= self._spool_retry_at and self._replay_spool():
+            self._wake()
+
+    def _ensure_started(self):
+        if self._task and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No loop in this thread (e.g. called from a worker thread); the
+            # flusher picks the rows up once it runs.
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    def _wake(self):
+        if self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    @contextmanager
+    def _spool_lock(self):
+        """
+        Holds an exclusive lock on the spool. Every worker process of the
+        launcher (app.server) spools to and replays from the same file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.spool_path)), exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.spool_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _spool(self, ops: List[dict]):
+        with self._spool_lock():
+            with open(self.spool_path, "a", encoding="utf-8") as spool:
+                for op in ops:
+                    spool.write(json.dumps(op, default=str) + "\n")
+        logger.error(f"[PERSIST] Spooled {len(ops)} write(s) to {self.spool_path}")
+
+    def _reject(self, ops: List[dict]):
+        """Sets aside writes the database rejects; they are kept for inspection, not replayed."""
+        if not ops:
+            return
+        rejected_path = f"{self.spool_path}.rejected"
+        with self._spool_lock():
+            with open(rejected_path, "a", encoding="utf-8") as rejected:
+                for op in ops:
+                    rejected.write(json.dumps(op, default=str) + "\n")
+        logger.error(f"[PERSIST] Database rejected {len(ops)} write(s); kept in {rejected_path}")
+
+    def _replay_spool(self) -> int:
+        """Moves spooled writes back into the queue and returns how many there were."""
+        if not os.path.exists(self.spool_path):
+            return 0
+        # Another worker may be replaying it right now
+        with self._spool_lock():
+            if not os.path.exists(self.spool_path):
+                return 0
+            return self._take_spool()
+
+    def _take_spool(self) -> int:
+        replay_path = f"{self.spool_path}.replay"
+        if os.path.exists(replay_path):
+            # Replacing it would lose the writes of a replay that crashed
+            if not self._stale_replay_logged:
+                logger.error(f"[PERSIST] {replay_path} was left by an interrupted replay; replay it by hand before new spooled writes can be retried")
+                self._stale_replay_logged = True
+            return 0
+        os.replace(self.spool_path, replay_path)
+        try:
+            with open(replay_path, encoding="utf-8") as spool:
+                ops = [json.loads(line) for line in spool if line.strip()]
+        except Exception as e:
+            logger.error(f"[PERSIST] Could not replay spooled writes ({e}); they are kept in {replay_path}")
+            return 0
+        # Queued only once the whole file has been read, so a bad line doesn't replay half of it
+        with self._lock:
+            for op in ops:
+                if op["op"] == "insert":
+                    self._inserts[op["table"]].extend(op["rows"])
+                else:
+                    self._updates.append({k: op[k] for k in ("table", "values", "match")})
+        os.unlink(replay_path)
+        logger.info(f"[PERSIST] Replaying {len(ops)} spooled write(s)")
+        return len(ops)
+
+
+def _stamp(row: dict) -> dict:
+    row = dict(row)
+    row.setdefault("id", new_id())
+    # Stamp creation time now; rows flushed in one statement would
+    # otherwise share a transaction timestamp and lose their order.
+    row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+    return row
+
+
+def _is_rejected(error: Exception) -> bool:
+    """
+    Whether the database rejected the write itself (PostgreSQL data,
+    constraint or schema errors, PostgREST request errors), as opposed to
+    being unreachable or overloaded.
+    """
+    code = str(getattr(error, "code", None) or "")
+    return code[:2] in ("22", "23", "42") or code[:6] in ("PGRST1", "PGRST2")
+
+
+def _group_by_columns(rows: List[dict]) -> List[List[dict]]:
+    """PostgREST bulk inserts need every row to have the same columns."""
+    groups: Dict[tuple, List[dict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return list(groups.values())
+
+
+def _execute(op: dict):
+    from app.config import supabase
+
+    table = supabase.table(op["table"])
+    with external_call("supabase", f"{op['op']}:{op['table']}"):
+        if op["op"] == "insert":
+            table.upsert(op["rows"], on_conflict="id", ignore_duplicates=True).execute()
+        else:
+            query = table.update(op["values"])
+            for column, value in op["match"].items():
+                query = query.eq(column, value)
+            query.execute()
+
+
+# "user_id:chat_id" pairs known to be owned by the user
+_owned_chats = SharedCache("chat_owner", max_entries=4096, ttl=3600)
+
+
+def remember_chat_owner(user_id: str, chat_id: str):
+    _owned_chats.set(f"{user_id}:{chat_id}", "1")
+
+
+async def ensure_chat_owner(supabase_client, chat_id: str, user_id: str) -> bool:
+    """
+    Returns whether chat_id exists and belongs to user_id.
+    Queued writes bypass RLS, so a client-supplied session ID has to be
+    checked explicitly; results are cached, and chats created through the
+    queue are remembered without a query.
+
+    Raises a 503 when the lookup itself fails: answering False would start
+    a new chat and split the user's conversation.
+    """
+    if _owned_chats.get(f"{user_id}:{chat_id}"):
+        return True
+
+    def query():
+        return supabase_client.table("chats").select("id").eq("id", chat_id).eq("user_id", user_id).limit(1).execute()
+
+    try:
+        res = await asyncio.to_thread(query)
+    except Exception as e:
+        logger.warning(f"[PERSIST] Chat ownership check failed: {e}")
+        raise HTTPException(status_code=503, detail="Could not load the chat session. Please try again.")
+    if res.data:
+        remember_chat_owner(user_id, chat_id)
+        return True
+    return False
+
+
+persistence = WriteBehindQueue(
+    spool_path=settings.persistence_spool_path,
+    flush_interval=settings.persistence_flush_interval,
+    batch_size=settings.persistence_batch_size,
+    max_retries=settings.persistence_max_retries,
+    spool_retry_interval=settings.persistence_spool_retry_interval
+)
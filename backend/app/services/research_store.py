@@ -0,0 +1,98 @@
+import base64
+import hashlib
+import json
+import logging
+import zlib
+from typing import Optional
+from app.services.cache import TTLCache
+from app.services.persistence_service import persistence
+
+logger = logging.getLogger(__name__)
+
+ENCODING = "zlib+base64"
+
+# Fields that differ between otherwise identical research runs
+VOLATILE_FIELDS = ("timestamp", "scan_id")
+
+
+class ResearchStore:
+    """
+    Content-addressed storage for research payloads.
+
+    Scans used to embed the full research dump (YouTube transcripts
+    included) in ``analysis_result``, duplicating it for every scan of a
+    popular tool. Payloads are now stored once in ``research_blobs``,
+    compressed and keyed by the sha256 of their canonical JSON, and scans
+    keep only ``research_hash``. Blobs go through the write-behind queue
+    as ``ON CONFLICT DO NOTHING`` upserts, so storing a known payload is free.
+    A hash counts as known only once its blob has been written: until
+    then every scan queues the blob again, so a blob write that failed or
+    was spooled can't leave a later scan pointing at a missing row.
+    """
+
+    def __init__(self, table_name: str = "research_blobs", max_entries: int = 4096):
+        self.table_name = table_name
+        self._known = TTLCache(max_entries=max_entries)
+        self._payloads = TTLCache(max_entries=256)
+        persistence.on_written(table_name, self._on_written)
+
+    @staticmethod
+    def canonicalize(payload: dict) -> bytes:
+        stable = {k: v for k, v in payload.items() if k not in VOLATILE_FIELDS}
+        return json.dumps(stable, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    @staticmethod
+    def encode(raw: bytes) -> str:
+        return base64.b64encode(zlib.compress(raw, 9)).decode("ascii")
+
+    @staticmethod
+    def decode(stored: str) -> dict:
+        return json.loads(zlib.decompress(base64.b64decode(stored)))
+
+    def make_row(self, payload: dict) -> dict:
+        """Builds the research_blobs row for payload (``id`` is the content hash)."""
+        raw = self.canonicalize(payload)
+        return self._row(raw, hashlib.sha256(raw).hexdigest())
+
+    def _row(self, raw: bytes, digest: str) -> dict:
+        encoded = self.encode(raw)
+        return {
+            "id": digest,
+            "encoding": ENCODING,
+            "payload": encoded,
+            "raw_size": len(raw),
+            "stored_size": len(encoded),
+        }
+
+    def put(self, payload: dict) -> str:
+        """Stores payload (a ToolResearchResponse dump) once and returns its hash."""
+        raw = self.canonicalize(payload)
+        digest = hashlib.sha256(raw).hexdigest()
+        if not self._known.get(digest):
+            # Only unseen payloads pay for compression
+            row = self._row(raw, digest)
+            persistence.insert(self.table_name, row)
+            logger.info(f"[RESEARCH] Queued blob {digest[:12]} ({row['raw_size']} -> {row['stored_size']} bytes)")
+        return digest
+
+    def _on_written(self, rows):
+        for row in rows:
+            self._known.set(row["id"], True)
+
+    def get(self, digest: str, supabase_client=None) -> Optional[dict]:
+        """Loads a research payload by hash (without the volatile fields)."""
+        payload = self._payloads.get(digest)
+        if payload is not None:
+            return payload
+
+        if supabase_client is None:
+            from app.config import supabase as supabase_client
+        res = supabase_client.table(self.table_name).select("encoding,payload").eq("id", digest).limit(1).execute()
+        if not res.data:
+            return None
+        payload = self.decode(res.data[0]["payload"])
+        self._payloads.set(digest, payload)
+        return payload
+
+
+research_store = ResearchStore()
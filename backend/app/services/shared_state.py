@@ -0,0 +1,331 @@
+"""
+State shared by every worker process: Gemini key cooldowns, daily token
+budgets, chat histories and the hot caches' second tier.
+
+Backends (SHARED_STATE_BACKEND):
+  memory  process-local; right for a single worker and the default
+  sqlite  a WAL-mode SQLite file (SHARED_STATE_PATH) shared by the
+          workers on one host
+  redis   any Redis-compatible server (SHARED_STATE_URL), shared across
+          hosts; needs the optional ``redis`` package
+Values are strings (callers serialize), keys are built with ``state_key``
+so they share the ``toolify:`` namespace, and expire after their ``ttl``
+in seconds. All calls are synchronous and short; the Redis backend falls
+back to process-local state while the server is unreachable, so an outage
+degrades coordination instead of failing requests.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.lazy import Lazy
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "toolify:"
+
+
+def state_key(*parts: str) -> str:
+    return PREFIX + ":".join(parts)
+
+
+class MemoryState:
+    """Process-local backend."""
+
+    name = "memory"
+    # Nothing to share, so SharedCache skips its second tier
+    local = True
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[object, Optional[float]]] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _live(self, key: str):
+        item = self._values.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._values[key]
+            return None
+        return value
+
+    def _put(self, key: str, value, ttl: Optional[float]):
+        self._values[key] = (value, time.monotonic() + ttl if ttl else None)
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            now = time.monotonic()
+            for stale in [k for k, (_, expires_at) in self._values.items() if expires_at is not None and expires_at <= now]:
+                del self._values[stale]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._live(key)
+            return value if isinstance(value, str) else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._lock:
+            self._put(key, value, ttl)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Adds amount to an integer counter; ttl only applies when the counter is created."""
+        with self._lock:
+            current = self._live(key)
+            if current is None:
+                self._put(key, str(amount), ttl)
+                return amount
+            total = int(current) + amount
+            self._values[key] = (str(total), self._values[key][1])
+            return total
+
+    def append(self, key: str, values: List[str], ttl: Optional[float] = None, max_len: Optional[int] = None):
+        """Appends to a list, keeping the last max_len items; ttl restarts on every append."""
+        with self._lock:
+            items = self._live(key)
+            items = (items if isinstance(items, list) else []) + list(values)
+            self._put(key, items[-max_len:] if max_len else items, ttl)
+
+    def items(self, key: str) -> List[str]:
+        with self._lock:
+            items = self._live(key)
+            return list(items) if isinstance(items, list) else []
+
+
+class SQLiteState:
+    """
+    Backend shared by the workers on one host through a SQLite file.
+    WAL mode lets readers run alongside the single writer, and each thread
+    keeps its own connection.
+    """
+
+    name = "sqlite"
+    local = False
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS lists (key TEXT, value TEXT, expires_at REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS lists_key ON lists (key)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit; statements that must go together use explicit transactions
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl else None
+
+    def _wrote(self, conn: sqlite3.Connection):
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            now = time.time()
+            conn.execute("DELETE FROM kv WHERE expires_at <= ?", (now,))
+            conn.execute("DELETE FROM lists WHERE expires_at <= ?", (now,))
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+        ).fetchone()
+        return None if row is None else str(row[0])
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, value, self._expiry(ttl)))
+        self._wrote(conn)
+
+    def delete(self, key: str):
+        conn = self._connection()
+        conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+        conn.execute("DELETE FROM lists WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        conn = self._connection()
+        # An expired counter starts over, as if it had been evicted
+        row = conn.execute(
+            """
+            INSERT INTO kv (key, value, expires_at) VALUES (?1, ?2, ?3)
+            ON CONFLICT (key) DO UPDATE SET
+                value = CASE WHEN expires_at IS NOT NULL AND expires_at <= ?4 THEN ?2 ELSE CAST(value AS INTEGER) + ?2 END,
+                expires_at = CASE WHEN expires_at IS NOT NULL AND expires_at <= ?4 THEN ?3 ELSE expires_at END
+            RETURNING value
+            """,
+            (key, amount, self._expiry(ttl), now),
+        ).fetchone()
+        self._wrote(conn)
+        return int(row[0])
+
+    def append(self, key: str, values: List[str], ttl: Optional[float] = None, max_len: Optional[int] = None):
+        now = time.time()
+        expires_at = self._expiry(ttl)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM lists WHERE key = ? AND expires_at <= ?", (key, now))
+            conn.executemany(
+                "INSERT INTO lists (key, value, expires_at) VALUES (?, ?, ?)", [(key, value, expires_at) for value in values]
+            )
+            conn.execute("UPDATE lists SET expires_at = ? WHERE key = ?", (expires_at, key))
+            if max_len:
+                conn.execute(
+                    "DELETE FROM lists WHERE key = ?1 AND rowid NOT IN "
+                    "(SELECT rowid FROM lists WHERE key = ?1 ORDER BY rowid DESC LIMIT ?2)",
+                    (key, max_len),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._wrote(conn)
+
+    def items(self, key: str) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT value FROM lists WHERE key = ? AND (expires_at IS NULL OR expires_at > ?) ORDER BY rowid",
+            (key, time.time()),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+class RedisState:
+    """
+    Backend on a Redis-compatible server, shared across hosts. While the
+    server is unreachable, calls are served from a process-local fallback
+    and a reconnect is attempted every ``retry_interval`` seconds.
+    """
+
+    name = "redis"
+    local = False
+
+    def __init__(self, url: str, retry_interval: float = 5):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SHARED_STATE_BACKEND=redis needs the redis package: pip install redis")
+        self.client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.retry_interval = retry_interval
+        self.fallback = MemoryState()
+        self.failures = 0
+        self._down_until = 0.0
+
+    def _call(self, op: str, *args, **kwargs):
+        if time.monotonic() < self._down_until:
+            return getattr(self.fallback, op)(*args, **kwargs)
+        try:
+            return getattr(self, f"_{op}")(*args, **kwargs)
+        except Exception as e:
+            self.failures += 1
+            self._down_until = time.monotonic() + self.retry_interval
+            logger.warning(f"[STATE] Redis {op} failed, using process-local state for {self.retry_interval:g}s: {e}")
+            return getattr(self.fallback, op)(*args, **kwargs)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._call("get", key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        return self._call("set", key, value, ttl)
+
+    def delete(self, key: str):
+        return self._call("delete", key)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        return self._call("incr", key, amount, ttl)
+
+    def append(self, key: str, values: List[str], ttl: Optional[float] = None, max_len: Optional[int] = None):
+        return self._call("append", key, values, ttl, max_len)
+
+    def items(self, key: str) -> List[str]:
+        return self._call("items", key)
+
+    def _get(self, key):
+        return self.client.get(key)
+
+    def _set(self, key, value, ttl):
+        self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def _delete(self, key):
+        self.client.delete(key)
+
+    def _incr(self, key, amount, ttl):
+        total = self.client.incrby(key, amount)
+        if ttl and total == amount:
+            # Created by this call
+            self.client.pexpire(key, int(ttl * 1000))
+        return total
+
+    def _append(self, key, values, ttl, max_len):
+        pipe = self.client.pipeline()
+        pipe.rpush(key, *values)
+        if max_len:
+            pipe.ltrim(key, -max_len, -1)
+        if ttl:
+            pipe.pexpire(key, int(ttl * 1000))
+        pipe.execute()
+
+    def _items(self, key):
+        return self.client.lrange(key, 0, -1)
+
+
+class SharedCache:
+    """
+    Two-tier cache: a bounded in-process TTLCache in front of the shared
+    state, so a value computed by one worker is reused by the others while
+    hot lookups stay in memory. With the memory backend only the local
+    tier is used.
+    """
+
+    def __init__(self, namespace: str, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.local.get(key)
+        if value is None and not shared_state.local:
+            value = shared_state.get(state_key(self.namespace, key))
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: str):
+        self.local.set(key, value)
+        if not shared_state.local:
+            shared_state.set(state_key(self.namespace, key), value, ttl=self.ttl)
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+
+def create_shared_state():
+    backend = settings.shared_state_backend
+    if backend == "memory":
+        return MemoryState()
+    if backend == "sqlite":
+        return SQLiteState(settings.shared_state_path)
+    if backend == "redis":
+        return RedisState(settings.shared_state_url)
+    raise ValueError(f"Unknown SHARED_STATE_BACKEND {backend!r}; choose memory, sqlite or redis")
+
+
+shared_state = Lazy("shared_state", create_shared_state)
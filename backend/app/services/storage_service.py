@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Optional
+from app.config import settings
+from app.services.persistence_service import persistence, new_id
+from app.services.metrics import external_call
+
+logger = logging.getLogger(__name__)
+
+
+class ImageUploader:
+    """
+    Uploads scan images to Supabase Storage in the background.
+
+    The object path is computed up front so rows can reference it
+    immediately; the upload itself runs on a bounded worker pool,
+    concurrently with recognition and research or after the response.
+    Uploads are upserts, so retries are idempotent. If an upload still
+    fails after ``max_retries``, rows don't point at the missing object:
+    rows queued after the failure leave the path out (``path_if_uploaded``),
+    and rows queued before it are reconciled through the write-behind queue
+    (``clear_if_failed``).
+    """
+
+    def __init__(self, bucket_name: str = "tool-images", max_workers: int = 4, max_retries: int = 3):
+        self.bucket_name = bucket_name
+        self.max_retries = max_retries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-upload")
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.uploaded = 0
+        self.failed = 0
+
+    def make_path(self, user_id: str, filename: Optional[str]) -> str:
+        file_ext = filename.split(".")[-1] if filename and "." in filename else "jpg"
+        return f"{user_id}/{new_id()}.{file_ext}"
+
+    def public_url(self, path: str) -> str:
+        # Computed locally by the client; no network round trip
+        from app.config import supabase
+        return supabase.storage.from_(self.bucket_name).get_public_url(path)
+
+    def schedule(self, path: str, data: bytes, content_type: Optional[str]) -> Future:
+        """Starts uploading data to path and returns immediately; the future's result is whether it was uploaded."""
+        future = self._executor.submit(self._upload, path, data, content_type)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    @staticmethod
+    def path_if_uploaded(upload: Future, path: str) -> Optional[str]:
+        """path for a row being queued now, or None if its upload has already failed."""
+        if upload.done() and (upload.cancelled() or not upload.result()):
+            return None
+        return path
+
+    def clear_if_failed(self, upload: Future, path: str):
+        """
+        Clears scans.image_path and messages.image_url for path if its
+        upload fails. Called after the rows referencing path are queued, so
+        the clearing updates are queued, and applied, after their inserts.
+        """
+        def on_done(future: Future):
+            if not future.cancelled() and not future.result():
+                self._clear_references(path)
+        upload.add_done_callback(on_done)
+
+    def drain(self, timeout: Optional[float] = None):
+        """Waits for scheduled uploads to finish (graceful shutdown)."""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending, timeout=timeout)
+
+    def _discard(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def _upload(self, path: str, data: bytes, content_type: Optional[str]):
+        from app.config import supabase
+
+        started = time.perf_counter()
+        for attempt in range(self.max_retries):
+            try:
+                with external_call("supabase", "storage_upload"):
+                    supabase.storage.from_(self.bucket_name).upload(
+                        file=data,
+                        path=path,
+                        file_options={"content-type": content_type or "image/jpeg", "upsert": "true"}
+                    )
+                with self._lock:
+                    self.uploaded += 1
+                logger.info(f"[UPLOAD] {path} uploaded in {(time.perf_counter() - started) * 1000:.0f} ms")
+                return True
+            except Exception as e:
+                logger.warning(f"[UPLOAD] {path} failed (attempt {attempt + 1}/{self.max_retries}): {e}")
+                if attempt < self.max_retries - 1:
+                    time.sleep(2 ** attempt)
+
+        with self._lock:
+            self.failed += 1
+        logger.error(f"[UPLOAD] Giving up on {path}")
+        return False
+
+    def _clear_references(self, path: str):
+        logger.info(f"[UPLOAD] Clearing references to {path}")
+        persistence.update("scans", {"image_path": None}, {"image_path": path})
+        persistence.update("messages", {"image_url": None}, {"image_url": self.public_url(path)})
+
+
+image_uploader = ImageUploader(
+    max_workers=settings.storage_upload_workers,
+    max_retries=settings.storage_upload_retries
+)
@@ -1,9 +1,13 @@
-from tavily import TavilyClient
 from app.config import settings
+from app.lazy import Lazy
 from app.model.schemas import ToolResearchResponse, ResearchResult, YouTubeLink
 from datetime import datetime
 from typing import Optional
 import re
+import requests
+from app.services.cancellation import checkpoint
+from app.services.deadline import Deadline
+from app.services.metrics import external_call, stage
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import (
     TranscriptsDisabled,
@@ -14,37 +18,45 @@ from youtube_transcript_api._errors import (
 
 class TavilyService:
     def __init__(self):
-        self.client = TavilyClient(api_key=settings.tavily_api_key)
+        from tavily import TavilyClient
+
+        self.client = TavilyClient(api_key=settings.tavily_api_key, api_base_url=settings.tavily_api_url)
     
-    def search_tool_info(self, query: str, max_results: int):
+    def search_tool_info(self, query: str, max_results: int, timeout: float = 60):
+        checkpoint("tavily", "search")
         try:
-            response = self.client.search(
-                query=f"{query} tool usage guide tutorial",
-                search_depth="advanced",
-                max_results=max_results,
-                include_domains=[
-                    "wikihow.com",
-                    "instructables.com",
-                    "wikipedia.org",
-                    "homedepot.com",
-                    "lowes.com",
-                    "toolguyd.com",
-                    "familyhandyman.com",
-                    "thisoldhouse.com"
-                ]
-            )
+            with external_call("tavily", "search"):
+                response = self.client.search(
+                    query=f"{query} tool usage guide tutorial",
+                    search_depth="advanced",
+                    max_results=max_results,
+                    timeout=timeout,
+                    include_domains=[
+                        "wikihow.com",
+                        "instructables.com",
+                        "wikipedia.org",
+                        "homedepot.com",
+                        "lowes.com",
+                        "toolguyd.com",
+                        "familyhandyman.com",
+                        "thisoldhouse.com"
+                    ]
+                )
             return response
         except Exception as e:
             raise Exception(f"Tool search error: {str(e)}")
     
-    def search_youtube_tutorials(self, query: str, max_results: int):
+    def search_youtube_tutorials(self, query: str, max_results: int, timeout: float = 60):
+        checkpoint("tavily", "youtube_search")
         try:
-            response = self.client.search(
-                query=f"{query} how to use tutorial",
-                search_depth="advanced",
-                max_results=max_results,
-                include_domains=["youtube.com", "youtu.be"]
-            )
+            with external_call("tavily", "youtube_search"):
+                response = self.client.search(
+                    query=f"{query} how to use tutorial",
+                    search_depth="advanced",
+                    max_results=max_results,
+                    timeout=timeout,
+                    include_domains=["youtube.com", "youtu.be"]
+                )
             return response
         except Exception as e:
             raise Exception(f"YouTube search error: {str(e)}")
@@ -74,6 +86,28 @@ class TavilyService:
         return formatted
 
 
+_VIDEO_ID_PATTERNS = (
+    # Standard watch URL: youtube.com/watch?v=VIDEO_ID
+    re.compile(r'(?:youtube\.com\/watch\?v=|youtube\.com\/watch\?.*&v=)([a-zA-Z0-9_-]{11})'),
+    # Shortened URL: youtu.be/VIDEO_ID
+    re.compile(r'youtu\.be\/([a-zA-Z0-9_-]{11})'),
+    # Embed URL: youtube.com/embed/VIDEO_ID
+    re.compile(r'youtube\.com\/embed\/([a-zA-Z0-9_-]{11})'),
+)
+
+
+class _TimeoutSession(requests.Session):
+    """Session that gives every request a default timeout (youtube_transcript_api sets none)."""
+
+    def __init__(self, timeout: float):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(*args, **kwargs)
+
+
 class YoutubeTranscript:
     """Handles YouTube video ID extraction and transcript fetching."""
     
@@ -94,25 +128,20 @@ class YoutubeTranscript:
         Returns:
             Video ID if found, None otherwise
         """
-        # Pattern for standard watch URL: youtube.com/watch?v=VIDEO_ID
-        watch_pattern = r'(?:youtube\.com\/watch\?v=|youtube\.com\/watch\?.*&v=)([a-zA-Z0-9_-]{11})'
-        
-        # Pattern for shortened URL: youtu.be/VIDEO_ID
-        short_pattern = r'youtu\.be\/([a-zA-Z0-9_-]{11})'
-        
-        # Pattern for embed URL: youtube.com/embed/VIDEO_ID
-        embed_pattern = r'youtube\.com\/embed\/([a-zA-Z0-9_-]{11})'
-        
+        # Every supported format contains "youtu"; skip the regexes for other URLs
+        if "youtu" not in url:
+            return None
+
         # Try each pattern
-        for pattern in [watch_pattern, short_pattern, embed_pattern]:
-            match = re.search(pattern, url)
+        for pattern in _VIDEO_ID_PATTERNS:
+            match = pattern.search(url)
             if match:
                 return match.group(1)
         
         return None
 
     @staticmethod
-    def fetch_transcript(video_id: str, language: str = "en") -> Optional[str]:
+    def fetch_transcript(video_id: str, language: str = "en", timeout: Optional[float] = None) -> Optional[str]:
         """
         Fetches the transcript for a YouTube video.
         Uses the instance-based approach as seen in backend/test-yt.py.
@@ -120,16 +149,19 @@ class YoutubeTranscript:
         Args:
             video_id: YouTube video ID
             language: Language code for transcript (default: "en")
+            timeout: Seconds each HTTP request may take (default: no limit)
             
         Returns:
             Transcript as plain text, or None if unavailable
         """
+        checkpoint("youtube", "transcript")
         try:
             # Create API instance as in test-yt.py
-            api = YouTubeTranscriptApi()
+            api = YouTubeTranscriptApi(http_client=_TimeoutSession(timeout) if timeout else None)
             
             # Use fetch method as in test-yt.py
-            fetched_transcript = api.fetch(video_id, languages=[language])
+            with external_call("youtube", "transcript"):
+                fetched_transcript = api.fetch(video_id, languages=[language])
             
             # Convert to raw data (list of dicts with 'text', 'start', 'duration')
             transcript_data = fetched_transcript.to_raw_data()
@@ -156,7 +188,7 @@ class YoutubeTranscript:
             return None
 
 
-tavily_service = TavilyService()
+tavily_service: TavilyService = Lazy("tavily_service", TavilyService)
 youtube_transcript = YoutubeTranscript()
 
 
@@ -164,27 +196,44 @@ def perform_tool_research(
     tool_name: str,
     tool_description: Optional[str] = None,
     language: str = "en",
-    max_results: int = 5
+    max_results: int = 5,
+    deadline: Optional[Deadline] = None
 ) -> ToolResearchResponse:
     """
     Performs tool research using Tavily service.
     For YouTube videos, fetches transcripts and replaces the content field.
+    With a deadline, searches time out when it passes (a timed-out web
+    search leaves the results empty), and the YouTube search and transcripts
+    are skipped once there is no time left for them.
     """
     general_query = f"{tool_name} tool usage guide tutorial"
-    raw_results = tavily_service.search_tool_info(
-        query=general_query,
-        max_results=max_results
-    )
-    
-    youtube_query = f"{tool_name} how to use tutorial"
     try:
-        youtube_results = tavily_service.search_youtube_tutorials(
-            query=youtube_query,
-            max_results=3
+        raw_results = tavily_service.search_tool_info(
+            query=general_query,
+            max_results=max_results,
+            timeout=deadline.timeout() if deadline else 60
         )
-    except Exception as e:
-        print(f"YouTube search failed: {e}")
+    except Exception:
+        if deadline is None or not deadline.expired:
+            raise
+        # Timed out: carry on without web results rather than fail the request
+        deadline.degrade("research")
+        raw_results = {"results": []}
+    
+    youtube_query = f"{tool_name} how to use tutorial"
+    if deadline and not deadline.allows(settings.deadline_lookup_seconds):
+        deadline.degrade("youtube")
         youtube_results = {"results": []}
+    else:
+        try:
+            youtube_results = tavily_service.search_youtube_tutorials(
+                query=youtube_query,
+                max_results=3,
+                timeout=deadline.timeout() if deadline else 60
+            )
+        except Exception as e:
+            print(f"YouTube search failed: {e}")
+            youtube_results = {"results": []}
     
     formatted_general = tavily_service.format_results(raw_results)
     formatted_youtube = tavily_service.format_results(
@@ -196,26 +245,32 @@ def perform_tool_research(
     
     # Process YouTube links and fetch transcripts
     youtube_links = []
-    for r in formatted_youtube:
-        if "youtube.com" in r["url"] or "youtu.be" in r["url"]:
-            # Extract video ID from URL using YoutubeTranscript class
-            video_id = youtube_transcript.extract_video_id(r["url"])
+    with stage("youtube_transcripts"):
+        for r in formatted_youtube:
+            if "youtube.com" in r["url"] or "youtu.be" in r["url"]:
+                # Extract video ID from URL using YoutubeTranscript class
+                video_id = youtube_transcript.extract_video_id(r["url"])
             
-            # Fetch transcript if video ID was found
-            transcript_content = r['content']  # Default to Tavily's content
-            if video_id:
-                transcript = youtube_transcript.fetch_transcript(video_id, language=language)
-                if transcript:
-                    transcript_content = transcript  # Replace with transcript
+                # Fetch transcript if video ID was found
+                transcript_content = r['content']  # Default to Tavily's content
+                if video_id and deadline and not deadline.allows(settings.deadline_lookup_seconds):
+                    # Out of time: the remaining videos keep Tavily's content
+                    deadline.degrade("youtube_transcripts")
+                elif video_id:
+                    transcript = youtube_transcript.fetch_transcript(
+                        video_id, language=language, timeout=deadline.timeout() if deadline else None
+                    )
+                    if transcript:
+                        transcript_content = transcript  # Replace with transcript
             
-            youtube_links.append(
-                YouTubeLink(
-                    title=r["title"], 
-                    url=r["url"], 
-                    content=transcript_content,  # Use transcript or fallback to Tavily content
-                    score=r.get("score", 0.0)
+                youtube_links.append(
+                    YouTubeLink(
+                        title=r["title"], 
+                        url=r["url"], 
+                        content=transcript_content,  # Use transcript or fallback to Tavily content
+                        score=r.get("score", 0.0)
+                    )
                 )
-            )
     
     research_results = [
         ResearchResult(
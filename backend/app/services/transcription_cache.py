@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import threading
+from typing import Awaitable, Callable, Dict, Optional
+from app.config import settings
+from app.services.cancellation import detach
+from app.services.shared_state import SharedCache
+
+
+class TranscriptionCache:
+    """
+    Caches transcripts by a content hash of the audio bytes and MIME type.
+
+    Mobile clients re-upload the same voice blob when they lose
+    connectivity, so identical audio is answered from a bounded in-memory
+    tier, backed by the shared state, for ``ttl`` seconds. Concurrent
+    requests for the same audio in a worker share a single in-flight
+    transcription.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600):
+        self.entries = SharedCache("transcript", max_entries=max_entries, ttl=ttl)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(audio_bytes: bytes, mime_type: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(mime_type.split(';')[0].strip().encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(audio_bytes)
+        return digest.hexdigest()
+
+    def get(self, key: str, record_miss: bool = True) -> Optional[str]:
+        transcript = self.entries.get(key)
+        with self._lock:
+            if transcript is not None:
+                self.hits += 1
+            elif record_miss:
+                self.misses += 1
+        return transcript
+
+    def set(self, key: str, transcript: str):
+        # Failed transcriptions come back empty and should be retried
+        if transcript:
+            self.entries.set(key, transcript)
+
+    async def get_or_transcribe(self, key: str, transcribe: Callable[[], Awaitable[str]]) -> str:
+        """Returns the cached transcript for key, or runs transcribe once for all concurrent callers."""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, transcribe))
+            self._inflight[key] = task
+        # Shield so one caller's cancellation doesn't abort the shared work
+        return await asyncio.shield(task)
+
+    async def _run(self, key: str, transcribe: Callable[[], Awaitable[str]]) -> str:
+        # Shared by every caller, so it completes even if the one that started it goes away
+        detach()
+        try:
+            transcript = await transcribe()
+            self.set(key, transcript)
+            return transcript
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self.entries),
+            }
+
+
+transcription_cache = TranscriptionCache(
+    max_entries=settings.transcription_cache_max_entries,
+    ttl=settings.transcription_cache_ttl
+)
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import threading
+from typing import Optional
+from app.config import settings
+from app.services.shared_state import SharedCache
+from app.services.metrics import external_call
+
+logger = logging.getLogger(__name__)
+
+
+class TTSCache:
+    """
+    Content-addressed cache for synthesized speech.
+
+    Each clip is stored once in the ``tool-audio`` bucket under a path derived
+    from a hash of the cleaned text, voice and language, so repeated requests
+    for the same text return the existing public URL instead of calling
+    YarnGPT and uploading a new file. A bounded in-memory index, backed by
+    the shared state, avoids a storage round trip for hot entries; on an
+    index miss the bucket itself is checked so clips survive restarts.
+    """
+
+    def __init__(self, bucket_name: str = "tool-audio", prefix: str = "cache", max_entries: int = 2048):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        # Values are JSON [url, size]
+        self.index = SharedCache("tts", max_entries=max_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_stored = 0
+
+    @staticmethod
+    def make_key(text: str, voice: str, language: str) -> str:
+        """Returns the cache key for already-cleaned text."""
+        digest = hashlib.sha256()
+        for part in (voice, language, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def storage_path(self, key: str) -> str:
+        return f"{self.prefix}/{key[:2]}/{key}.mp3"
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Returns the public URL of a cached clip, or None on a miss."""
+        indexed = self.index.get(key)
+        entry = json.loads(indexed) if indexed is not None else self._lookup_storage(key)
+        if entry is None:
+            self._record(hit=False)
+            return None
+
+        url, size = entry
+        self._record(hit=True, size=size)
+        return url
+
+    def store(self, key: str, audio_content: bytes) -> str:
+        """Uploads a clip under its content address and returns its public URL."""
+        from app.config import supabase
+
+        path = self.storage_path(key)
+        bucket = supabase.storage.from_(self.bucket_name)
+        with external_call("supabase", "storage_upload"):
+            bucket.upload(
+                file=audio_content,
+                path=path,
+                # Two workers may synthesize the same text concurrently; the
+                # content is identical so the last writer simply wins.
+                file_options={"content-type": "audio/mp3", "upsert": "true"}
+            )
+        url = bucket.get_public_url(path)
+
+        self.index.set(key, json.dumps([url, len(audio_content)]))
+        with self._lock:
+            self.bytes_stored += len(audio_content)
+        return url
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "bytes_stored": self.bytes_stored,
+                "indexed_entries": len(self.index),
+            }
+
+    def _lookup_storage(self, key: str) -> Optional[tuple]:
+        from app.config import supabase
+
+        path = self.storage_path(key)
+        bucket = supabase.storage.from_(self.bucket_name)
+        try:
+            info = bucket.info(path)
+        except Exception:
+            # Missing objects surface as storage errors
+            return None
+
+        entry = (bucket.get_public_url(path), int(info.get("size") or 0))
+        self.index.set(key, json.dumps(entry))
+        return entry
+
+    def _record(self, hit: bool, size: int = 0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.bytes_saved += size
+            else:
+                self.misses += 1
+
+
+tts_cache = TTSCache(max_entries=settings.tts_cache_max_entries)
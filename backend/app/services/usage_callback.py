@@ -0,0 +1,29 @@
+"""
+LangChain side of Gemini usage accounting (see app.services.usage_tracker).
+Kept apart so that importing the tracker doesn't load LangChain.
+"""
+
+from langchain_core.callbacks import BaseCallbackHandler
+from app.services.usage_tracker import UsageTracker
+
+
+class UsageCallback(BaseCallbackHandler):
+    """
+    LangChain callback that records the usage of every chat model call made
+    with the LLM it is attached to. One is attached per LLM instance since
+    each instance is bound to a single API key.
+    """
+
+    # Run in the caller's context so the request and operation are known
+    run_inline = True
+
+    def __init__(self, tracker: UsageTracker, key: str):
+        self.tracker = tracker
+        self.key = key
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self.tracker.record(usage.get("input_tokens", 0), usage.get("output_tokens", 0), self.key)
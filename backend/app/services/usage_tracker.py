@@ -0,0 +1,279 @@
+import asyncio
+import contextvars
+import datetime
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+from app.config import settings
+from app.services.metrics import REGISTRY, Counter, Histogram
+from app.services.shared_state import shared_state, state_key
+
+logger = logging.getLogger(__name__)
+
+GROUPS = ("user", "route", "key", "operation")
+
+# Powers of two, so a prompt that grows noticeably lands in another bucket
+PROMPT_TOKEN_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+gemini_tokens = Counter(
+    "toolify_gemini_tokens_total", "Gemini tokens by operation, API key and direction", ("operation", "key", "direction")
+)
+gemini_prompt_tokens = Histogram(
+    "toolify_gemini_prompt_tokens", "Input tokens per Gemini call", ("operation",), buckets=PROMPT_TOKEN_BUCKETS
+)
+REGISTRY.extend([gemini_tokens, gemini_prompt_tokens])
+
+# Usage of the request being handled and the Gemini operation being run
+_request_usage: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("request_usage", default=None)
+_operation: contextvars.ContextVar[str] = contextvars.ContextVar("usage_operation", default="generate_content")
+
+
+@contextmanager
+def usage_operation(name: str):
+    """Labels the Gemini calls made inside the block: ``with usage_operation("recognition"): ...``."""
+    token = _operation.set(name)
+    try:
+        yield
+    finally:
+        _operation.reset(token)
+
+
+def current_operation() -> str:
+    return _operation.get()
+
+
+def key_label(index: int) -> str:
+    """API keys are reported by their position in GOOGLE_API_KEYS, never by value."""
+    return f"key{index}"
+
+
+class UsageTracker:
+    """
+    Accounts for Gemini tokens and their estimated cost.
+
+    Every call's usage metadata is added to running totals per user, route,
+    API key and operation, to the request that made it, and to today's
+    (UTC) total of the user, which is what budgets are checked against.
+    Requests are attributed through a context variable bound when the user
+    is authenticated. The recent prompt sizes per operation are kept so a
+    prompt that suddenly got bigger shows up in the p95. Totals are
+    per worker process and reset on restart; the daily totals behind
+    budgets live in the shared state, so every worker enforces the same
+    budget.
+    """
+
+    def __init__(
+        self,
+        input_cost_per_mtok: float,
+        output_cost_per_mtok: float,
+        daily_token_budget: int = 0,
+        budget_overrides: Optional[Dict[str, int]] = None,
+        max_recent: int = 100
+    ):
+        self.input_cost_per_mtok = input_cost_per_mtok
+        self.output_cost_per_mtok = output_cost_per_mtok
+        self.daily_token_budget = daily_token_budget
+        self.budget_overrides = budget_overrides or {}
+        self._lock = threading.Lock()
+        self._groups: Dict[str, Dict[str, dict]] = {group: {} for group in GROUPS}
+        self._totals = _empty_totals()
+        self._prompt_sizes: Dict[str, deque] = {}
+        self._recent = deque(maxlen=max_recent)
+
+    def bind(self, user_id: Optional[str], route: str) -> dict:
+        """Starts attributing Gemini usage in the current context to user_id and route."""
+        usage = {
+            "user": user_id or "anonymous",
+            "route": route,
+            "started_at": time.time(),
+            **_empty_totals(),
+        }
+        _request_usage.set(usage)
+        return usage
+
+    def current(self) -> Optional[dict]:
+        return _request_usage.get()
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens * self.input_cost_per_mtok + output_tokens * self.output_cost_per_mtok) / 1_000_000
+
+    def record(self, input_tokens: int, output_tokens: int, key: str, operation: Optional[str] = None):
+        operation = operation or current_operation()
+        usage = _request_usage.get()
+        user = usage["user"] if usage else "background"
+        route = usage["route"] if usage else "background"
+        cost = self.cost(input_tokens, output_tokens)
+
+        with self._lock:
+            targets = [
+                self._totals,
+                self._group("user", user),
+                self._group("route", route),
+                self._group("key", key),
+                self._group("operation", operation),
+            ]
+            if usage is not None:
+                targets.append(usage)
+            for totals in targets:
+                totals["calls"] += 1
+                totals["input_tokens"] += input_tokens
+                totals["output_tokens"] += output_tokens
+                totals["cost_usd"] += cost
+            if usage is not None:
+                if usage["calls"] == 1:
+                    # Only requests that used Gemini are listed
+                    self._recent.append(usage)
+            self._prompt_sizes.setdefault(operation, deque(maxlen=200)).append(input_tokens)
+
+        if usage is not None:
+            _add_daily(user, input_tokens + output_tokens)
+
+        gemini_tokens.inc(operation, key, "input", amount=input_tokens)
+        gemini_tokens.inc(operation, key, "output", amount=output_tokens)
+        gemini_prompt_tokens.observe(input_tokens, operation)
+
+    def record_genai_response(self, response, key: str):
+        """Records a google-genai response's usage_metadata; thinking tokens are billed as output."""
+        metadata = getattr(response, "usage_metadata", None)
+        if metadata is None:
+            return
+        output_tokens = (metadata.candidates_token_count or 0) + (metadata.thoughts_token_count or 0)
+        self.record(metadata.prompt_token_count or 0, output_tokens, key)
+
+    def mean_tokens(self, operation: str) -> Optional[float]:
+        """Mean tokens (input and output) per call of operation, or None if it hasn't run."""
+        with self._lock:
+            totals = self._groups["operation"].get(operation)
+            if not totals or not totals["calls"]:
+                return None
+            return (totals["input_tokens"] + totals["output_tokens"]) / totals["calls"]
+
+    def _group(self, group: str, label: str) -> dict:
+        totals = self._groups[group].get(label)
+        if totals is None:
+            totals = self._groups[group][label] = _empty_totals()
+        return totals
+
+    # --- Budgets ---
+
+    def budget_for(self, user_id: str) -> int:
+        """Daily token budget of user_id; 0 means unlimited."""
+        return self.budget_overrides.get(user_id, self.daily_token_budget)
+
+    def used_today(self, user_id: str) -> int:
+        return int(shared_state.get(_daily_key(user_id)) or 0)
+
+    def remaining(self, user_id: str) -> Optional[int]:
+        """Tokens user_id may still spend today, or None without a budget."""
+        budget = self.budget_for(user_id)
+        if not budget:
+            return None
+        return max(0, budget - self.used_today(user_id))
+
+    def over_budget(self, user_id: str) -> bool:
+        remaining = self.remaining(user_id)
+        return remaining is not None and remaining <= 0
+
+    # --- Reporting ---
+
+    def summary(self, group_by: str = "user", limit: int = 20, recent: int = 10) -> dict:
+        if group_by not in GROUPS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUPS)}")
+        with self._lock:
+            groups = sorted(self._groups[group_by].items(), key=lambda item: -item[1]["cost_usd"])
+            prompt_sizes = {name: sorted(sizes) for name, sizes in self._prompt_sizes.items()}
+            recent_requests = [_rounded(usage) for usage in list(self._recent)[-recent:]] if recent else []
+            return {
+                "totals": _rounded(self._totals),
+                "group_by": group_by,
+                "groups": {name: _rounded(totals) for name, totals in groups[:limit]},
+                "prompt_tokens": {
+                    name: {
+                        "p50": _percentile(sizes, 0.5),
+                        "p95": _percentile(sizes, 0.95),
+                        "max": sizes[-1],
+                    }
+                    for name, sizes in prompt_sizes.items() if sizes
+                },
+                "recent_requests": recent_requests,
+                "pricing_per_mtok": {"input": self.input_cost_per_mtok, "output": self.output_cost_per_mtok},
+            }
+
+    def user_summary(self, user_id: str) -> dict:
+        with self._lock:
+            totals = _rounded(self._groups["user"].get(user_id) or _empty_totals())
+        budget = self.budget_for(user_id)
+        return {
+            "totals": totals,
+            "today": {
+                "tokens": self.used_today(user_id),
+                "budget": budget or None,
+                "remaining": self.remaining(user_id),
+                "resets_in": seconds_until_reset(),
+            },
+        }
+
+
+def _empty_totals() -> dict:
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+
+
+def _rounded(totals: dict) -> dict:
+    return {**totals, "cost_usd": round(totals["cost_usd"], 6)}
+
+
+def _percentile(ordered, q: float) -> int:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _today() -> datetime.date:
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def _add_daily(user_id: str, tokens: int):
+    # Kept a day past the reset so the count survives clock skew between workers
+    key = _daily_key(user_id)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        shared_state.incr(key, tokens, ttl=2 * 86400)
+        return
+    # LangChain callbacks record inline on the event loop; the shared state
+    # (SQLite or Redis) is written from a worker thread instead
+    loop.run_in_executor(None, lambda: shared_state.incr(key, tokens, ttl=2 * 86400))
+
+
+def _daily_key(user_id: str) -> str:
+    return state_key("usage", "daily", _today().isoformat(), user_id)
+
+
+def seconds_until_reset() -> int:
+    """Seconds until daily budgets reset at midnight UTC."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(), tzinfo=datetime.timezone.utc)
+    return int((midnight - now).total_seconds()) + 1
+
+
+def _parse_budgets(value: Optional[str]) -> Dict[str, int]:
+    """Parses ``user_a:200000,user_b:0`` into per-user budget overrides."""
+    budgets = {}
+    for entry in (value or "").split(","):
+        user_id, _, tokens = entry.strip().rpartition(":")
+        if not user_id:
+            continue
+        try:
+            budgets[user_id] = int(tokens)
+        except ValueError:
+            logger.warning(f"[USAGE] Ignoring invalid budget entry: {entry.strip()}")
+    return budgets
+
+
+usage_tracker = UsageTracker(
+    input_cost_per_mtok=settings.gemini_input_cost_per_mtok,
+    output_cost_per_mtok=settings.gemini_output_cost_per_mtok,
+    daily_token_budget=settings.user_daily_token_budget,
+    budget_overrides=_parse_budgets(settings.user_token_budgets)
+)
@@ -1,9 +1,9 @@
-from google import genai
 from PIL import Image
 import io
 from typing import Optional
 from typing import Optional
 from app.config import settings, gemini_client
+from app.services.usage_tracker import usage_operation
 
 # Initialize Gemini Client
 client = gemini_client
@@ -27,10 +27,11 @@ def recognize_tools_in_image(image_bytes: bytes) -> Optional[str]:
             "Return only the specific name and type, nothing else. "
             "If no tool or object is found, return nothing"
         )
-        response = client.models.generate_content(
-            model=settings.gemini_model,
-            contents=[prompt, image]
-        )
+        with usage_operation("recognition"):
+            response = client.models.generate_content(
+                model=settings.gemini_model,
+                contents=[prompt, image]
+            )
         
         tool_name = response.text.strip()
         return tool_name if tool_name else None
@@ -51,10 +52,11 @@ def describe_image(image_bytes: bytes) -> Optional[str]:
     try:
         image = Image.open(io.BytesIO(image_bytes))
         prompt = "Describe what you see in this image in a concise but detailed way."
-        response = client.models.generate_content(
-            model=settings.gemini_model,
-            contents=[prompt, image]
-        )
+        with usage_operation("describe_image"):
+            response = client.models.generate_content(
+                model=settings.gemini_model,
+                contents=[prompt, image]
+            )
         
         description = response.text.strip()
         return description if description else None
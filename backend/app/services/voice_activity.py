@@ -0,0 +1,124 @@
+import io
+import math
+import wave
+from array import array
+from typing import List
+
+
+class VoiceActivityDetector:
+    """
+    Energy-based end-of-speech detector for 16-bit mono PCM streams.
+
+    Audio is fed in arbitrarily sized pieces and re-framed internally into
+    fixed frames. Speech starts after ``start_frames`` consecutive frames
+    above ``threshold_db`` and ends once ``end_silence_ms`` of silence
+    follows it (or the utterance reaches ``max_utterance_s``).
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = 20,
+        threshold_db: float = -40.0,
+        start_frames: int = 3,
+        end_silence_ms: int = 500,
+        pre_roll_ms: int = 200,
+        max_utterance_s: float = 30.0,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * 2
+        self.threshold = 32768 * 10 ** (threshold_db / 20)
+        self.start_frames = start_frames
+        self.end_frames = max(1, end_silence_ms // frame_ms)
+        self.pre_roll_frames = max(1, pre_roll_ms // frame_ms)
+        self.max_frames = int(max_utterance_s * 1000 / frame_ms)
+        self.reset()
+
+    def reset(self):
+        self._pending = b""
+        self._frames: List[bytes] = []
+        self._ended: List[bytes] = []
+        self._in_speech = False
+        self._voiced_run = 0
+        self._silent_run = 0
+
+    @property
+    def in_speech(self) -> bool:
+        return self._in_speech
+
+    def feed(self, pcm: bytes) -> List[str]:
+        """
+        Adds PCM audio and returns the events it triggered, in order:
+        "speech_start" and/or "speech_end".
+        """
+        events = []
+        data = self._pending + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+
+        for offset in range(0, usable, self.frame_bytes):
+            frame = data[offset:offset + self.frame_bytes]
+            voiced = self._rms(frame) >= self.threshold
+            self._frames.append(frame)
+
+            if not self._in_speech:
+                self._voiced_run = self._voiced_run + 1 if voiced else 0
+                if self._voiced_run >= self.start_frames:
+                    self._in_speech = True
+                    self._silent_run = 0
+                    events.append("speech_start")
+                else:
+                    # Keep only a short pre-roll so the first syllable isn't clipped
+                    del self._frames[:-self.pre_roll_frames]
+                continue
+
+            self._silent_run = 0 if voiced else self._silent_run + 1
+            if self._silent_run >= self.end_frames or len(self._frames) >= self.max_frames:
+                self._in_speech = False
+                self._voiced_run = 0
+                # Set aside, so the rest of this piece can't trim it to pre-roll
+                self._ended.append(self._take_frames())
+                events.append("speech_end")
+
+        return events
+
+    def end_utterance(self) -> bytes:
+        """Ends the current utterance on request (push-to-talk release) and returns it."""
+        self._in_speech = False
+        self._voiced_run = 0
+        self._frames.append(self._pending)
+        self._pending = b""
+        return self._take_frames()
+
+    def take_utterance(self) -> bytes:
+        """
+        Returns the utterance of the oldest unclaimed "speech_end" (or, with
+        none, the buffered audio) as PCM, trailing silence removed.
+        """
+        if self._ended:
+            return self._ended.pop(0)
+        return self._take_frames()
+
+    def _take_frames(self) -> bytes:
+        frames = self._frames[:len(self._frames) - self._silent_run] if self._silent_run else self._frames
+        utterance = b"".join(frames)
+        self._frames = []
+        self._silent_run = 0
+        return utterance
+
+    def to_wav(self, pcm: bytes) -> bytes:
+        """Wraps raw PCM in a WAV container for the transcription model."""
+        output = io.BytesIO()
+        with wave.open(output, "wb") as target:
+            target.setnchannels(1)
+            target.setsampwidth(2)
+            target.setframerate(self.sample_rate)
+            target.writeframes(pcm)
+        return output.getvalue()
+
+    @staticmethod
+    def _rms(frame: bytes) -> float:
+        samples = array("h", frame)
+        if not samples:
+            return 0.0
+        return math.sqrt(sum(s * s for s in samples) / len(samples))
@@ -0,0 +1,178 @@
+import asyncio
+import importlib
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from app.config import settings
+from app.lazy import lazy_status, resolve
+
+logger = logging.getLogger(__name__)
+
+
+def _build_gemini():
+    from app.config import gemini_client
+
+    # Creating a genai client imports the SDK
+    resolve(gemini_client)._get_client()
+
+
+def _build_chains():
+    from app.chains.chat_chain import _chat_chain
+    from app.chains.tool_manual_chain import tool_manual_chain
+
+    resolve(_chat_chain)
+    resolve(tool_manual_chain)
+
+
+def _build_tavily():
+    from app.services.tavily_service import tavily_service
+
+    resolve(tavily_service)
+
+
+def _build_shared_state():
+    from app.services.shared_state import shared_state, state_key
+
+    # Opens the SQLite file or the Redis connection
+    shared_state.get(state_key("warmup"))
+
+
+def _build_supabase():
+    from app.config import supabase
+
+    resolve(supabase)
+
+
+# Imports and constructors, run one after another in a worker thread
+BUILD_STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("shared_state", _build_shared_state),
+    ("gemini", _build_gemini),
+    ("chains", _build_chains),
+    ("tavily", _build_tavily),
+    ("supabase", _build_supabase),
+]
+
+
+async def _prefetch_jwks():
+    from app.services.jwks_manager import jwks_manager
+
+    await jwks_manager.refresh()
+    if not jwks_manager.kids:
+        raise RuntimeError("no signing keys loaded")
+
+
+async def _open_supabase_connection():
+    from app.config import get_supabase_http_client
+
+    if not settings.supabase_url:
+        raise RuntimeError("SUPABASE_URL is not set")
+
+    def connect():
+        # Any response will do; the point is a pooled, already-handshaken connection
+        get_supabase_http_client().head(
+            f"{settings.supabase_url}/rest/v1/",
+            headers={"apikey": settings.supabase_service_key or ""},
+        )
+
+    # Creating the pool imports httpx's transports, so that runs off the loop too
+    await asyncio.to_thread(connect)
+
+
+# Network round trips, run concurrently with the builds
+CONNECT_STEPS: List[Tuple[str, Callable]] = [
+    ("jwks", _prefetch_jwks),
+    ("supabase_connection", _open_supabase_connection),
+]
+
+
+class Warmup:
+    """
+    Builds the lazy singletons and opens upstream connections after the
+    server has started accepting traffic.
+
+    The process is live (``/health``) as soon as it serves requests; it is
+    ready (``/ready``) once the warm-up has finished, whether or not each
+    step succeeded. A failed step is only logged and reported, since the
+    same work is retried on first use. Steps that don't finish within
+    ``timeout`` seconds are reported as timed out so readiness can't hang
+    on a slow upstream.
+    """
+
+    def __init__(self, timeout: float = 20):
+        self.timeout = timeout
+        self.steps: Dict[str, dict] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def state(self) -> str:
+        if self.started_at is None:
+            return "cold"
+        return "ready" if self.finished_at is not None else "warming"
+
+    def start(self):
+        """Starts warming up in the background of the running event loop."""
+        if self._task is not None:
+            return
+        self.started_at = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # httpx imports its transports with the first client; do that off the loop
+        await asyncio.to_thread(importlib.import_module, "httpcore")
+        await asyncio.gather(
+            self._step("build", asyncio.to_thread(self._build)),
+            *(self._step(name, step()) for name, step in CONNECT_STEPS),
+        )
+        self.finished_at = time.monotonic()
+        failed = [name for name, step in self.steps.items() if step["status"] != "ok"]
+        logger.info(
+            f"[Warmup] Finished in {(self.finished_at - self.started_at) * 1000:.0f} ms"
+            + (f"; not warmed: {', '.join(failed)}" if failed else "")
+        )
+
+    def _build(self):
+        for name, build in BUILD_STEPS:
+            started = time.perf_counter()
+            try:
+                build()
+                self._record(name, started, "ok")
+            except Exception as e:
+                self._record(name, started, "failed", e)
+
+    async def _step(self, name: str, work):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(work, self.timeout)
+            self._record(name, started, "ok")
+        except asyncio.TimeoutError:
+            self._record(name, started, "timed_out")
+        except Exception as e:
+            self._record(name, started, "failed", e)
+
+    def _record(self, name: str, started: float, status: str, error: Optional[Exception] = None):
+        self.steps[name] = {"status": status, "ms": round((time.perf_counter() - started) * 1000, 1)}
+        if error is not None:
+            self.steps[name]["error"] = str(error)
+            logger.warning(f"[Warmup] {name} failed: {error}")
+
+    def status(self) -> dict:
+        return {
+            "status": self.state,
+            "elapsed_ms": round(((self.finished_at or time.monotonic()) - self.started_at) * 1000, 1) if self.started_at else None,
+            "steps": self.steps,
+            "singletons_ms": lazy_status(),
+        }
+
+
+warmup = Warmup(timeout=settings.warmup_timeout)
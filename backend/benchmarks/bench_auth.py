@@ -0,0 +1,98 @@
+"""
+Authentication cost per request, with and without the verified-claims cache.
+
+A throwaway RSA key is served as the JWKS and a single Clerk-style token is
+reused for every request, the way the frontend does it. The benchmark
+measures:
+  * verify_token calls per second;
+  * requests per second through a minimal FastAPI route that depends on
+    get_current_user, driven in-process over ASGI.
+Everything runs on one event loop, so the numbers are per core.
+
+Run from the backend directory:
+    python -m benchmarks.bench_auth [--requests 3000]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from unittest import mock
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import Depends, FastAPI
+from jwt.algorithms import RSAAlgorithm
+
+from app import dependencies
+from app.config import settings
+from app.dependencies import get_current_user, verify_token
+from app.services.jwks_manager import JWKSManager
+
+KID = "bench-key"
+
+
+def make_token(private_key) -> str:
+    claims = {"sub": "user_bench", "email": "bench@toolify.local", "exp": int(time.time()) + 3600, "iat": int(time.time())}
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": KID})
+
+
+async def make_manager(private_key) -> JWKSManager:
+    """A JWKS manager loaded from a stand-in endpoint serving private_key's public half."""
+    jwk = dict(json.loads(RSAAlgorithm.to_jwk(private_key.public_key())), kid=KID, use="sig")
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"keys": [jwk]}))
+    real_client = httpx.AsyncClient
+    manager = JWKSManager("https://bench.invalid/jwks.json")
+    with mock.patch("app.services.jwks_manager.httpx.AsyncClient", lambda **kwargs: real_client(transport=transport, **kwargs)):
+        await manager.refresh()
+    return manager
+
+
+async def verify_rate(token: str, n: int) -> float:
+    started = time.perf_counter()
+    for _ in range(n):
+        await verify_token(token)
+    return n / (time.perf_counter() - started)
+
+
+async def request_rate(token: str, n: int) -> float:
+    app = FastAPI()
+
+    @app.get("/me")
+    async def me(user=Depends(get_current_user)):
+        return {"id": user.id}
+
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await client.get("/me", headers=headers)
+        started = time.perf_counter()
+        for _ in range(n):
+            response = await client.get("/me", headers=headers)
+            assert response.status_code == 200
+        return n / (time.perf_counter() - started)
+
+
+async def main(n: int):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = make_token(private_key)
+    manager = await make_manager(private_key)
+
+    with mock.patch.object(dependencies, "jwks_manager", manager):
+        results = {}
+        for enabled in (False, True):
+            settings.auth_claims_cache_enabled = enabled
+            dependencies._verified_claims.clear()
+            results[enabled] = (await verify_rate(token, n), await request_rate(token, n))
+
+    print(f"{'claims cache':<14}{'verify_token/s':>16}{'requests/s':>14}")
+    for enabled, (verify, requests) in results.items():
+        print(f"{'on' if enabled else 'off':<14}{verify:>16,.0f}{requests:>14,.0f}")
+    print(f"speedup: verify x{results[True][0] / results[False][0]:.1f}, requests x{results[True][1] / results[False][1]:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,151 @@
+"""
+Benchmark for the transcription pipeline.
+
+Measures how much audio normalization shrinks typical voice uploads and
+how long it takes, then compares the blocking and async transcription
+paths under concurrent load with a stand-in Gemini call, so no API quota
+is used.
+
+Run from the backend directory:
+    python -m benchmarks.bench_transcription
+"""
+
+import asyncio
+import io
+import math
+import random
+import statistics
+import subprocess
+import time
+import wave
+from array import array
+from unittest import mock
+
+from app.services import audio_service as audio_module
+from app.services.audio_normalizer import get_ffmpeg_path, normalize_audio
+
+SAMPLE_RATE = 44100
+UPLINK_BYTES_PER_SECOND = 1_000_000 / 8  # 1 Mbit/s mobile uplink
+FAKE_GEMINI_LATENCY = 0.4
+
+
+def make_recording(lead_silence=2.0, speech=4.0, tail_silence=3.0) -> bytes:
+    """Stereo 44.1 kHz WAV: silence, a speech-like modulated tone, silence."""
+    rng = random.Random(7)
+    frames = array("h")
+    total = int((lead_silence + speech + tail_silence) * SAMPLE_RATE)
+    speech_start = int(lead_silence * SAMPLE_RATE)
+    speech_end = speech_start + int(speech * SAMPLE_RATE)
+    for i in range(total):
+        if speech_start <= i < speech_end:
+            t = i / SAMPLE_RATE
+            envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * t)
+            value = envelope * (0.4 * math.sin(2 * math.pi * 220 * t) + 0.2 * math.sin(2 * math.pi * 660 * t))
+            value += rng.uniform(-0.02, 0.02)
+        else:
+            value = rng.uniform(-0.001, 0.001)
+        sample = int(value * 32767)
+        frames.append(sample)
+        frames.append(sample)
+
+    output = io.BytesIO()
+    with wave.open(output, "wb") as target:
+        target.setnchannels(2)
+        target.setsampwidth(2)
+        target.setframerate(SAMPLE_RATE)
+        target.writeframes(frames.tobytes())
+    return output.getvalue()
+
+
+def encode(ffmpeg: str, wav_bytes: bytes, args: list) -> bytes:
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-loglevel", "error", "-i", "pipe:0", *args, "pipe:1"],
+        input=wav_bytes, capture_output=True, check=True,
+    )
+    return result.stdout
+
+
+def bench_normalization(samples):
+    print(f"{'format':<12}{'raw bytes':>12}{'normalized':>12}{'ratio':>8}{'p50 ms':>9}{'upload saved ms':>17}")
+    for name, mime_type, data in samples:
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            normalized, _ = normalize_audio(data, mime_type)
+            timings.append((time.perf_counter() - start) * 1000)
+        saved_ms = (len(data) - len(normalized)) / UPLINK_BYTES_PER_SECOND * 1000
+        print(
+            f"{name:<12}{len(data):>12}{len(normalized):>12}{len(normalized) / len(data):>8.2f}"
+            f"{statistics.median(timings):>9.1f}{saved_ms:>17.0f}"
+        )
+
+
+class _FakeResponse:
+    text = "turn on the drill"
+
+
+def _fake_generate_content(**kwargs):
+    time.sleep(FAKE_GEMINI_LATENCY)
+    return _FakeResponse()
+
+
+async def bench_concurrency(data: bytes, mime_type: str, concurrency: int = 8):
+    service = audio_module.audio_service
+
+    async def blocking_call():
+        # What /api/chat did before: the sync path called directly from async code
+        return service.transcribe_audio(data, mime_type)
+
+    async def run(label, factory):
+        start = time.perf_counter()
+        latencies = []
+        max_lag = 0.0
+        done = asyncio.Event()
+
+        async def ticker():
+            # Other requests on the same worker only progress when the loop is free
+            nonlocal max_lag
+            while not done.is_set():
+                t0 = time.perf_counter()
+                await asyncio.sleep(0.01)
+                max_lag = max(max_lag, time.perf_counter() - t0 - 0.01)
+
+        async def one():
+            await factory()
+            latencies.append(time.perf_counter() - start)
+
+        tick = asyncio.create_task(ticker())
+        await asyncio.sleep(0)
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+        done.set()
+        await tick
+        wall = time.perf_counter() - start
+        print(
+            f"{label:<8} wall {wall:6.2f}s  mean latency {statistics.mean(latencies):6.2f}s"
+            f"  max event-loop stall {max_lag * 1000:7.0f} ms"
+        )
+
+    with mock.patch.object(audio_module.client.models.__class__, "generate_content",
+                           lambda self, **kwargs: _fake_generate_content(**kwargs)):
+        print(f"\n{concurrency} concurrent transcriptions, stand-in Gemini latency {FAKE_GEMINI_LATENCY}s")
+        await run("sync", blocking_call)
+        await run("async", lambda: service.transcribe_audio_async(data, mime_type))
+
+
+def main():
+    wav = make_recording()
+    samples = [("wav", "audio/wav", wav)]
+    ffmpeg = get_ffmpeg_path()
+    if ffmpeg:
+        samples.append(("webm/opus", "audio/webm", encode(ffmpeg, wav, ["-c:a", "libopus", "-b:a", "128k", "-f", "webm"])))
+        samples.append(("mp3", "audio/mp3", encode(ffmpeg, wav, ["-c:a", "libmp3lame", "-b:a", "128k", "-f", "mp3"])))
+        samples.append(("m4a/aac", "audio/mp4", encode(ffmpeg, wav, ["-c:a", "aac", "-b:a", "128k", "-f", "adts"])))
+    else:
+        print("ffmpeg not found: only the WAV fallback is benchmarked\n")
+
+    bench_normalization(samples)
+    asyncio.run(bench_concurrency(samples[-1][2], samples[-1][1]))
+
+
+if __name__ == "__main__":
+    main()
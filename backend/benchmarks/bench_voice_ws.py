@@ -0,0 +1,103 @@
+"""
+Perceived turn latency of the /api/voice/ws endpoint with local stand-ins.
+
+A simulated client streams one spoken utterance in real time (20 ms PCM
+frames followed by silence). The stand-in chat model and YarnGPT calls
+sleep for configurable latencies. The perceived latency is the time from
+the end of the user's speech to the first audio frame of the reply. It
+includes the end-of-speech silence window.
+
+Run from the backend directory:
+    python -m benchmarks.bench_voice_ws [--llm 0.8] [--tts 0.3] [--turns 5]
+"""
+
+import argparse
+import json
+import math
+import statistics
+import time
+from array import array
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.main import app
+from app.chains.chat_chain import _chat_chain
+from app.dependencies import User
+from app.routes import voice as voice_routes
+from app.services.audio_service import audio_service
+
+SAMPLE_RATE = 16000
+FRAME_MS = 20
+REPLY = (
+    "Hold the drill with both hands and keep it perpendicular to the surface. "
+    "Start slowly so the bit does not wander. Increase speed once the hole is started. "
+    "Always wear eye protection."
+)
+
+
+def frame(voiced: bool, index: int) -> bytes:
+    samples = array("h", (
+        int(8000 * math.sin(2 * math.pi * 220 * (index * FRAME_MS / 1000 + n / SAMPLE_RATE))) if voiced else 0
+        for n in range(SAMPLE_RATE * FRAME_MS // 1000)
+    ))
+    return samples.tobytes()
+
+
+def run(llm_latency: float, tts_latency: float, turns: int, speech_s: float = 1.5, silence_s: float = 1.0):
+    def fake_llm(messages):
+        time.sleep(llm_latency)
+        return AIMessage(content=json.dumps({"transcript": "how do I use a drill", "language": "en", "response": REPLY}))
+
+    def fake_synthesize(text, voice=None):
+        time.sleep(tts_latency)
+        return b"\xff\xfb" + text[:16].encode()
+
+    async def fake_verify(token):
+        return User(id="bench-user", email="bench@toolify.local")
+
+    _chat_chain.llm = RunnableLambda(fake_llm)
+    latencies = []
+    with mock.patch.object(voice_routes, "verify_token", fake_verify), \
+            mock.patch.object(voice_routes, "_persist_turn", lambda *args: None), \
+            mock.patch.object(audio_service, "synthesize", fake_synthesize):
+        client = TestClient(app)
+        with client.websocket_connect("/api/voice/ws?token=bench") as ws:
+            assert ws.receive_json()["type"] == "ready"
+            for _ in range(turns):
+                speech_frames = int(speech_s * 1000 / FRAME_MS)
+                for i in range(speech_frames):
+                    ws.send_bytes(frame(True, i))
+                    time.sleep(FRAME_MS / 1000)
+                speech_ended = time.perf_counter()
+                for i in range(int(silence_s * 1000 / FRAME_MS)):
+                    ws.send_bytes(frame(False, i))
+                    time.sleep(FRAME_MS / 1000)
+
+                first_audio = None
+                segments = 0
+                while True:
+                    message = ws.receive()
+                    if message.get("bytes"):
+                        segments += 1
+                        first_audio = first_audio or time.perf_counter()
+                    elif message.get("text") and json.loads(message["text"])["type"] == "audio_end":
+                        break
+                latencies.append(first_audio - speech_ended)
+
+    print(f"stand-in latencies: chat model {llm_latency}s, TTS per chunk {tts_latency}s; {segments} audio segments per reply")
+    print(
+        f"perceived turn latency over {turns} turns: "
+        f"p50 {statistics.median(latencies) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm", type=float, default=0.8)
+    parser.add_argument("--tts", type=float, default=0.3)
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+    run(args.llm, args.tts, args.turns)
@@ -0,0 +1,167 @@
+"""
+Throughput of the production launcher (``python -m app.server``) against
+the plain startup command (``uvicorn app.main:app``), on the same traffic.
+
+Each server is started as a separate process, pointed at local stand-ins
+(see benchmarks.standins), and given the load-test mix once ``/ready``
+answers 200. The report lists startup time, resident memory, throughput,
+p50/p95/p99 latency and errors per server, and how long each took to exit
+after SIGTERM.
+
+Run from the backend directory:
+    python -m benchmarks.compare_servers [--duration 30] [--concurrency 16] [--workers 0]
+        [--mix ...] [--profile gemini=0.9,2.5,0.01,0.02] [--json results.json]
+``--workers`` sets WEB_CONCURRENCY for the launcher (0 lets it decide).
+Client, stand-ins and servers share this machine's cores, so compare the
+runs with each other rather than with production numbers.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.load_test import DEFAULT_MIX, LoadDriver, VirtualUser, parse_mix
+from benchmarks.standins import StandIns, _free_port, add_profile_argument, make_profiles, parse_profile_args
+
+SERVERS = {
+    "uvicorn": [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", "{port}"],
+    "launcher": [sys.executable, "-m", "app.server"],
+}
+
+
+def rss_mb(pid: int) -> float:
+    """Resident memory of pid and its child processes."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, StopIteration):
+            continue
+    return round(total / 1024, 1)
+
+
+def wait_ready(base_url: str, process: subprocess.Popen, timeout: float = 120) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=1).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{base_url} was not ready after {timeout:.0f}s")
+
+
+def stop(process: subprocess.Popen, timeout: float = 60) -> float:
+    started = time.perf_counter()
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    return time.perf_counter() - started
+
+
+def run_server(name: str, env: Dict[str, str], users: List[VirtualUser], args) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    command = [part.format(port=port) for part in SERVERS[name]]
+    server_env = {**env, "HOST": "127.0.0.1", "PORT": str(port), "SERVER_ACCESS_LOG": "false"}
+    if name == "launcher" and args.workers:
+        server_env["WEB_CONCURRENCY"] = str(args.workers)
+
+    process = subprocess.Popen(command, env=server_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready_s = wait_ready(base_url, process)
+        driver = LoadDriver(base_url, users, parse_mix(args.mix))
+        elapsed = asyncio.run(driver.run(args.duration, args.concurrency))
+        memory = rss_mb(process.pid)
+    finally:
+        stop_s = stop(process)
+
+    scenarios = driver.report(elapsed)
+    completed = sum(len(latencies) for latencies in driver.latencies.values())
+    all_latencies = sorted(latency for latencies in driver.latencies.values() for latency in latencies)
+    return {
+        "command": " ".join(command),
+        "ready_s": round(ready_s, 2),
+        "rss_mb": memory,
+        "throughput_rps": round(completed / elapsed, 2),
+        "p50_ms": _percentile_ms(all_latencies, 0.50),
+        "p95_ms": _percentile_ms(all_latencies, 0.95),
+        "p99_ms": _percentile_ms(all_latencies, 0.99),
+        "errors": sum(sum(row["errors"].values()) for row in scenarios.values()),
+        "stop_s": round(stop_s, 2),
+        "scenarios": scenarios,
+    }
+
+
+def _percentile_ms(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load per server")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--users", type=int, default=20, help="Virtual users (distinct tokens)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights")
+    parser.add_argument("--workers", type=int, default=0, help="WEB_CONCURRENCY for the launcher (0 lets it decide)")
+    parser.add_argument("--servers", default=",".join(SERVERS), help="Servers to compare, in order")
+    parser.add_argument("--json", help="Also write the results to this file")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    standins = StandIns(make_profiles(parse_profile_args(args.profile)))
+    standins.start()
+    users = [VirtualUser(f"user_{n}", standins.signer.sign(f"user_{n}")) for n in range(args.users)]
+    workdir = tempfile.mkdtemp()
+    env = {
+        **os.environ,
+        **standins.env(),
+        "PERSISTENCE_SPOOL_PATH": os.path.join(workdir, "spool.jsonl"),
+        "SHARED_STATE_PATH": os.path.join(workdir, "shared.sqlite3"),
+    }
+
+    results = {}
+    for name in args.servers.split(","):
+        print(f"{name}: {' '.join(SERVERS[name])}")
+        results[name] = run_server(name, env, users, args)
+    standins.stop()
+
+    print(f"\n{'server':<10}{'ready s':>9}{'RSS MB':>9}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'stop s':>8}")
+    for name, row in results.items():
+        print(
+            f"{name:<10}{row['ready_s']:>9.2f}{row['rss_mb']:>9.0f}{row['throughput_rps']:>8.2f}"
+            f"{_fmt(row['p50_ms']):>9}{_fmt(row['p95_ms']):>9}{_fmt(row['p99_ms']):>9}{row['errors']:>8}{row['stop_s']:>8.2f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"duration_s": args.duration, "concurrency": args.concurrency, "servers": results}, f, indent=2)
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Import-time budget for the API process.
+
+Runs ``python -X importtime -c "import app.main"`` in a fresh interpreter
+and reports the total import time and the packages that account for it
+(self time summed per top-level package). It also checks that the heavy SDKs the app builds on first use
+(LangChain, google-genai, Tavily) are not imported eagerly.
+
+Run from the backend directory:
+    python -m benchmarks.import_budget [--budget-ms 800] [--runs 3] [--top 15]
+Exits with status 1 if the best run is over budget or a deferred module
+was imported. Use ``--module`` to measure another entry point.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+DEFAULT_BUDGET_MS = 800
+
+# Loaded on first use (or by the background warm-up), never by importing app.main.
+# supabase itself stays: routes annotate dependencies with its Client type.
+DEFERRED = (
+    "google.genai",
+    "langchain_google_genai",
+    "langchain_core",
+    "langchain_community",
+    "tavily",
+)
+
+
+def measure(module: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """One cold-ish import of module: (wall ms, [(name, self us, cumulative us)])."""
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return float(result.stdout.strip().splitlines()[-1]), rows
+
+
+def by_package(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        totals[name.split(".")[0]] += self_us
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def deferred_imported(rows: List[Tuple[str, int, int]]) -> List[str]:
+    names = {name for name, _, _ in rows}
+    return [module for module in DEFERRED if module in names]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app.main", help="Module to import")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Allowed import time of the best run")
+    parser.add_argument("--runs", type=int, default=3, help="Imports to time; the fastest one is reported")
+    parser.add_argument("--top", type=int, default=15, help="Packages to list")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    # The first run also writes bytecode caches, so it never counts on its own
+    runs = [measure(args.module) for _ in range(max(args.runs, 1) + 1)][1:]
+    wall_ms, rows = min(runs, key=lambda run: run[0])
+    packages = by_package(rows)
+    eager = deferred_imported(rows) if args.module == "app.main" else []
+    over = wall_ms > args.budget_ms
+
+    if args.json:
+        print(json.dumps({
+            "module": args.module,
+            "import_ms": round(wall_ms, 1),
+            "budget_ms": args.budget_ms,
+            "modules": len(rows),
+            "packages_ms": {name: round(us / 1000, 1) for name, us in list(packages.items())[:args.top]},
+            "eager_deferred": eager,
+        }, indent=2))
+    else:
+        print(f"import {args.module}: {wall_ms:.0f} ms (best of {len(runs)}), {len(rows)} modules, budget {args.budget_ms:.0f} ms")
+        print(f"\n{'package':<28}{'self ms':>9}")
+        for name, us in list(packages.items())[:args.top]:
+            print(f"{name:<28}{us / 1000:>9.1f}")
+        if eager:
+            print(f"\nDEFERRED MODULES IMPORTED: {', '.join(eager)}")
+        if over:
+            print(f"\nOVER BUDGET by {wall_ms - args.budget_ms:.0f} ms")
+
+    if over or eager:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Load test of the Toolify API against local stand-ins (see benchmarks.standins).
+
+Starts the stand-in services, points the app at them, serves the app
+with uvicorn on a local port and replays a weighted mix of traffic from
+virtual users, each with its own signed Clerk token:
+  chat        text question, following up in the same chat half the time
+  chat_image  question with a photo of a tool
+  chat_voice  recorded voice question (WAV upload)
+  manual      /api/generate-manual for a named tool
+  voice_ws    one utterance over /api/voice/ws, until the reply audio ends
+It reports throughput, p50/p95/p99 latency and errors per scenario, and how
+often each stand-in injected a fault. Traffic goes over real HTTP, so
+client, server and stand-ins share this machine's cores.
+
+Run from the backend directory:
+    python -m benchmarks.load_test [--duration 30] [--concurrency 16] [--users 20]
+        [--mix chat=50,chat_image=15,chat_voice=10,manual=15,voice_ws=10]
+        [--profile gemini=0.9,2.5,0.01,0.02] [--json results.json]
+To load a separately started server (e.g. with several workers), run
+``python -m benchmarks.standins``, start the server with the environment
+it prints and pass ``--target http://host:port``.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import wave
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+from benchmarks.standins import StandIns, _free_port, add_profile_argument, make_profiles, parse_profile_args
+
+DEFAULT_MIX = "chat=50,chat_image=15,chat_voice=10,manual=15,voice_ws=10"
+SAMPLE_RATE = 16000
+QUESTIONS = [
+    "How do I change the bit on a cordless drill?",
+    "What torque setting should I use for drywall screws?",
+    "Is it safe to use an angle grinder without a guard?",
+    "How do I keep a circular saw from kicking back?",
+]
+TOOLS = ["Cordless drill", "Angle grinder", "Circular saw", "Orbital sander", "Stud finder"]
+
+
+def make_image() -> bytes:
+    from PIL import Image
+
+    output = io.BytesIO()
+    Image.new("RGB", (320, 240), (200, 160, 40)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def make_speech(seconds: float = 1.5) -> bytes:
+    """Raw 16-bit mono PCM of a speech-like modulated tone."""
+    samples = array("h", (
+        int(8000 * (0.5 + 0.5 * math.sin(2 * math.pi * 3 * n / SAMPLE_RATE)) * math.sin(2 * math.pi * 220 * n / SAMPLE_RATE))
+        for n in range(int(seconds * SAMPLE_RATE))
+    ))
+    return samples.tobytes()
+
+
+def to_wav(pcm: bytes) -> bytes:
+    output = io.BytesIO()
+    with wave.open(output, "wb") as target:
+        target.setnchannels(1)
+        target.setsampwidth(2)
+        target.setframerate(SAMPLE_RATE)
+        target.writeframes(pcm)
+    return output.getvalue()
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for entry in spec.split(","):
+        name, _, weight = entry.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class VirtualUser:
+    def __init__(self, user_id: str, token: str):
+        self.user_id = user_id
+        self.token = token
+        self.chat_id: Optional[str] = None
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+class LoadDriver:
+    def __init__(self, base_url: str, users: List[VirtualUser], mix: Dict[str, float], seed: int = 11):
+        self.base_url = base_url
+        self.users = users
+        self.scenarios = list(mix)
+        self.weights = [mix[name] for name in self.scenarios]
+        self.rng = random.Random(seed)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+        self.image = make_image()
+        self.speech = make_speech()
+        self.voice_upload = to_wav(self.speech)
+
+    async def run(self, duration: float, concurrency: int) -> float:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=120, limits=limits) as client:
+            deadline = time.perf_counter() + duration
+            started = time.perf_counter()
+            await asyncio.gather(*(self._worker(client, deadline) for _ in range(concurrency)))
+            return time.perf_counter() - started
+
+    async def _worker(self, client: httpx.AsyncClient, deadline: float):
+        while time.perf_counter() < deadline:
+            scenario = self.rng.choices(self.scenarios, self.weights)[0]
+            user = self.rng.choice(self.users)
+            started = time.perf_counter()
+            try:
+                error = await SCENARIOS[scenario](self, client, user)
+            except Exception as e:
+                error = type(e).__name__
+            if error:
+                self.errors[scenario][error] += 1
+            else:
+                self.latencies[scenario].append(time.perf_counter() - started)
+
+    # --- Scenarios: return None on success, or a short error label ---
+
+    async def chat(self, client: httpx.AsyncClient, user: VirtualUser, files=None):
+        data = {"message": self.rng.choice(QUESTIONS)}
+        if user.chat_id and self.rng.random() < 0.5:
+            data["session_id"] = user.chat_id
+        response = await client.post("/api/chat", data=data, files=files, headers=user.headers)
+        if response.status_code != 200:
+            return f"HTTP {response.status_code}"
+        user.chat_id = response.json().get("session_id") or user.chat_id
+        return None
+
+    async def chat_image(self, client, user):
+        return await self.chat(client, user, files={"file": ("tool.jpg", self.image, "image/jpeg")})
+
+    async def chat_voice(self, client, user):
+        response = await client.post(
+            "/api/chat",
+            files={"voice": ("question.wav", self.voice_upload, "audio/wav")},
+            headers=user.headers
+        )
+        return None if response.status_code == 200 else f"HTTP {response.status_code}"
+
+    async def manual(self, client, user):
+        response = await client.post(
+            "/api/generate-manual",
+            data={"tool_name": self.rng.choice(TOOLS), "language": "en"},
+            headers=user.headers
+        )
+        return None if response.status_code == 200 else f"HTTP {response.status_code}"
+
+    async def voice_ws(self, client, user):
+        url = self.base_url.replace("http", "ws", 1) + f"/api/voice/ws?token={user.token}&sample_rate={SAMPLE_RATE}"
+        frame_bytes = SAMPLE_RATE * 2 // 50
+        async with websockets.connect(url, max_size=None) as ws:
+            if json.loads(await ws.recv())["type"] != "ready":
+                return "not ready"
+            for offset in range(0, len(self.speech), frame_bytes):
+                await ws.send(self.speech[offset:offset + frame_bytes])
+            await ws.send(json.dumps({"type": "end"}))
+            while True:
+                message = await ws.recv()
+                if isinstance(message, bytes):
+                    continue
+                event = json.loads(message)
+                if event["type"] == "audio_end":
+                    return None
+                if event["type"] == "error":
+                    return "reply error"
+
+    def report(self, elapsed: float) -> dict:
+        results = {}
+        for scenario in self.scenarios:
+            latencies = sorted(self.latencies.get(scenario, []))
+            errors = sum(self.errors[scenario].values())
+            results[scenario] = {
+                "requests": len(latencies) + errors,
+                "errors": dict(self.errors[scenario]),
+                "throughput_rps": round(len(latencies) / elapsed, 2),
+                "p50_ms": _percentile_ms(latencies, 0.50),
+                "p95_ms": _percentile_ms(latencies, 0.95),
+                "p99_ms": _percentile_ms(latencies, 0.99),
+                "mean_ms": round(statistics.fmean(latencies) * 1000, 1) if latencies else None,
+            }
+        return results
+
+
+SCENARIOS = {
+    "chat": LoadDriver.chat,
+    "chat_image": LoadDriver.chat_image,
+    "chat_voice": LoadDriver.chat_voice,
+    "manual": LoadDriver.manual,
+    "voice_ws": LoadDriver.voice_ws,
+}
+
+
+def _percentile_ms(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+
+def serve_app(port: int):
+    """Imports the app (after the environment points at the stand-ins) and serves it from a thread."""
+    import uvicorn
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, name="toolify", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def print_report(results: dict, elapsed: float, standins: StandIns):
+    completed = sum(row["requests"] - sum(row["errors"].values()) for row in results.values())
+    print(f"\n{'scenario':<12}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for scenario, row in results.items():
+        print(
+            f"{scenario:<12}{row['requests']:>9}{sum(row['errors'].values()):>8}{row['throughput_rps']:>8.2f}"
+            f"{_fmt(row['p50_ms']):>9}{_fmt(row['p95_ms']):>9}{_fmt(row['p99_ms']):>9}"
+        )
+    print(f"{'total':<12}{'':>9}{'':>8}{completed / elapsed:>8.2f}")
+    for scenario, row in results.items():
+        if row["errors"]:
+            print(f"  {scenario} errors: " + ", ".join(f"{label} x{count}" for label, count in row["errors"].items()))
+    print("\nstand-in outcomes: " + "; ".join(
+        f"{name} " + ", ".join(f"{outcome} {count}" for outcome, count in sorted(outcomes.items()))
+        for name, outcomes in standins.stats().items() if outcomes
+    ))
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--users", type=int, default=20, help="Virtual users (distinct tokens)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights")
+    parser.add_argument("--target", help="Base URL of an already running server instead of an in-process one")
+    parser.add_argument("--port", type=int, default=0, help="Stand-in port (0 picks a free one)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    standins = StandIns(make_profiles(parse_profile_args(args.profile)))
+    standins.start(args.port)
+    print(f"stand-ins on {standins.base_url}")
+    for name, profile in standins.profiles.items():
+        print(f"  {name:<9}{profile}")
+
+    users = [VirtualUser(f"user_{n}", standins.signer.sign(f"user_{n}")) for n in range(args.users)]
+
+    if args.target:
+        # The server must have been started with this run's stand-in environment
+        driver = LoadDriver(args.target.rstrip("/"), users, parse_mix(args.mix))
+        print(f"driving {driver.base_url} for {args.duration:.0f}s at concurrency {args.concurrency}")
+        elapsed = asyncio.run(driver.run(args.duration, args.concurrency))
+    else:
+        os.environ.update(standins.env())
+        os.environ.setdefault("PERSISTENCE_SPOOL_PATH", os.path.join(tempfile.mkdtemp(), "spool.jsonl"))
+        port = _free_port()
+        driver = LoadDriver(f"http://127.0.0.1:{port}", users, parse_mix(args.mix))
+        with standins.patch_in_process():
+            server, thread = serve_app(port)
+            print(f"driving {driver.base_url} for {args.duration:.0f}s at concurrency {args.concurrency}")
+            elapsed = asyncio.run(driver.run(args.duration, args.concurrency))
+            server.should_exit = True
+            thread.join(timeout=30)
+
+    results = driver.report(elapsed)
+    print_report(results, elapsed, standins)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"duration_s": round(elapsed, 1), "concurrency": args.concurrency, "scenarios": results, "standins": standins.stats()}, f, indent=2)
+    standins.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+"""
+Microbenchmarks for the pure-Python code that runs on every request, with
+stored baselines and a regression gate.
+
+Cases cover TTS text cleanup, Tavily result formatting, YouTube video ID
+extraction, research serialization and storage, and Clerk token
+verification, on fixtures shaped like production data. The original
+implementations are kept here as references: ``check`` verifies the
+current code against them on the fixtures and on randomized inputs.
+
+Run from the backend directory:
+    python -m benchmarks.micro run [-k PATTERN] [--reference]
+    python -m benchmarks.micro check
+    python -m benchmarks.micro save                      # record the baseline
+    python -m benchmarks.micro compare [--threshold 0.25]
+``compare`` runs ``check`` first and exits with status 1 if any case is
+slower than its baseline by more than the threshold, in every one of
+several re-timings. Timings are the best of several repeats; baselines are
+machine-specific, so record them on the machine that runs the gate.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# Settings are read at import; nothing is contacted, the values only need to be well-formed
+for _name, _value in {
+    "SUPABASE_URL": "http://127.0.0.1:9/supabase",
+    "SUPABASE_SERVICE_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.bench",
+    "SUPABASE_ANON_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.bench",
+    "GOOGLE_API_KEY": "bench",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from jwt.algorithms import RSAAlgorithm
+
+from app import dependencies
+from app.config import settings
+from app.lazy import resolve
+from app.model.schemas import ResearchResult, ToolResearchResponse, YouTubeLink
+from app.services.audio_service import audio_service
+from app.services.jwks_manager import JWKSManager
+from app.services.research_store import ResearchStore
+from app.services.tavily_service import YoutubeTranscript, tavily_service as lazy_tavily_service
+from benchmarks.standins import TokenSigner
+
+# Time the formatter, not the lazy proxy in front of it
+tavily_service = resolve(lazy_tavily_service)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+
+
+# --- Reference implementations (the code before optimization) ---
+
+def reference_clean_text_for_tts(text: str) -> str:
+    text = re.sub(r'[\*_]{1,3}', '', text)
+    text = re.sub(r'^#+\s*', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
+    text = re.sub(r'```[\w]*', '', text)
+    text = re.sub(r'`', '', text)
+    text = re.sub(r'^[\*\-]\s+', '', text, flags=re.MULTILINE)
+    text = text.replace('\\n', '\n')
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+def reference_format_results(raw_results, tool_name=None, youtube_only=False, score_threshold=0.5):
+    formatted = []
+    for result in raw_results.get("results", []):
+        score = result.get("score", 0.0)
+        title = result.get("title", "Untitled")
+        url = result.get("url", "")
+        if score >= score_threshold:
+            formatted.append({"title": title, "url": url, "content": result.get("content", ""), "score": score})
+    return formatted
+
+
+def reference_extract_video_id(url: str) -> Optional[str]:
+    watch_pattern = r'(?:youtube\.com\/watch\?v=|youtube\.com\/watch\?.*&v=)([a-zA-Z0-9_-]{11})'
+    short_pattern = r'youtu\.be\/([a-zA-Z0-9_-]{11})'
+    embed_pattern = r'youtube\.com\/embed\/([a-zA-Z0-9_-]{11})'
+    for pattern in [watch_pattern, short_pattern, embed_pattern]:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+    return None
+
+
+def reference_research_context(research: ToolResearchResponse) -> str:
+    return json.dumps(research.model_dump(mode="json"), indent=2)
+
+
+# --- Fixtures ---
+
+PARAGRAPH = (
+    "Set the clutch to a **low** number for small screws and _increase_ it for larger ones. "
+    "Let the drill do the work — pressing too hard stalls the motor and wears the bit. "
+    "See [the manufacturer's guide](https://www.example-tools.com/drills/clutch) for torque figures."
+)
+
+MANUAL_MARKDOWN = "\n\n".join(
+    ["# Cordless Drill User Manual", "## Overview\n\n" + PARAGRAPH]
+    + [
+        f"### Step {n}: {title}\n\n{PARAGRAPH}\n\n* Check the battery charge\n* Fit the right bit\n- Wear eye protection\n\n"
+        f"```text\nSpeed setting {n}\n```\n\nUse `mode {n}` for this step.\n\n\n"
+        for n, title in enumerate(["Preparation", "Fitting the bit", "Drilling", "Driving screws", "Maintenance"], 1)
+    ]
+    + ["## Safety\\n\\nNever drill into walls without checking for cables. ***Always*** unplug before servicing."]
+)
+
+CHAT_REPLY = (
+    "To change the bit, **switch the drill off** and open the chuck by turning it counter-clockwise. "
+    "Insert the new bit, then tighten the chuck by hand.\n\n* Make sure it's centred\n* Test at low speed"
+)
+
+TAVILY_RESPONSE = {
+    "query": "Cordless drill tool usage guide tutorial",
+    "results": [
+        {
+            "title": f"How to use a cordless drill, part {n}",
+            "url": f"https://www.example-tools.com/guides/cordless-drill-{n}",
+            "content": " ".join([PARAGRAPH] * 4),
+            "score": round(0.92 - n * 0.11, 2),
+            "raw_content": None,
+        }
+        for n in range(8)
+    ],
+    "response_time": 1.42,
+}
+
+VIDEO_URLS = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtube.com/watch?feature=share&v=3JZ_D3ELwOQ",
+    "https://youtu.be/9bZkp7q19f0?t=42",
+    "https://www.youtube.com/embed/kJQP7kiw5Fk",
+    "https://m.youtube.com/watch?v=OPf0YbXqDm0&list=PL1",
+    "https://www.youtube.com/shorts/abcdefghijk",
+    "https://www.example-tools.com/guides/cordless-drill",
+    "https://www.homedepot.com/c/how_to_use_a_drill",
+    "https://en.wikipedia.org/wiki/Drill",
+    "https://www.instructables.com/Drill-Basics/",
+]
+
+
+def make_research() -> ToolResearchResponse:
+    transcript = "so today we're going to look at how to set the clutch on this drill and why it matters " * 90
+    return ToolResearchResponse(
+        tool_name="Cordless drill",
+        query="Cordless drill tool usage guide tutorial",
+        research_results=[
+            ResearchResult(title=r["title"], url=r["url"], content=r["content"], score=r["score"])
+            for r in tavily_service.format_results(TAVILY_RESPONSE)
+        ],
+        youtube_info=[
+            YouTubeLink(title=f"Drill basics {n}", url=url, content=transcript, score=0.8)
+            for n, url in enumerate(VIDEO_URLS[:3])
+        ],
+        timestamp=datetime(2026, 1, 15, 9, 30, 12, 345678),
+    )
+
+
+# --- Randomized inputs for the equivalence check ---
+
+MARKDOWN_TOKENS = [
+    "word", " ", " ", "\n", "\n\n", "\n\n\n\n", "\\n", "*", "**", "***", "****", "_", "__", "#", "## ", "###",
+    "`", "```", "```python", "[link](https://x.y/z)", "[a]", "(b)", "- ", "* ", "-", "\t", "é", "—", "1.",
+]
+URL_PIECES = [
+    "https://", "www.", "m.", "youtube.com/", "youtu.be/", "watch?v=", "watch?", "&v=", "embed/", "shorts/",
+    "dQw4w9WgXcQ", "abc", "-_x", "?t=1", "&list=PL", "example.com/", "youtube", ".com", "/",
+]
+
+
+def random_markdown(rng: random.Random) -> str:
+    return "".join(rng.choice(MARKDOWN_TOKENS) for _ in range(rng.randint(0, 60)))
+
+
+def random_url(rng: random.Random) -> str:
+    return "".join(rng.choice(URL_PIECES) for _ in range(rng.randint(0, 8)))
+
+
+def random_tavily(rng: random.Random) -> dict:
+    results = []
+    for _ in range(rng.randint(0, 6)):
+        result = {}
+        for key, value in (("title", "t"), ("url", "u"), ("content", "c"), ("score", rng.choice([0.0, 0.49, 0.5, 0.51, 0.9, 1]))):
+            if rng.random() < 0.8:
+                result[key] = value
+        results.append(result)
+    return {"results": results} if rng.random() < 0.95 else {}
+
+
+def check(samples: int = 3000) -> List[str]:
+    """Compares the optimized code with the references; returns the mismatches found."""
+    failures = []
+    rng = random.Random(45)
+
+    texts = [MANUAL_MARKDOWN, CHAT_REPLY] + [random_markdown(rng) for _ in range(samples)]
+    for text in texts:
+        if audio_service.clean_text_for_tts(text) != reference_clean_text_for_tts(text):
+            failures.append(f"clean_text_for_tts differs for {text!r}")
+
+    urls = VIDEO_URLS + [random_url(rng) for _ in range(samples)]
+    for url in urls:
+        if YoutubeTranscript.extract_video_id(url) != reference_extract_video_id(url):
+            failures.append(f"extract_video_id differs for {url!r}")
+
+    for raw in [TAVILY_RESPONSE] + [random_tavily(rng) for _ in range(samples)]:
+        for threshold in (0.5, 0.0):
+            if tavily_service.format_results(raw, score_threshold=threshold) != reference_format_results(raw, score_threshold=threshold):
+                failures.append(f"format_results differs for {raw!r} (threshold {threshold})")
+
+    research = make_research()
+    context = research.model_dump_json(indent=2)
+    if json.loads(context) != json.loads(reference_research_context(research)):
+        failures.append("research context JSON differs from the reference")
+    if context != json.dumps(research.model_dump(mode="json"), indent=2, ensure_ascii=False):
+        failures.append("research context text differs from json.dumps(indent=2, ensure_ascii=False)")
+
+    store = ResearchStore()
+    payload = research.model_dump(mode="json")
+    if store.put(payload) != store.make_row(payload)["id"]:
+        failures.append("research_store.put digest differs from make_row")
+
+    return failures[:20]
+
+
+# --- Cases ---
+
+def _run_sync(coroutine):
+    """Runs a coroutine that completes without suspending, minus event-loop overhead."""
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    coroutine.close()
+    raise RuntimeError("Benchmarked coroutine suspended")
+
+
+class Case:
+    def __init__(self, name: str, fn: Callable, setup: Optional[Callable] = None, teardown: Optional[Callable] = None, reference: bool = False):
+        self.name = name
+        self.fn = fn
+        self.setup = setup
+        self.teardown = teardown
+        self.reference = reference
+
+
+def build_cases() -> List[Case]:
+    research = make_research()
+    payload = research.model_dump(mode="json")
+    store = ResearchStore()
+    # As if the blob had been flushed, so put() takes the known-hash path
+    store._on_written([store.make_row(payload)])
+
+    signer = TokenSigner()
+    manager = JWKSManager("https://bench.invalid/jwks.json")
+    manager._keys = {signer.kid: RSAAlgorithm.from_jwk(signer.jwks()["keys"][0])}
+    manager._fetched_at = time.monotonic()
+    dependencies.jwks_manager = manager
+    token = signer.sign("user_bench")
+    cache_setting = settings.auth_claims_cache_enabled
+
+    def claims_cache(enabled: bool):
+        def apply():
+            settings.auth_claims_cache_enabled = enabled
+            dependencies._verified_claims.clear()
+        return apply
+
+    def restore():
+        settings.auth_claims_cache_enabled = cache_setting
+
+    def extract_all(extract):
+        return lambda: [extract(url) for url in VIDEO_URLS]
+
+    return [
+        Case("clean_text_for_tts/manual", lambda: audio_service.clean_text_for_tts(MANUAL_MARKDOWN)),
+        Case("clean_text_for_tts/manual:reference", lambda: reference_clean_text_for_tts(MANUAL_MARKDOWN), reference=True),
+        Case("clean_text_for_tts/reply", lambda: audio_service.clean_text_for_tts(CHAT_REPLY)),
+        Case("clean_text_for_tts/reply:reference", lambda: reference_clean_text_for_tts(CHAT_REPLY), reference=True),
+        Case("format_results/general", lambda: tavily_service.format_results(TAVILY_RESPONSE)),
+        Case("format_results/general:reference", lambda: reference_format_results(TAVILY_RESPONSE), reference=True),
+        Case("extract_video_id/10_urls", extract_all(YoutubeTranscript.extract_video_id)),
+        Case("extract_video_id/10_urls:reference", extract_all(reference_extract_video_id), reference=True),
+        Case("research/model_dump", lambda: research.model_dump(mode="json")),
+        Case("research/llm_context", lambda: research.model_dump_json(indent=2)),
+        Case("research/llm_context:reference", lambda: reference_research_context(research), reference=True),
+        Case("research/store_put_known", lambda: store.put(payload)),
+        Case("research/store_put_known:reference", lambda: store.make_row(payload), reference=True),
+        Case("jwt/verify_full", lambda: _run_sync(dependencies.verify_token(token)), setup=claims_cache(False), teardown=restore),
+        Case("jwt/verify_cached", lambda: _run_sync(dependencies.verify_token(token)), setup=claims_cache(True), teardown=restore),
+    ]
+
+
+def time_case(case: Case, repeats: int = 7, min_time: float = 0.1) -> Dict[str, float]:
+    if case.setup:
+        case.setup()
+    try:
+        fn = case.fn
+        fn()
+        number = 1
+        while True:
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_time:
+                break
+            number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+        samples = [elapsed / number]
+        for _ in range(repeats - 1):
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter() - started) / number)
+    finally:
+        if case.teardown:
+            case.teardown()
+    return {"min_us": round(min(samples) * 1e6, 3), "median_us": round(statistics.median(samples) * 1e6, 3)}
+
+
+def run(pattern: Optional[str], include_reference: bool) -> Dict[str, Dict[str, float]]:
+    results = {}
+    print(f"{'case':<40}{'best us':>12}{'median us':>12}")
+    for case in build_cases():
+        if case.reference and not include_reference:
+            continue
+        if pattern and not fnmatch.fnmatch(case.name, f"*{pattern}*"):
+            continue
+        results[case.name] = time_case(case)
+        print(f"{case.name:<40}{results[case.name]['min_us']:>12.2f}{results[case.name]['median_us']:>12.2f}")
+    return results
+
+
+def machine() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor() or platform.machine()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["run", "check", "save", "compare"])
+    parser.add_argument("-k", dest="pattern", help="Only cases whose name contains this")
+    parser.add_argument("--reference", action="store_true", help="Also time the reference implementations")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before compare fails")
+    parser.add_argument("--retries", type=int, default=3, help="Re-timings of a case before it counts as a regression")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    if args.command in ("check", "compare"):
+        failures = check()
+        if failures:
+            print("Equivalence check FAILED:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print("Equivalence check passed")
+        if args.command == "check":
+            return
+
+    results = run(args.pattern, args.reference)
+
+    if args.command == "save":
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": machine(), "recorded_at": datetime.now().isoformat(timespec="seconds"), "cases": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+
+    elif args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != machine():
+            print(f"Warning: baseline recorded on {baseline.get('machine')}, this is {machine()}")
+        cases = {case.name: case for case in build_cases()}
+        regressions = []
+        print(f"\n{'case':<40}{'baseline us':>12}{'now us':>12}{'change':>9}")
+        for name, result in results.items():
+            before = baseline["cases"].get(name)
+            if before is None:
+                print(f"{name:<40}{'-':>12}{result['min_us']:>12.2f}{'new':>9}")
+                continue
+            # A regression has to reproduce: noisy neighbours slow single runs down
+            for _ in range(args.retries):
+                if result["min_us"] / before["min_us"] - 1 <= args.threshold:
+                    break
+                retry = time_case(cases[name])
+                result = min(result, retry, key=lambda timing: timing["min_us"])
+            change = result["min_us"] / before["min_us"] - 1
+            flag = "  REGRESSION" if change > args.threshold else ""
+            print(f"{name:<40}{before['min_us']:>12.2f}{result['min_us']:>12.2f}{change:>+9.0%}{flag}")
+            if flag:
+                regressions.append(name)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\nNo regressions above {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+"""
+Local stand-ins for Toolify's upstream services, so load tests spend no quota.
+
+One Starlette app serves fake versions of:
+  * Gemini generateContent / streamGenerateContent (GOOGLE_GEMINI_BASE_URL);
+  * Tavily search (TAVILY_API_URL);
+  * YarnGPT text-to-speech (YARNGPT_API_URL);
+  * Supabase PostgREST and Storage (SUPABASE_URL), backed by in-memory tables;
+  * Clerk's JWKS (CLERK_JWKS_URL), with a TokenSigner that mints tokens for it.
+YouTube transcripts are fetched by a library that cannot be pointed at
+another host, so they are faked in-process by ``patch_in_process()``.
+
+Every service has a profile: a lognormal latency given by its median and
+p95, an error rate and a rate of injected 429s. Gemini answers are picked
+from the prompt (recognition, chat JSON, voice JSON, manual, ...) and
+carry usage metadata, so the whole pipeline runs unchanged.
+
+Used by benchmarks.load_test, or run standalone to point a separately
+started server at it:
+    python -m benchmarks.standins [--port 9100] [--profile gemini=0.9,2.5,0.01,0.02]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional
+from unittest import mock
+
+import jwt
+import uvicorn
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+class ServiceProfile:
+    """Latency distribution and fault injection for one stand-in service."""
+
+    def __init__(self, median: float, p95: float, error_rate: float = 0.0, rate_limit_rate: float = 0.0, seed: Optional[int] = None):
+        self.median = median
+        self.p95 = max(p95, median)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        # p95 of a lognormal is median * exp(1.645 * sigma)
+        self.sigma = math.log(self.p95 / median) / 1.645 if median > 0 and self.p95 > median else 0.0
+        self.rng = random.Random(seed)
+        self.outcomes = Counter()
+
+    @classmethod
+    def parse(cls, spec: str, seed: Optional[int] = None) -> "ServiceProfile":
+        """Parses ``median,p95[,error_rate[,rate_limit_rate]]`` (seconds and fractions)."""
+        values = [float(value) for value in spec.split(",")]
+        if not 2 <= len(values) <= 4:
+            raise ValueError(f"Expected median,p95[,error_rate[,rate_limit_rate]], got {spec!r}")
+        return cls(*values, seed=seed)
+
+    def latency(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(self.rng.gauss(0, self.sigma))
+
+    def outcome(self) -> str:
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            result = "rate_limited"
+        elif roll < self.rate_limit_rate + self.error_rate:
+            result = "error"
+        else:
+            result = "ok"
+        self.outcomes[result] += 1
+        return result
+
+    def __repr__(self):
+        return (
+            f"median {self.median * 1000:.0f} ms, p95 {self.p95 * 1000:.0f} ms, "
+            f"errors {self.error_rate:.1%}, 429s {self.rate_limit_rate:.1%}"
+        )
+
+
+# Rough production figures for the calls Toolify makes
+DEFAULT_PROFILES = {
+    "gemini": "0.9,2.5",
+    "tavily": "1.2,3.0",
+    "yarngpt": "0.4,1.0",
+    "supabase": "0.03,0.12",
+    "clerk": "0.05,0.15",
+    "youtube": "0.3,0.9",
+}
+
+
+def make_profiles(overrides: Optional[Dict[str, str]] = None, seed: int = 7) -> Dict[str, ServiceProfile]:
+    specs = {**DEFAULT_PROFILES, **(overrides or {})}
+    unknown = set(specs) - set(DEFAULT_PROFILES)
+    if unknown:
+        raise ValueError(f"Unknown services: {', '.join(sorted(unknown))}")
+    return {name: ServiceProfile.parse(spec, seed=seed + i) for i, (name, spec) in enumerate(sorted(specs.items()))}
+
+
+class TokenSigner:
+    """An RSA key served as the stand-in JWKS, minting Clerk-style session tokens."""
+
+    kid = "standin-key"
+
+    def __init__(self):
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def jwks(self) -> dict:
+        jwk = dict(json.loads(RSAAlgorithm.to_jwk(self.private_key.public_key())), kid=self.kid, use="sig")
+        return {"keys": [jwk]}
+
+    def sign(self, user_id: str, ttl: float = 3600) -> str:
+        now = int(time.time())
+        claims = {"sub": user_id, "email": f"{user_id}@toolify.local", "iat": now, "exp": now + int(ttl)}
+        return jwt.encode(claims, self.private_key, algorithm="RS256", headers={"kid": self.kid})
+
+
+# --- Canned Gemini answers, chosen from the prompt ---
+
+TOOL_NAME = "Cordless drill"
+ANSWER = (
+    "Hold the drill with both hands and keep it perpendicular to the surface. "
+    "Start slowly so the bit does not wander, then increase speed once the hole is started. "
+    "Always wear eye protection."
+)
+MANUAL = "\n\n".join(
+    [f"# {TOOL_NAME} User Manual"]
+    + [f"## Section {n}\n\n" + " ".join([ANSWER] * 4) for n in range(1, 9)]
+)
+
+
+def gemini_reply(prompt: str) -> str:
+    if "transcript field" in prompt:
+        return json.dumps({"transcript": "How do I use a cordless drill?", "language": "en", "response": ANSWER})
+    if '"response"' in prompt:
+        return json.dumps({"language": "en", "response": ANSWER})
+    if "Transcribe the following audio" in prompt:
+        return "How do I use a cordless drill safely?"
+    if "Analyze the image" in prompt:
+        return TOOL_NAME
+    if "Describe what you see" in prompt:
+        return "A yellow cordless drill with a battery pack, lying on a workbench."
+    if "2-3 sentence summary" in prompt:
+        return f"A {TOOL_NAME.lower()} is a battery-powered tool for drilling holes and driving screws. " + ANSWER
+    if "user manual" in prompt:
+        return MANUAL
+    return ANSWER
+
+
+def _prompt_and_tokens(body: dict):
+    """Joins the request's text parts and estimates its input tokens."""
+    texts, tokens = [], 0
+    sections = list(body.get("contents", []))
+    system = body.get("systemInstruction") or body.get("system_instruction")
+    if system:
+        sections.insert(0, system)
+    for content in sections:
+        for part in content.get("parts", []):
+            data = part.get("inlineData") or part.get("inline_data")
+            if "text" in part:
+                texts.append(part["text"])
+                tokens += len(part["text"]) // 4 + 1
+            elif data:
+                # Images cost a flat 258 tokens; audio roughly 32 per second
+                mime = data.get("mimeType") or data.get("mime_type") or ""
+                tokens += 258 if mime.startswith("image/") else len(data.get("data", "")) * 3 // 4 // 1000
+    return "\n".join(texts), tokens
+
+
+class StandIns:
+    """
+    The stand-in services on one local HTTP server.
+
+    ``start()`` serves them from a background thread; ``env()`` returns
+    the environment variables that point Toolify at them, which must be
+    set before the app is imported since settings are read at import.
+    """
+
+    def __init__(self, profiles: Optional[Dict[str, ServiceProfile]] = None, signer: Optional[TokenSigner] = None):
+        self.profiles = profiles or make_profiles()
+        self.signer = signer or TokenSigner()
+        self.tables: Dict[str, Dict[str, dict]] = {}
+        self.objects: Dict[str, bytes] = {}
+        self.base_url: Optional[str] = None
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self.app = Starlette(routes=[
+            Route("/gemini/{version}/models/{action}", self._gemini, methods=["POST"]),
+            Route("/tavily/search", self._tavily, methods=["POST"]),
+            Route("/yarngpt/tts", self._yarngpt, methods=["POST"]),
+            Route("/supabase/rest/v1/{table}", self._postgrest, methods=["GET", "POST", "PATCH", "DELETE"]),
+            Route("/supabase/storage/v1/object/{path:path}", self._storage, methods=["GET", "POST", "PUT"]),
+            Route("/clerk/jwks.json", self._jwks, methods=["GET"]),
+        ])
+
+    def env(self) -> Dict[str, str]:
+        # Supabase clients only check that the keys look like JWTs
+        fake_key = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.standin"
+        return {
+            "GOOGLE_GEMINI_BASE_URL": f"{self.base_url}/gemini",
+            "GOOGLE_API_KEYS": "standin-key-0,standin-key-1,standin-key-2",
+            "TAVILY_API_URL": f"{self.base_url}/tavily",
+            "TAVILY_API_KEY": "standin",
+            "YARNGPT_API_URL": f"{self.base_url}/yarngpt/tts",
+            "YARNGPT_API_KEY": "standin",
+            "SUPABASE_URL": f"{self.base_url}/supabase",
+            "SUPABASE_SERVICE_KEY": fake_key,
+            "SUPABASE_ANON_KEY": fake_key,
+            "CLERK_JWKS_URL": f"{self.base_url}/clerk/jwks.json",
+        }
+
+    def start(self, port: int = 0) -> str:
+        port = port or _free_port()
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="standins", daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, dict]:
+        return {name: dict(profile.outcomes) for name, profile in self.profiles.items()}
+
+    @contextmanager
+    def patch_in_process(self):
+        """Fakes the services that can't be redirected by URL; use around an in-process app."""
+        profile = self.profiles["youtube"]
+
+        class FakeTranscript:
+            def to_raw_data(self):
+                return [{"text": ANSWER, "start": float(n * 5), "duration": 5.0} for n in range(40)]
+
+        class FakeTranscriptApi:
+            def __init__(self, http_client=None):
+                pass
+
+            def fetch(self, video_id, languages=None):
+                time.sleep(profile.latency())
+                if profile.outcome() != "ok":
+                    raise RuntimeError("Stand-in transcript failure")
+                return FakeTranscript()
+
+        with mock.patch("app.services.tavily_service.YouTubeTranscriptApi", FakeTranscriptApi):
+            yield
+
+    async def _delay(self, service: str) -> str:
+        profile = self.profiles[service]
+        await asyncio.sleep(profile.latency())
+        return profile.outcome()
+
+    # --- Handlers ---
+
+    async def _gemini(self, request: Request):
+        outcome = await self._delay("gemini")
+        if outcome == "rate_limited":
+            return _google_error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).")
+        if outcome == "error":
+            return _google_error(500, "INTERNAL", "An internal error has occurred.")
+
+        body = await request.json()
+        prompt, input_tokens = _prompt_and_tokens(body)
+        text = gemini_reply(prompt)
+        model = request.path_params["action"].split(":")[0]
+        output_tokens = len(text) // 4 + 1
+        payload = {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {
+                "promptTokenCount": input_tokens,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": input_tokens + output_tokens,
+            },
+            "modelVersion": model,
+        }
+        if request.path_params["action"].endswith(":streamGenerateContent"):
+            return Response(f"data: {json.dumps(payload)}\r\n\r\n", media_type="text/event-stream")
+        return JSONResponse(payload)
+
+    async def _tavily(self, request: Request):
+        outcome = await self._delay("tavily")
+        if outcome == "rate_limited":
+            return JSONResponse({"detail": {"error": "Rate limit exceeded"}}, status_code=429)
+        if outcome == "error":
+            return JSONResponse({"detail": {"error": "Internal error"}}, status_code=500)
+
+        body = await request.json()
+        youtube = "youtube.com" in (body.get("include_domains") or [])
+        results = []
+        for n in range(body.get("max_results", 5)):
+            url = (
+                f"https://www.youtube.com/watch?v={uuid.uuid4().hex[:11]}" if youtube
+                else f"https://www.example-tools.com/guides/{n}"
+            )
+            results.append({
+                "title": f"{TOOL_NAME} guide {n + 1}",
+                "url": url,
+                "content": " ".join([ANSWER] * 3),
+                "score": round(0.95 - n * 0.05, 2),
+            })
+        return JSONResponse({"query": body.get("query", ""), "results": results, "response_time": 0.5})
+
+    async def _yarngpt(self, request: Request):
+        outcome = await self._delay("yarngpt")
+        if outcome == "rate_limited":
+            return JSONResponse({"message": "Too many requests"}, status_code=429)
+        if outcome == "error":
+            return JSONResponse({"message": "Synthesis failed"}, status_code=500)
+
+        text = (await request.json()).get("text", "")
+        # About 16 KB of 128 kbit/s MP3 per second of speech, 15 characters a second
+        size = max(1024, len(text) * 1100)
+
+        async def frames():
+            sent = 0
+            while sent < size:
+                chunk = min(8192, size - sent)
+                yield b"\xff\xfb" + b"\x00" * (chunk - 2)
+                sent += chunk
+
+        return StreamingResponse(frames(), media_type="audio/mpeg")
+
+    async def _postgrest(self, request: Request):
+        outcome = await self._delay("supabase")
+        if outcome == "rate_limited":
+            return JSONResponse({"message": "Too many requests"}, status_code=429)
+        if outcome == "error":
+            return JSONResponse({"code": "XX000", "message": "Stand-in database error"}, status_code=500)
+
+        table = self.tables.setdefault(request.path_params["table"], {})
+        filters = {
+            column: value[3:] for column, value in request.query_params.items()
+            if value.startswith("eq.")
+        }
+        matched = [row for row in table.values() if all(str(row.get(c)) == v for c, v in filters.items())]
+
+        if request.method == "GET":
+            limit = int(request.query_params.get("limit", len(matched) or 1))
+            return JSONResponse(matched[:limit])
+        if request.method == "POST":
+            rows = await request.json()
+            rows = rows if isinstance(rows, list) else [rows]
+            ignore_duplicates = "ignore-duplicates" in request.headers.get("prefer", "")
+            stored = []
+            for row in rows:
+                row_id = str(row.get("id") or uuid.uuid4())
+                if ignore_duplicates and row_id in table:
+                    continue
+                table[row_id] = {**row, "id": row_id}
+                stored.append(table[row_id])
+            return JSONResponse(stored, status_code=201)
+        if request.method == "PATCH":
+            values = await request.json()
+            for row in matched:
+                row.update(values)
+            return JSONResponse(matched)
+        for row in matched:
+            table.pop(str(row.get("id")), None)
+        return JSONResponse(matched)
+
+    async def _storage(self, request: Request):
+        outcome = await self._delay("supabase")
+        if outcome != "ok":
+            return JSONResponse({"statusCode": "500", "error": "Stand-in storage error"}, status_code=500)
+
+        path = request.path_params["path"]
+        if request.method == "GET":
+            data = self.objects.get(path.removeprefix("public/"))
+            return Response(data, media_type="application/octet-stream") if data is not None else JSONResponse({"error": "not_found"}, status_code=404)
+        self.objects[path] = await request.body()
+        return JSONResponse({"Key": path, "Id": str(uuid.uuid4())})
+
+    async def _jwks(self, request: Request):
+        outcome = await self._delay("clerk")
+        if outcome != "ok":
+            return JSONResponse({"errors": [{"message": "Stand-in JWKS error"}]}, status_code=503)
+        return JSONResponse(self.signer.jwks())
+
+
+def _google_error(code: int, status: str, message: str) -> JSONResponse:
+    return JSONResponse({"error": {"code": code, "message": message, "status": status}}, status_code=code)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_profile_args(values) -> Dict[str, str]:
+    """``["gemini=0.9,2.5,0.01,0.02", ...]`` -> {"gemini": "0.9,2.5,0.01,0.02"}"""
+    overrides = {}
+    for value in values or []:
+        name, _, spec = value.partition("=")
+        overrides[name.strip()] = spec
+    return overrides
+
+
+def add_profile_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--profile", action="append", metavar="SERVICE=MEDIAN,P95[,ERRORS[,429S]]",
+        help=f"Latency (seconds) and fault rates of a stand-in; services: {', '.join(DEFAULT_PROFILES)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9100)
+    add_profile_argument(parser)
+    parser.add_argument("--users", type=int, default=5, help="Number of test tokens to print")
+    args = parser.parse_args()
+
+    standins = StandIns(make_profiles(parse_profile_args(args.profile)))
+    standins.start(args.port)
+    print(f"Stand-ins listening on {standins.base_url}")
+    for name, profile in standins.profiles.items():
+        print(f"  {name:<9}{profile}")
+    print("\nStart the server with:")
+    for name, value in standins.env().items():
+        print(f"export {name}={value}")
+    print("\nTest tokens:")
+    for n in range(args.users):
+        print(f"user_{n}: {standins.signer.sign(f'user_{n}', ttl=24 * 3600)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        standins.stop()
@@ -0,0 +1,36 @@
+-- Deduplicated research payloads.
+--
+-- Research dumps are stored once in research_blobs, keyed by the sha256 of
+-- their canonical JSON (timestamp and scan_id excluded), as zlib-compressed,
+-- base64-encoded text. Scans reference them through research_hash.
+--
+-- Rollout:
+--   1. Apply this file (Supabase SQL editor or psql).
+--   2. Deploy the backend; new scans write research_hash only.
+--   3. Backfill existing rows from the backend directory:
+--        python -m migrations.backfill_research_blobs
+--   4. Once verified, reclaim the space:
+--        python -m migrations.backfill_research_blobs --clear
+--        VACUUM (FULL, ANALYZE) scans;
+
+create table if not exists research_blobs (
+    id text primary key,                      -- sha256 of the canonical payload
+    encoding text not null default 'zlib+base64',
+    payload text not null,
+    raw_size integer,
+    stored_size integer,
+    created_at timestamptz not null default now()
+);
+
+alter table research_blobs enable row level security;
+
+-- Blobs hold public web research only; anyone signed in may read them.
+-- Writes go through the service role.
+drop policy if exists "research_blobs readable" on research_blobs;
+create policy "research_blobs readable" on research_blobs
+    for select to authenticated using (true);
+
+alter table scans add column if not exists research_hash text references research_blobs (id);
+alter table scans alter column analysis_result drop not null;
+
+create index if not exists scans_research_hash_idx on scans (research_hash);
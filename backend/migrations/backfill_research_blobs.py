@@ -0,0 +1,105 @@
+"""
+Moves research payloads embedded in scans.analysis_result into
+research_blobs (see 001_research_blobs.sql).
+
+Scans are processed in pages keyed by id. Each distinct payload is stored
+once and every scan gets its research_hash. The script can be re-run
+safely: blob inserts ignore duplicates and already migrated scans are
+skipped.
+
+Run from the backend directory:
+    python -m migrations.backfill_research_blobs [--dry-run] [--batch 200]
+    python -m migrations.backfill_research_blobs --clear
+"""
+
+import argparse
+from collections import defaultdict
+
+from app.config import supabase
+from app.services.research_store import research_store
+
+
+def backfill(batch: int, dry_run: bool):
+    last_id = None
+    scans = raw_bytes = 0
+    blobs = {}
+    while True:
+        query = (
+            supabase.table("scans")
+            .select("id,analysis_result")
+            .is_("research_hash", "null")
+            .not_.is_("analysis_result", "null")
+            .order("id")
+            .limit(batch)
+        )
+        if last_id:
+            query = query.gt("id", last_id)
+        rows = query.execute().data
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        by_hash = defaultdict(list)
+        page_blobs = {}
+        for row in rows:
+            blob = research_store.make_row(row["analysis_result"])
+            page_blobs[blob["id"]] = blob
+            by_hash[blob["id"]].append(row["id"])
+            raw_bytes += blob["raw_size"]
+        scans += len(rows)
+        blobs.update({digest: blob["stored_size"] for digest, blob in page_blobs.items()})
+
+        if not dry_run:
+            supabase.table(research_store.table_name).upsert(
+                list(page_blobs.values()), on_conflict="id", ignore_duplicates=True
+            ).execute()
+            for digest, scan_ids in by_hash.items():
+                supabase.table("scans").update({"research_hash": digest}).in_("id", scan_ids).execute()
+        print(f"{scans} scans processed, {len(blobs)} distinct payloads")
+
+    stored = sum(blobs.values())
+    print(f"{'Would move' if dry_run else 'Moved'} {scans} scans: {raw_bytes} bytes of research -> {len(blobs)} blobs, {stored} bytes stored")
+
+
+def clear(batch: int):
+    """Drops analysis_result from scans whose blob is confirmed to exist."""
+    cleared = 0
+    last_id = None
+    while True:
+        query = (
+            supabase.table("scans")
+            .select("id,research_hash")
+            .not_.is_("research_hash", "null")
+            .not_.is_("analysis_result", "null")
+            .order("id")
+            .limit(batch)
+        )
+        if last_id:
+            query = query.gt("id", last_id)
+        rows = query.execute().data
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        hashes = list({row["research_hash"] for row in rows})
+        existing = {
+            blob["id"] for blob in
+            supabase.table(research_store.table_name).select("id").in_("id", hashes).execute().data
+        }
+        scan_ids = [row["id"] for row in rows if row["research_hash"] in existing]
+        if scan_ids:
+            supabase.table("scans").update({"analysis_result": None}).in_("id", scan_ids).execute()
+        cleared += len(scan_ids)
+        print(f"{cleared} scans cleared")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--clear", action="store_true", help="Null analysis_result for migrated scans")
+    args = parser.parse_args()
+    if args.clear:
+        clear(args.batch)
+    else:
+        backfill(args.batch, args.dry_run)
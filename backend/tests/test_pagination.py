@@ -0,0 +1,61 @@
+"""Keyset pagination on (created_at, id)."""
+
+import pytest
+from fastapi import HTTPException
+
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    clamp_limit,
+    decode_cursor,
+    encode_cursor,
+    keyset_filter,
+    page_size,
+    split_page,
+)
+
+ROW = {"id": "01a1-b2", "created_at": "2026-01-02T03:04:05.123456+00:00", "title": "ignored"}
+
+
+def test_cursor_round_trips_the_key():
+    cursor = encode_cursor(ROW)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (ROW["created_at"], ROW["id"])
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", encode_cursor({"id": "x", "created_at": "y"})[:-3]])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_keyset_filter_quotes_values_and_follows_the_order():
+    cursor = encode_cursor(ROW)
+    created_at = ROW["created_at"]
+    assert keyset_filter(cursor, descending=True) == (
+        f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."01a1-b2")'
+    )
+    assert keyset_filter(cursor, descending=False).startswith(f'created_at.gt."{created_at}"')
+
+
+def test_page_size_keeps_unpaginated_clients_working():
+    assert page_size(None, None) is None
+    assert page_size(None, encode_cursor(ROW)) == DEFAULT_PAGE_SIZE
+    assert page_size(10, None) == 10
+
+
+@pytest.mark.parametrize("limit, expected", [(None, DEFAULT_PAGE_SIZE), (0, DEFAULT_PAGE_SIZE), (-5, DEFAULT_PAGE_SIZE), (1, 1), (10_000, MAX_PAGE_SIZE)])
+def test_clamp_limit(limit, expected):
+    assert clamp_limit(limit) == expected
+
+
+def test_split_page_uses_the_extra_row_as_next_page_signal():
+    rows = [{"id": str(i), "created_at": f"2026-01-0{i}"} for i in range(1, 5)]
+
+    page, cursor = split_page(rows, 3)
+    assert page == rows[:3]
+    assert decode_cursor(cursor) == (rows[2]["created_at"], rows[2]["id"])
+
+    assert split_page(rows, 4) == (rows, None)
+    assert split_page(rows, None) == (rows, None)
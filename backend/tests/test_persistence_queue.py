@@ -0,0 +1,169 @@
+"""Write-behind queue: flush order, spooling, replay and rejected rows."""
+
+import asyncio
+import json
+import os
+
+import pytest
+from postgrest.exceptions import APIError
+
+from app.services import persistence_service
+from app.services.persistence_service import WriteBehindQueue
+
+
+class FakeDatabase:
+    """Stands in for persistence_service._execute and records what it was sent."""
+
+    def __init__(self):
+        self.ops = []
+        self.down = False
+        self.rejected_ids = set()
+
+    def __call__(self, op):
+        if self.down:
+            raise ConnectionError("Supabase unreachable")
+        if op["op"] == "insert" and any(row["id"] in self.rejected_ids for row in op["rows"]):
+            raise APIError({"code": "23503", "message": "violates foreign key constraint"})
+        self.ops.append(op)
+
+    def written_ids(self, table):
+        return [row["id"] for op in self.ops if op["op"] == "insert" and op["table"] == table for row in op["rows"]]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(persistence_service, "_execute", database)
+    return database
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return WriteBehindQueue(spool_path=str(tmp_path / "spool.jsonl"), max_retries=1)
+
+
+def spooled(queue):
+    with open(queue.spool_path, encoding="utf-8") as spool:
+        return [json.loads(line) for line in spool]
+
+
+def rejected(queue):
+    with open(f"{queue.spool_path}.rejected", encoding="utf-8") as spool:
+        return [json.loads(line) for line in spool]
+
+
+def test_insert_returns_row_with_id_and_timestamp(queue):
+    row = queue.insert("messages", {"chat_id": "c1", "role": "user", "content": "hi"})
+    assert row["id"]
+    assert row["created_at"]
+    assert queue.insert("messages", {"id": "fixed", "content": "x"})["id"] == "fixed"
+
+
+def test_flush_writes_tables_in_foreign_key_order_then_updates(queue, database):
+    queue.insert("messages", {"id": "m1", "chat_id": "c1"})
+    queue.update("chats", {"scan_id": "s1"}, {"id": "c1"})
+    queue.insert("chats", {"id": "c1", "user_id": "u1"})
+    queue.insert("scans", {"id": "s1", "user_id": "u1"})
+
+    assert asyncio.run(queue.flush()) is True
+    assert [(op["op"], op["table"]) for op in database.ops] == [
+        ("insert", "scans"), ("insert", "chats"), ("insert", "messages"), ("update", "chats")
+    ]
+    assert not os.path.exists(queue.spool_path)
+
+
+def test_unavailable_database_spools_everything_in_order_and_replays_it(queue, database):
+    queue.insert("chats", {"id": "c1"})
+    queue.insert("messages", {"id": "m1"})
+    queue.update("chats", {"title": "t"}, {"id": "c1"})
+    database.down = True
+
+    assert asyncio.run(queue.flush()) is False
+    assert [(op["op"], op["table"]) for op in spooled(queue)] == [
+        ("insert", "chats"), ("insert", "messages"), ("update", "chats")
+    ]
+
+    database.down = False
+    assert queue._replay_spool() == 3
+    assert not os.path.exists(queue.spool_path)
+    assert asyncio.run(queue.flush()) is True
+    assert database.written_ids("chats") == ["c1"]
+    assert database.written_ids("messages") == ["m1"]
+    assert database.ops[-1]["op"] == "update"
+
+
+def test_rejected_row_is_set_aside_and_the_rest_is_written(queue, database):
+    for row_id in ("m1", "m2", "m3"):
+        queue.insert("messages", {"id": row_id, "chat_id": "c1"})
+    queue.insert("manuals", {"id": "x1"})
+    queue.update("chats", {"title": "t"}, {"id": "c1"})
+    database.rejected_ids = {"m2"}
+    seen = []
+    queue.on_written("messages", lambda rows: seen.extend(row["id"] for row in rows))
+
+    assert asyncio.run(queue.flush()) is True
+    assert database.written_ids("messages") == ["m1", "m3"]
+    assert database.written_ids("manuals") == ["x1"]
+    assert database.ops[-1]["op"] == "update"
+    assert seen == ["m1", "m3"]
+    assert [row["id"] for op in rejected(queue) for row in op["rows"]] == ["m2"]
+    assert not os.path.exists(queue.spool_path)
+
+
+def test_outage_while_splitting_spools_the_remaining_rows(queue, database, monkeypatch):
+    for row_id in ("m1", "m2", "m3"):
+        queue.insert("messages", {"id": row_id})
+    queue.update("chats", {"title": "t"}, {"id": "c1"})
+    database.rejected_ids = {"m1"}
+
+    def fail_from_m2(op):
+        if op["op"] == "insert" and op["rows"][0]["id"] == "m2" and len(op["rows"]) == 1:
+            database.down = True
+        database(op)
+
+    monkeypatch.setattr(persistence_service, "_execute", fail_from_m2)
+
+    assert asyncio.run(queue.flush()) is False
+    assert [row["id"] for op in rejected(queue) for row in op["rows"]] == ["m1"]
+    assert [(op["op"], [row["id"] for row in op.get("rows", [])]) for op in spooled(queue)] == [
+        ("insert", ["m2", "m3"]), ("update", [])
+    ]
+
+
+def test_rejected_writes_are_not_retried(queue, database, monkeypatch):
+    queue.max_retries = 3
+    sleeps = []
+
+    async def no_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(persistence_service.asyncio, "sleep", no_sleep)
+    queue.insert("messages", {"id": "m1"})
+    database.rejected_ids = {"m1"}
+
+    assert asyncio.run(queue.flush()) is True
+    assert sleeps == []
+
+
+def test_interrupted_replay_blocks_new_replays(queue, database):
+    queue.insert("chats", {"id": "c1"})
+    database.down = True
+    asyncio.run(queue.flush())
+    open(f"{queue.spool_path}.replay", "w").close()
+
+    assert queue._replay_spool() == 0
+    assert os.path.exists(queue.spool_path)
+
+
+def test_write_now_confirms_the_row(queue, database):
+    row = asyncio.run(queue.write_now("manuals", {"user_id": "u1"}))
+    assert database.written_ids("manuals") == [row["id"]]
+
+
+def test_write_now_queues_the_row_when_the_write_fails(queue, database):
+    database.down = True
+    assert asyncio.run(queue.write_now("manuals", {"id": "x1"})) is None
+
+    database.down = False
+    assert asyncio.run(queue.flush()) is True
+    assert database.written_ids("manuals") == ["x1"]
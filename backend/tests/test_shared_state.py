@@ -0,0 +1,76 @@
+"""Shared state backends: memory and SQLite (Redis needs a server)."""
+
+import time
+
+import pytest
+
+from app.services.shared_state import MemoryState, SQLiteState, state_key
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def state(request, tmp_path):
+    if request.param == "memory":
+        return MemoryState()
+    return SQLiteState(str(tmp_path / "state" / "shared.db"))
+
+
+def test_state_key_is_namespaced():
+    assert state_key("gemini", "cooldown", "abc") == "toolify:gemini:cooldown:abc"
+
+
+def test_get_set_delete(state):
+    assert state.get("k") is None
+    state.set("k", "v")
+    assert state.get("k") == "v"
+    state.set("k", "w")
+    assert state.get("k") == "w"
+    state.delete("k")
+    assert state.get("k") is None
+
+
+def test_values_expire_after_their_ttl(state):
+    state.set("short", "v", ttl=0.05)
+    state.set("long", "v", ttl=60)
+    time.sleep(0.1)
+    assert state.get("short") is None
+    assert state.get("long") == "v"
+
+
+def test_incr_counts_and_keeps_the_first_ttl(state):
+    assert state.incr("tokens", 5, ttl=0.2) == 5
+    assert state.incr("tokens", 7, ttl=60) == 12
+    assert state.get("tokens") == "12"
+    time.sleep(0.3)
+    # An expired counter starts over
+    assert state.incr("tokens", 3, ttl=60) == 3
+
+
+def test_append_keeps_the_last_items(state):
+    assert state.items("history") == []
+    state.append("history", ["a", "b"], ttl=60, max_len=3)
+    state.append("history", ["c", "d"], ttl=60, max_len=3)
+    assert state.items("history") == ["b", "c", "d"]
+    state.delete("history")
+    assert state.items("history") == []
+
+
+def test_append_restarts_the_ttl(state):
+    state.append("history", ["a"], ttl=0.2)
+    time.sleep(0.1)
+    state.append("history", ["b"], ttl=0.2)
+    time.sleep(0.15)
+    assert state.items("history") == ["a", "b"]
+    time.sleep(0.1)
+    assert state.items("history") == []
+
+
+def test_sqlite_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "shared.db")
+    first, second = SQLiteState(path), SQLiteState(path)
+    first.set("cooldown", "123.5", ttl=60)
+    first.incr("tokens", 10)
+    second.incr("tokens", 5)
+    second.append("history", ["x"])
+    assert second.get("cooldown") == "123.5"
+    assert first.get("tokens") == "15"
+    assert first.items("history") == ["x"]
@@ -0,0 +1,88 @@
+"""Energy-based end-of-speech detection on synthetic PCM."""
+
+import io
+import math
+import wave
+from array import array
+
+from app.services.voice_activity import VoiceActivityDetector
+
+RATE = 16000
+
+
+def tone(ms, amplitude=8000, frequency=220):
+    samples = int(RATE * ms / 1000)
+    return array("h", (int(amplitude * math.sin(2 * math.pi * frequency * i / RATE)) for i in range(samples))).tobytes()
+
+
+def silence(ms):
+    return bytes(int(RATE * ms / 1000) * 2)
+
+
+def feed_in_pieces(vad, pcm, piece_bytes):
+    events = []
+    for offset in range(0, len(pcm), piece_bytes):
+        events.extend(vad.feed(pcm[offset:offset + piece_bytes]))
+    return events
+
+
+def test_silence_and_short_clicks_are_not_speech():
+    vad = VoiceActivityDetector(sample_rate=RATE)
+    assert vad.feed(silence(1000)) == []
+    # Two voiced frames are below start_frames
+    assert vad.feed(tone(40) + silence(200)) == []
+    assert not vad.in_speech
+
+
+def test_speech_start_and_end():
+    vad = VoiceActivityDetector(sample_rate=RATE)
+    assert vad.feed(silence(100) + tone(300)) == ["speech_start"]
+    assert vad.in_speech
+    assert vad.feed(silence(300)) == []
+    assert vad.feed(silence(300)) == ["speech_end"]
+
+    utterance = vad.take_utterance()
+    # Pre-roll (200 ms of the leading silence at most) plus the speech; the trailing silence is dropped
+    assert len(tone(300)) <= len(utterance) <= len(silence(200) + tone(300))
+    # What follows is only silence kept as the next utterance's pre-roll
+    assert not any(vad.take_utterance())
+
+
+def test_audio_after_the_end_in_the_same_piece_keeps_the_utterance():
+    vad = VoiceActivityDetector(sample_rate=RATE)
+    assert vad.feed(tone(300) + silence(1000) + tone(20)) == ["speech_start", "speech_end"]
+    assert len(vad.take_utterance()) == len(tone(300))
+
+
+def test_events_do_not_depend_on_how_audio_is_chunked():
+    pcm = silence(100) + tone(400) + silence(700)
+    whole = VoiceActivityDetector(sample_rate=RATE)
+    pieces = VoiceActivityDetector(sample_rate=RATE)
+
+    assert whole.feed(pcm) == feed_in_pieces(pieces, pcm, 333) == ["speech_start", "speech_end"]
+    assert whole.take_utterance() == pieces.take_utterance()
+
+
+def test_end_utterance_returns_buffered_audio_including_partial_frame():
+    vad = VoiceActivityDetector(sample_rate=RATE)
+    vad.feed(tone(200) + tone(5))
+    utterance = vad.end_utterance()
+    assert len(utterance) == len(tone(205))
+    assert not vad.in_speech
+
+
+def test_long_utterances_are_cut_at_the_maximum():
+    vad = VoiceActivityDetector(sample_rate=RATE, max_utterance_s=1.0)
+    # Speech going on past the cut starts the next utterance
+    assert vad.feed(tone(1500)) == ["speech_start", "speech_end", "speech_start"]
+    assert len(vad.take_utterance()) == len(tone(1000))
+
+
+def test_sample_rate_sets_frame_size_and_wav_header():
+    vad = VoiceActivityDetector(sample_rate=8000)
+    assert vad.frame_bytes == 320
+
+    with wave.open(io.BytesIO(vad.to_wav(silence(10))), "rb") as wav:
+        assert wav.getframerate() == 8000
+        assert wav.getnchannels() == 1
+        assert wav.getsampwidth() == 2